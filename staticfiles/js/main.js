@@ -37,23 +37,42 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Search form enhancements
-    const searchForm = document.querySelector('.search-form');
-    if (searchForm) {
-        const searchInput = searchForm.querySelector('input[type="search"]');
-        if (searchInput) {
-            let searchTimeout;
-            searchInput.addEventListener('input', function() {
-                clearTimeout(searchTimeout);
-                searchTimeout = setTimeout(function() {
-                    // Auto-submit search after 500ms of no typing
-                    if (searchInput.value.length > 2) {
-                        searchForm.submit();
-                    }
-                }, 500);
-            });
+    // Search form enhancements: suggest completions while typing and only
+    // run the full search when the form is submitted
+    document.querySelectorAll('.search-form, #searchForm').forEach(function(searchForm) {
+        const searchInput = searchForm.querySelector('input[type="search"], input[name="query"]');
+        if (!searchInput) {
+            return;
         }
-    }
+        const suggestions = document.createElement('datalist');
+        suggestions.id = (searchForm.id || 'search') + '-suggestions';
+        searchForm.appendChild(suggestions);
+        searchInput.setAttribute('list', suggestions.id);
+        searchInput.setAttribute('autocomplete', 'off');
+
+        let searchTimeout;
+        searchInput.addEventListener('input', function() {
+            clearTimeout(searchTimeout);
+            searchTimeout = setTimeout(function() {
+                const prefix = searchInput.value.trim();
+                if (prefix.length < 2) {
+                    suggestions.innerHTML = '';
+                    return;
+                }
+                fetch('/api/search/suggest/?q=' + encodeURIComponent(prefix))
+                    .then(response => response.json())
+                    .then(data => {
+                        suggestions.innerHTML = '';
+                        (data.suggestions || []).forEach(function(suggestion) {
+                            const option = document.createElement('option');
+                            option.value = suggestion.text;
+                            suggestions.appendChild(option);
+                        });
+                    })
+                    .catch(() => {});
+            }, 150);
+        });
+    });
 
     // File upload validation
     const fileInputs = document.querySelectorAll('input[type="file"]');
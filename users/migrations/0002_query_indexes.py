@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['email'], name='user_email_idx'),
+        ),
+    ]
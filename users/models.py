@@ -9,5 +9,11 @@ class CustomUser(AbstractUser):
     user_type = models.CharField(max_length=10, choices=USER_TYPES, default='consumer')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta(AbstractUser.Meta):
+        # Registration checks email uniqueness on every sign-up
+        indexes = [
+            models.Index(fields=['email'], name='user_email_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.username} ({self.user_type})"
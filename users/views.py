@@ -1,4 +1,5 @@
 from django.shortcuts import render, redirect
+from django.conf import settings
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.admin.views.decorators import staff_member_required
@@ -11,6 +12,7 @@ from django.core.paginator import Paginator
 from django.db import models
 from django.utils import timezone
 from videos.models import Video, VideoRating, Comment
+from video_sharing.cache import get_or_compute
 
 User = get_user_model()
 
@@ -167,27 +169,35 @@ def admin_database_view(request):
     
     return render(request, 'admin_database.html', context)
 
+def _admin_stats():
+    return {
+        'users': {
+            'total': User.objects.count(),
+            'creators': User.objects.filter(user_type='creator').count(),
+            'consumers': User.objects.filter(user_type='consumer').count(),
+            'active_today': User.objects.filter(last_login__date=timezone.now().date()).count(),
+        },
+        'videos': {
+            'total': Video.objects.count(),
+            'active': Video.objects.filter(is_active=True).count(),
+            'total_views': Video.objects.aggregate(total_views=models.Sum('views'))['total_views'] or 0,
+        },
+        'engagement': {
+            'total_ratings': VideoRating.objects.count(),
+            'total_comments': Comment.objects.count(),
+            'avg_rating': VideoRating.objects.aggregate(avg=models.Avg('rating'))['avg'] or 0,
+        }
+    }
+
 @staff_member_required
 def admin_api_stats(request):
     """API endpoint for admin statistics"""
     if request.method == 'GET':
-        stats = {
-            'users': {
-                'total': User.objects.count(),
-                'creators': User.objects.filter(user_type='creator').count(),
-                'consumers': User.objects.filter(user_type='consumer').count(),
-                'active_today': User.objects.filter(last_login__date=timezone.now().date()).count(),
-            },
-            'videos': {
-                'total': Video.objects.count(),
-                'active': Video.objects.filter(is_active=True).count(),
-                'total_views': Video.objects.aggregate(total_views=models.Sum('views'))['total_views'] or 0,
-            },
-            'engagement': {
-                'total_ratings': VideoRating.objects.count(),
-                'total_comments': Comment.objects.count(),
-                'avg_rating': VideoRating.objects.aggregate(avg=models.Avg('rating'))['avg'] or 0,
-            }
-        }
+        # Full-table aggregates; cached, and recomputed by one request at a time
+        stats = get_or_compute(
+            'admin-stats',
+            _admin_stats,
+            timeout=getattr(settings, 'ADMIN_STATS_CACHE_TIMEOUT', 60),
+        )
         return JsonResponse(stats)
     return JsonResponse({'error': 'Method not allowed'}, status=405)
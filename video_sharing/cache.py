@@ -0,0 +1,198 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from django.conf import settings
+from django.core.cache import cache
+
+
+class LocalLRUCache:
+    """
+    Small thread-safe in-process cache with LRU and TTL eviction.
+
+    Used as the first tier in front of the shared Django cache: hits cost a
+    dict lookup, no network round trip or unpickling. With ``weigh``, a
+    function giving the approximate size of a value, least recently used
+    entries are also evicted while the total is over ``max_weight``.
+    """
+
+    def __init__(self, max_size=1024, timeout=60, max_weight=None, weigh=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """Return a dict of the keys that are present and not expired"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                expires, value, weight = entry
+                if expires < now:
+                    self._pop(key)
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, items):
+        expires = time.monotonic() + self.timeout
+        with self._lock:
+            for key, value in items.items():
+                if key in self._data:
+                    self._pop(key)
+                weight = self.weigh(value) if self.weigh else 0
+                self._data[key] = (expires, value, weight)
+                self.weight += weight
+            while len(self._data) > self.max_size or (
+                self.max_weight is not None and self.weight > self.max_weight and self._data
+            ):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        self.weight -= self._data.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+def generation(name):
+    """
+    Current generation of a family of cache entries.
+
+    Entries embed it in their keys, so ``bump_generation`` retires the whole
+    family at once without having to find and delete each key. Values are
+    timestamps rather than counters so an evicted generation never comes
+    back with a number that was already used.
+    """
+    return cache.get_or_set(f'generation:{name}', time.time_ns, None)
+
+
+def bump_generation(name):
+    cache.set(f'generation:{name}', time.time_ns(), None)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key within this process.
+
+    The first caller runs the function; callers arriving while it is in
+    flight wait on its future and get the same result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+single_flight = SingleFlight()
+
+
+def _store(backend, key, compute, timeout, stale_timeout):
+    started = time.monotonic()
+    value = compute()
+    entry = {
+        'value': value,
+        'expires': time.time() + timeout,
+        'delta': time.monotonic() - started,
+    }
+    backend.set(key, entry, timeout + stale_timeout)
+    return value
+
+
+def _refresh_early(entry, beta):
+    """
+    Probabilistic early expiration ("XFetch").
+
+    The closer the entry is to expiring and the longer it took to compute,
+    the likelier a reader volunteers to refresh it, so a hot key is usually
+    rebuilt by one request before it expires instead of by all of them after.
+    """
+    jitter = -entry['delta'] * beta * math.log(1.0 - random.random())
+    return time.time() + jitter >= entry['expires']
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=None, beta=1.0,
+                   lock_timeout=None, backend=None):
+    """
+    Cache-aside read of ``key`` with stampede protection.
+
+    - A fresh entry is returned as is, except that readers may refresh it
+      early with a probability that rises towards expiry.
+    - An expired entry is kept for ``stale_timeout`` more seconds. The one
+      caller that takes the key's lock recomputes it; everyone else keeps
+      being served the stale value meanwhile.
+    - On a miss, callers in this process share one computation, and
+      processes wait (up to ``lock_timeout``) for whichever one holds the
+      lock in the shared cache before computing themselves.
+    """
+    backend = backend or cache
+    if stale_timeout is None:
+        stale_timeout = getattr(settings, 'CACHE_STALE_TIMEOUT', 60)
+    if lock_timeout is None:
+        lock_timeout = getattr(settings, 'CACHE_LOCK_TIMEOUT', 30)
+    lock_key = f'{key}:lock'
+
+    entry = backend.get(key)
+    if entry is not None:
+        if not _refresh_early(entry, beta):
+            return entry['value']
+        if not backend.add(lock_key, 1, lock_timeout):
+            # Somebody else is already revalidating
+            return entry['value']
+        try:
+            return _store(backend, key, compute, timeout, stale_timeout)
+        finally:
+            backend.delete(lock_key)
+
+    def fill():
+        deadline = time.monotonic() + lock_timeout
+        while not backend.add(lock_key, 1, lock_timeout):
+            entry = backend.get(key)
+            if entry is not None:
+                return entry['value']
+            if time.monotonic() >= deadline:
+                # The lock holder is stuck or gone; compute without it
+                return _store(backend, key, compute, timeout, stale_timeout)
+            time.sleep(0.05)
+        try:
+            return _store(backend, key, compute, timeout, stale_timeout)
+        finally:
+            backend.delete(lock_key)
+
+    return single_flight.do(key, fill)
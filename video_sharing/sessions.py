@@ -0,0 +1,83 @@
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.utils import timezone
+
+KEY_PREFIX = 'video_sharing.sessions'
+
+# Seconds one request holds the right to refresh a session's expiry
+REFRESH_LOCK_TIMEOUT = 60
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    Cache-first database sessions that skip writes which change nothing.
+
+    With SESSION_SAVE_EVERY_REQUEST the session middleware saves on every
+    request just to push the expiry out, which with the db engine is a
+    ``django_session`` write per page view. Here the cache entry carries
+    the stored row's expiry next to the data, so reads need no query, and
+    ``save()`` only writes when the data changed or less than
+    SESSION_REFRESH_THRESHOLD seconds of the stored expiry are left. Of the
+    requests that find a session due for a refresh at the same time, only
+    the one that takes a short cache lock writes it.
+
+    Expiry therefore slides in steps: an idle session ends between
+    SESSION_COOKIE_AGE - SESSION_REFRESH_THRESHOLD and SESSION_COOKIE_AGE
+    seconds after its last request, instead of exactly SESSION_COOKIE_AGE.
+    """
+
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # Expiry of the stored row; None until loaded, or if there is none
+        self._expire_date = None
+
+    def load(self):
+        try:
+            cached = self._cache.get(self.cache_key)
+        except Exception:
+            # As in cached_db: some backends reject invalid keys
+            cached = None
+
+        if cached is not None:
+            data, expires = cached
+            self._expire_date = datetime.fromtimestamp(expires, dt_timezone.utc if settings.USE_TZ else None)
+            return data
+
+        s = self._get_session_from_db()
+        if s is None:
+            return {}
+        data = self.decode(s.session_data)
+        self._expire_date = s.expire_date
+        self._cache_session(data)
+        return data
+
+    def _cache_session(self, data):
+        self._cache.set(
+            self.cache_key,
+            (data, self._expire_date.timestamp()),
+            self.get_expiry_age(expiry=self._expire_date),
+        )
+
+    def create_model_instance(self, data):
+        obj = super().create_model_instance(data)
+        self._expire_date = obj.expire_date
+        return obj
+
+    def _needs_refresh(self):
+        self._get_session()
+        if self._expire_date is None:
+            return True
+        remaining = (self._expire_date - timezone.now()).total_seconds()
+        if remaining >= settings.SESSION_REFRESH_THRESHOLD:
+            return False
+        lock_key = f'{self.cache_key_prefix}:refresh:{self.session_key}'
+        return self._cache.add(lock_key, 1, REFRESH_LOCK_TIMEOUT)
+
+    def save(self, must_create=False):
+        if self.session_key is not None and not must_create and not self.modified and not self._needs_refresh():
+            return
+        super(cached_db.SessionStore, self).save(must_create)
+        self._cache_session(self._session)
@@ -62,6 +62,27 @@ DATABASES = {
     }
 }
 
+# Cache shared by all workers; point CACHE_BACKEND/CACHE_LOCATION at Redis or
+# Memcached in production so processes share entries
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='videoshare'),
+    }
+}
+
+# Video card cache: in-process LRU (L1) in front of the shared cache (L2)
+VIDEO_CARD_L1_SIZE = 1024
+VIDEO_CARD_L1_TIMEOUT = 60  # seconds
+VIDEO_CARD_CACHE_TIMEOUT = 3600  # seconds
+
+# Cache-aside reads (video_sharing.cache.get_or_compute): expired entries are
+# served for CACHE_STALE_TIMEOUT more seconds while one caller recomputes
+CACHE_STALE_TIMEOUT = 60  # seconds
+CACHE_LOCK_TIMEOUT = 30  # seconds
+VIDEO_LIST_CACHE_TIMEOUT = 30  # seconds
+ADMIN_STATS_CACHE_TIMEOUT = 60  # seconds
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -94,6 +115,32 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Set MEDIA_STORAGE_BACKEND=videos.drive.DriveStorage to keep uploads on
+# Google Drive (see the GOOGLE_DRIVE_* settings)
+STORAGES = {
+    'default': {
+        'BACKEND': config('MEDIA_STORAGE_BACKEND', default='django.core.files.storage.FileSystemStorage'),
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# How videos.views.stream_video delivers uploads: 'django' streams them from
+# Python, 'x-accel-redirect' hands them to nginx (an internal location
+# aliasing MEDIA_ROOT at MEDIA_ACCEL_REDIRECT_PREFIX) and 'x-sendfile' to
+# Apache's mod_xsendfile
+MEDIA_DELIVERY = config('MEDIA_DELIVERY', default='django')
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+MEDIA_STREAM_BLOCK_SIZE = 64 * 1024  # bytes per read when streaming
+# HLS playlists (videos.hls) cut MP4s into fragmented MP4 segments of about
+# this many seconds; playlists are keyed on the file's content so they can live long
+HLS_SEGMENT_DURATION = 6  # seconds
+HLS_PLAYLIST_CACHE_TIMEOUT = 24 * 3600  # seconds
+# Parsed sample tables kept per worker for cutting segments; a long movie
+# costs about 24 bytes per sample
+HLS_MOVIE_CACHE_BYTES = 64 * 1024 * 1024
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom User Model
@@ -133,19 +180,86 @@ CORS_ALLOWED_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'upload-offset',
 ]
 
 CORS_EXPOSE_HEADERS = [
     'content-type',
     'x-csrftoken',
+    'etag',
+    'location',
 ]
 
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024   # 50MB
 
+# Video files are checked, hashed and spooled to disk as they arrive, see
+# videos.upload_handlers; other uploads use Django's default handlers
+VIDEO_UPLOAD_MAX_SIZE = 100 * 1024 * 1024  # 100MB
+# Rewrite uploaded MP4/MOV files with moov first so playback starts before
+# the whole file is fetched; done by the process_video job, see videos.faststart
+FASTSTART_UPLOADS = True
+FILE_UPLOAD_HANDLERS = [
+    'videos.upload_handlers.VideoUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Resumable uploads (videos.uploads). Chunks are written to
+# RESUMABLE_UPLOAD_DIR, which must be on the same filesystem as MEDIA_ROOT
+# for finished files to be moved into place with a rename
+RESUMABLE_UPLOAD_DIR = config('RESUMABLE_UPLOAD_DIR', default=str(BASE_DIR / 'upload_tmp'))
+RESUMABLE_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+RESUMABLE_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # largest accepted chunk, 8MB
+RESUMABLE_UPLOAD_EXPIRY_HOURS = 24
+
+# Background jobs (videos.jobs), run by manage.py run_workers. A claimed job
+# that is not finished within JOB_VISIBILITY_TIMEOUT seconds is run again;
+# failed attempts are retried after JOB_RETRY_BACKOFF seconds, doubling
+# up to JOB_RETRY_BACKOFF_MAX
+JOB_WORKERS = config('JOB_WORKERS', default=2, cast=int)
+JOB_POLL_INTERVAL = 1.0  # seconds between polls of an empty queue
+JOB_MAX_ATTEMPTS = 5
+JOB_VISIBILITY_TIMEOUT = 600  # seconds
+JOB_RETRY_BACKOFF = 10  # seconds
+JOB_RETRY_BACKOFF_MAX = 3600  # seconds
+
+# Seconds between batched writes of buffered video view counts (0 writes every hit)
+VIEW_COUNT_FLUSH_INTERVAL = config('VIEW_COUNT_FLUSH_INTERVAL', default=5, cast=float)
+
+# Seconds between background rebuilds of the in-process search suggestion index
+SEARCH_SUGGEST_REBUILD_INTERVAL = config('SEARCH_SUGGEST_REBUILD_INTERVAL', default=300, cast=int)
+
+# Half-life of engagement in the trending score; refresh with manage.py refresh_trending
+TRENDING_HALF_LIFE_HOURS = config('TRENDING_HALF_LIFE_HOURS', default=24, cast=float)
+
+# Storage tiering (videos.tiering, manage.py tier_media). A video's score is
+# its views within the last TIER_WINDOW_HOURS plus TIER_LIFETIME_VIEW_WEIGHT
+# per lifetime view. Cold videos scoring TIER_HOT_SCORE are moved to local
+# storage and hot ones scoring under TIER_COLD_SCORE to Google Drive; local
+# storage holds at most TIER_HOT_BYTES of the best scoring videos
+TIER_WINDOW_HOURS = config('TIER_WINDOW_HOURS', default=72, cast=int)
+TIER_BUCKET_MINUTES = 60  # resolution of the window
+TIER_HOT_SCORE = config('TIER_HOT_SCORE', default=20, cast=float)
+TIER_COLD_SCORE = config('TIER_COLD_SCORE', default=5, cast=float)
+TIER_LIFETIME_VIEW_WEIGHT = 0.01
+TIER_HOT_BYTES = config('TIER_HOT_BYTES', default=50 * 1024 ** 3, cast=int)
+
 # Google Drive settings (optional)
 GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE = config('GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE', default=None)
+# Folder videos.drive.DriveStorage keeps its files in
+GOOGLE_DRIVE_FOLDER_ID = config('GOOGLE_DRIVE_FOLDER_ID', default=None)
+# Upload and download chunk size; Drive wants multiples of 256KB
+GOOGLE_DRIVE_CHUNK_SIZE = 8 * 1024 * 1024
+# Seconds file ids, sizes and modification times are cached for
+GOOGLE_DRIVE_METADATA_CACHE_TIMEOUT = 300
+GOOGLE_DRIVE_NUM_RETRIES = 3
+# Bulk operations (videos.drive_bulk): concurrent uploads, and the jittered
+# backoff before retrying 429 and 5xx answers, doubling up to the max
+GOOGLE_DRIVE_MAX_WORKERS = config('GOOGLE_DRIVE_MAX_WORKERS', default=8, cast=int)
+GOOGLE_DRIVE_RETRY_BACKOFF = 1.0  # seconds
+GOOGLE_DRIVE_RETRY_BACKOFF_MAX = 32.0  # seconds
 
 # Logging configuration
 LOGGING = {
@@ -217,8 +331,11 @@ SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
 
-# Session settings
+# Session settings. video_sharing.sessions reads sessions from the cache and,
+# although SESSION_SAVE_EVERY_REQUEST is on, only writes an unchanged session
+# back once less than SESSION_REFRESH_THRESHOLD seconds of it are left
+SESSION_ENGINE = 'video_sharing.sessions'
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_SAVE_EVERY_REQUEST = True
+SESSION_REFRESH_THRESHOLD = config('SESSION_REFRESH_THRESHOLD', default=SESSION_COOKIE_AGE // 2, cast=int)
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
-GOOGLE_DRIVE_FOLDER_ID = config('GOOGLE_DRIVE_FOLDER_ID', default=None)
@@ -1,12 +1,12 @@
 from django.contrib import admin
-from .models import Video, Comment, VideoRating
+from .models import Video, Comment, VideoRating, Job
 
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
     list_display = ['title', 'creator', 'genre', 'age_rating', 'views', 'created_at', 'is_active']
     list_filter = ['genre', 'age_rating', 'is_active', 'created_at']
     search_fields = ['title', 'description', 'creator__username']
-    readonly_fields = ['views', 'created_at', 'updated_at', 'file_size']
+    readonly_fields = ['views', 'comments_count', 'ratings_count', 'rating_sum', 'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count', 'hotness', 'card_version', 'created_at', 'updated_at', 'file_size', 'content_hash', 'duration', 'width', 'height', 'video_codec', 'bitrate']
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -22,3 +22,9 @@ class VideoRatingAdmin(admin.ModelAdmin):
     list_display = ['user', 'video', 'rating', 'created_at']
     list_filter = ['rating', 'created_at']
     search_fields = ['user__username', 'video__title']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'user', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['attempts', 'locked_by', 'result', 'last_error', 'created_at', 'finished_at']
@@ -1,16 +1,28 @@
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
-from django.db.models import Q, Avg
 from django.core.paginator import Paginator
 from django.middleware.csrf import get_token
+from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.contrib.auth import get_user_model
-from videos.models import Video, Comment, VideoRating
-from videos.forms import VideoUploadForm
+from videos.models import Video, Comment, VideoRating, RelatedVideo, UploadSession, Job
+from videos.forms import VideoDetailsForm, VideoUploadForm
+from videos.cards import CARD_KEY_FIELDS, card_key, get_cards, list_generation
+from videos.conditional import make_etag, not_modified, with_etag
+from videos.ratings import apply_rating
+from videos.search import search_videos
+from videos.suggest import suggest_index
+from videos import uploads
+from videos.view_counter import view_buffer
+from video_sharing.cache import generation, get_or_compute
+from videos.pagination import (
+    CURSOR_ORDERING, TRENDING_ORDERING, InvalidCursor, cursor_paginate, encode_cursor
+)
+import hashlib
 import json
 import logging
 
@@ -26,8 +38,8 @@ class BaseAPIView(View):
         if hasattr(response, 'headers'):
             response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
             response['Access-Control-Allow-Credentials'] = 'true'
-            response['Access-Control-Allow-Headers'] = 'X-CSRFToken, Content-Type, Authorization'
-            response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+            response['Access-Control-Allow-Headers'] = 'X-CSRFToken, Content-Type, Authorization, Upload-Offset'
+            response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, PATCH, DELETE, OPTIONS'
         return response
     
     def options(self, request, *args, **kwargs):
@@ -35,8 +47,8 @@ class BaseAPIView(View):
         response = JsonResponse({'status': 'ok'})
         response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
         response['Access-Control-Allow-Credentials'] = 'true'
-        response['Access-Control-Allow-Headers'] = 'X-CSRFToken, Content-Type, Authorization'
-        response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'X-CSRFToken, Content-Type, Authorization, Upload-Offset'
+        response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, PATCH, DELETE, OPTIONS'
         return response
 
 class VideosAPIView(BaseAPIView):
@@ -46,71 +58,98 @@ class VideosAPIView(BaseAPIView):
         """Get videos with optional filtering"""
         try:
             # Get query parameters
-            query = request.GET.get('query', '')
-            genre = request.GET.get('genre', '')
-            page = int(request.GET.get('page', 1))
-            per_page = int(request.GET.get('per_page', 12))
-            
-            # Start with active videos
-            videos = Video.objects.filter(is_active=True).select_related('creator')
-            
-            # Apply filters
-            if query:
-                videos = videos.filter(
-                    Q(title__icontains=query) | 
-                    Q(description__icontains=query) |
-                    Q(creator__username__icontains=query)
-                )
-            
-            if genre:
-                videos = videos.filter(genre=genre)
+            params = {
+                'query': request.GET.get('query', ''),
+                'genre': request.GET.get('genre', ''),
+                'page': int(request.GET.get('page', 1)),
+                'per_page': int(request.GET.get('per_page', 12)),
+                'cursor': request.GET.get('cursor'),
+                'trending': request.GET.get('sort') == 'trending',
+                'include_count': request.GET.get('include_count', '').lower() in ('1', 'true'),
+            }
             
-            # Order by most recent
-            videos = videos.order_by('-created_at')
+            # Pages are cached as ids; concurrent misses share one query
+            digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+            listing = get_or_compute(
+                f'video-list:{list_generation()}:{digest}',
+                lambda: self.list_page(**params),
+                timeout=getattr(settings, 'VIDEO_LIST_CACHE_TIMEOUT', 30),
+            )
             
-            # Paginate
-            paginator = Paginator(videos, per_page)
-            page_obj = paginator.get_page(page)
+            videos = Video.objects.filter(is_active=True).only(*CARD_KEY_FIELDS).in_bulk(listing['ids'])
+            videos = [videos[pk] for pk in listing['ids'] if pk in videos]
             
-            # Serialize videos
-            videos_data = []
-            for video in page_obj:
-                video_data = {
-                    'id': video.id,
-                    'title': video.title,
-                    'description': video.description,
-                    'creator': video.creator.username,
-                    'genre': video.genre,
-                    'age_rating': video.age_rating,
-                    'views': video.views,
-                    'likes': video.likes,
-                    'dislikes': video.dislikes,
-                    'average_rating': float(video.average_rating or 0),
-                    'comments_count': video.comment_set.count(),
-                    'created_at': video.created_at.isoformat(),
-                    'video_url': video.video_file.url if video.video_file else video.external_url,
-                    'thumbnail': None  # Add thumbnail logic if needed
-                }
-                videos_data.append(video_data)
+            # The card keys change whenever any card on the page does
+            etag = make_etag(listing['pagination'], [card_key(video) for video in videos])
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
             
-            return JsonResponse({
+            # Assemble the page from cached cards
+            return with_etag(JsonResponse({
                 'success': True,
-                'videos': videos_data,
-                'pagination': {
-                    'current_page': page_obj.number,
-                    'total_pages': paginator.num_pages,
-                    'total_count': paginator.count,
-                    'has_next': page_obj.has_next(),
-                    'has_previous': page_obj.has_previous(),
-                }
-            })
+                'videos': get_cards(videos),
+                'pagination': listing['pagination']
+            }), etag)
             
+        except InvalidCursor:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid cursor'
+            }, status=400)
         except Exception as e:
             logger.error(f"Error in VideosAPIView.get: {str(e)}")
             return JsonResponse({
                 'success': False,
                 'error': 'Failed to fetch videos'
             }, status=500)
+    
+    def list_page(self, query, genre, page, per_page, cursor, trending, include_count):
+        """Run the listing query and return the page's video ids and pagination"""
+        sort_key = 'hotness' if trending else 'created_at'
+        
+        # Start with active videos; the page query only loads ids and keys
+        videos = Video.objects.filter(is_active=True).only('id', 'created_at', 'hotness')
+        
+        # Order by most recent; search results are ranked by relevance
+        videos = videos.order_by(*CURSOR_ORDERING)
+        
+        # Apply filters
+        if query:
+            videos = search_videos(videos, query)
+        
+        if genre:
+            videos = videos.filter(genre=genre)
+        
+        # Trending order uses the precomputed hotness index
+        if trending:
+            videos = videos.order_by(*TRENDING_ORDERING)
+        
+        # Paginate: seek past the cursor when one is given, otherwise
+        # fall back to numbered pages for older clients
+        if cursor is not None:
+            page_obj = cursor_paginate(videos, cursor, per_page, key=sort_key)
+            pagination = {
+                'next_cursor': page_obj.next_cursor,
+                'has_next': page_obj.has_next(),
+                'total_count': videos.count() if include_count else None,
+            }
+        else:
+            paginator = Paginator(videos, per_page)
+            page_obj = paginator.get_page(page)
+            # Cursors follow recency or hotness, so relevance-ranked
+            # pages cannot hand one out
+            last = page_obj[-1] if page_obj.has_next() and (trending or not query) else None
+            pagination = {
+                'current_page': page_obj.number,
+                'total_pages': paginator.num_pages,
+                'total_count': paginator.count,
+                'has_next': page_obj.has_next(),
+                'has_previous': page_obj.has_previous(),
+                'next_cursor': encode_cursor(getattr(last, sort_key), last.id) if last else None,
+            }
+        
+        return {'ids': [video.id for video in page_obj], 'pagination': pagination}
 
 class VideoDetailAPIView(BaseAPIView):
     """API endpoint for video details"""
@@ -118,17 +157,28 @@ class VideoDetailAPIView(BaseAPIView):
     def get(self, request, video_id):
         """Get detailed video information"""
         try:
+            # Validate against the card key before the heavy queries run.
+            # Comments, ratings and views bump card_version, the rail has
+            # its own generation and user_rating depends on the user.
+            current = Video.objects.only(*CARD_KEY_FIELDS).get(id=video_id, is_active=True)
+            
+            # Count the view, revalidations included, as the page view
+            # does; the buffer writes it back in batches
+            view_buffer.increment(current.id)
+            
+            etag = make_etag(card_key(current), generation('related-videos'), request.user.pk)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+            
             video = Video.objects.select_related('creator').get(
                 id=video_id, 
                 is_active=True
             )
-            
-            # Increment view count
             video.views += 1
-            video.save(update_fields=['views'])
             
             # Get comments
-            comments = Comment.objects.filter(video=video).select_related('user').order_by('-created_at')[:10]
+            comments = Comment.objects.filter(video=video, is_active=True).select_related('user').order_by('-created_at')[:10]
             comments_data = [
                 {
                     'id': comment.id,
@@ -140,6 +190,21 @@ class VideoDetailAPIView(BaseAPIView):
                 for comment in comments
             ]
             
+            # Precomputed neighbours in one indexed lookup
+            related = RelatedVideo.objects.filter(
+                video=video, related__is_active=True
+            ).select_related('related__creator')
+            related_data = [
+                {
+                    'id': link.related.id,
+                    'title': link.related.title,
+                    'creator': link.related.creator.username,
+                    'views': link.related.views,
+                    'video_url': link.related.video_url,
+                }
+                for link in related
+            ]
+            
             # Get user's rating if authenticated
             user_rating = None
             if request.user.is_authenticated:
@@ -163,19 +228,22 @@ class VideoDetailAPIView(BaseAPIView):
                 'views': video.views,
                 'likes': video.likes,
                 'dislikes': video.dislikes,
-                'average_rating': float(video.average_rating or 0),
+                'average_rating': float(video.average_rating),
+                'ratings_count': video.ratings_count,
+                'rating_distribution': video.rating_distribution,
                 'user_rating': user_rating,
-                'comments_count': video.comment_set.count(),
+                'comments_count': video.comments_count,
                 'created_at': video.created_at.isoformat(),
-                'video_url': video.video_file.url if video.video_file else video.external_url,
+                'video_url': video.video_url,
                 'thumbnail': None,
-                'comments': comments_data
+                'comments': comments_data,
+                'related': related_data
             }
             
-            return JsonResponse({
+            return with_etag(JsonResponse({
                 'success': True,
                 'video': video_data
-            })
+            }), etag)
             
         except Video.DoesNotExist:
             return JsonResponse({
@@ -189,6 +257,22 @@ class VideoDetailAPIView(BaseAPIView):
                 'error': 'Failed to fetch video details'
             }, status=500)
 
+class SearchSuggestAPIView(BaseAPIView):
+    """API endpoint for search-as-you-type completions"""
+    
+    def get(self, request):
+        """Get title and creator completions for a prefix"""
+        prefix = request.GET.get('q', '')
+        try:
+            limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+        except ValueError:
+            limit = 8
+        
+        return JsonResponse({
+            'success': True,
+            'suggestions': suggest_index.lookup(prefix, limit)
+        })
+
 class AuthAPIView(BaseAPIView):
     """API endpoint for authentication"""
     
@@ -259,7 +343,7 @@ class UserStatusAPIView(BaseAPIView):
     def get(self, request):
         """Get current user status"""
         if request.user.is_authenticated:
-            return JsonResponse({
+            data = {
                 'success': True,
                 'authenticated': True,
                 'user': {
@@ -269,13 +353,17 @@ class UserStatusAPIView(BaseAPIView):
                     'user_type': request.user.user_type,
                     'is_staff': request.user.is_staff
                 }
-            })
+            }
         else:
-            return JsonResponse({
+            data = {
                 'success': True,
                 'authenticated': False,
                 'user': None
-            })
+            }
+        
+        # The payload is tiny and already loaded, so it is its own validator
+        etag = make_etag(data)
+        return not_modified(request, etag) or with_etag(JsonResponse(data), etag)
 
 class CSRFTokenAPIView(BaseAPIView):
     """API endpoint for CSRF token"""
@@ -303,31 +391,16 @@ class UploadAPIView(BaseAPIView):
                     'error': 'Only creators can upload videos'
                 }, status=403)
             
-            form = VideoUploadForm(request.POST, request.FILES)
+            # File checks live in the form and the streaming upload handler
+            form = VideoUploadForm(
+                request.POST, request.FILES, upload_error=getattr(request, 'upload_error', None)
+            )
             if form.is_valid():
                 video = form.save(commit=False)
                 video.creator = request.user
                 
-                # Enhanced file validation (already handled in views.py)
                 uploaded_file = request.FILES.get('video_file')
                 if uploaded_file:
-                    # File validation
-                    if uploaded_file.size > 100 * 1024 * 1024:
-                        return JsonResponse({
-                            'success': False,
-                            'error': 'File size must be less than 100MB'
-                        }, status=400)
-                    
-                    # Check file extension
-                    import os
-                    file_ext = os.path.splitext(uploaded_file.name)[1].lower()
-                    allowed_extensions = ['.mp4', '.avi', '.mov', '.wmv']
-                    if file_ext not in allowed_extensions:
-                        return JsonResponse({
-                            'success': False,
-                            'error': 'Please upload a valid video file (MP4, AVI, MOV, WMV)'
-                        }, status=400)
-                    
                     video.file_size = uploaded_file.size
                 
                 # Set initial values
@@ -337,10 +410,12 @@ class UploadAPIView(BaseAPIView):
                 
                 video.save()
                 
+                # Processing continues in the background; poll api/jobs/<job_id>/
                 return JsonResponse({
                     'success': True,
                     'message': 'Video uploaded successfully',
-                    'video_id': video.id
+                    'video_id': video.id,
+                    'job_id': video.processing_job.id
                 })
             else:
                 errors = {}
@@ -360,6 +435,178 @@ class UploadAPIView(BaseAPIView):
                 'error': 'Upload failed'
             }, status=500)
 
+def _upload_error(error):
+    return JsonResponse({
+        'success': False,
+        'error': str(error)
+    }, status=error.status)
+
+def _session_data(session):
+    return {
+        'success': True,
+        'upload_id': str(session.id),
+        'offset': session.offset,
+        'size': session.size,
+        'chunk_size': settings.RESUMABLE_UPLOAD_CHUNK_SIZE,
+    }
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadSessionsAPIView(BaseAPIView):
+    """
+    API endpoint that opens resumable uploads.
+    
+    Protocol: POST the video details with ``filename`` and ``size`` here,
+    PATCH raw chunks to the returned session with an ``Upload-Offset``
+    header, GET the session to learn the offset to resume from after a
+    dropped connection, then POST to its ``complete/`` URL.
+    """
+    
+    @method_decorator(login_required)
+    def post(self, request):
+        """Open an upload session"""
+        try:
+            if request.user.user_type != 'creator':
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Only creators can upload videos'
+                }, status=403)
+            
+            data = json.loads(request.body)
+            form = VideoDetailsForm(data)
+            if not form.is_valid():
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Validation failed',
+                    'errors': {field: [str(error) for error in errors] for field, errors in form.errors.items()}
+                }, status=400)
+            
+            session = uploads.open_session(
+                request.user, str(data.get('filename', '')), int(data.get('size', 0)), form.cleaned_data
+            )
+            response = JsonResponse(_session_data(session), status=201)
+            response['Location'] = reverse('videos:api_upload_session', args=[session.id])
+            return response
+            
+        except uploads.UploadError as e:
+            return _upload_error(e)
+        except (ValueError, TypeError):
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid request'
+            }, status=400)
+        except Exception as e:
+            logger.error(f"Error in UploadSessionsAPIView.post: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': 'Failed to start upload'
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadSessionAPIView(BaseAPIView):
+    """API endpoint for one resumable upload: status, chunks and cancel"""
+    
+    @method_decorator(login_required)
+    def get(self, request, upload_id):
+        """Report how many bytes have been received"""
+        try:
+            session = UploadSession.objects.get(id=upload_id, user=request.user)
+        except UploadSession.DoesNotExist:
+            return JsonResponse({'success': False, 'error': 'Upload not found'}, status=404)
+        return JsonResponse(_session_data(session))
+    
+    @method_decorator(login_required)
+    def patch(self, request, upload_id):
+        """Write the request body at the offset given in ``Upload-Offset``"""
+        try:
+            offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            session = uploads.write_chunk(upload_id, request.user, offset, request, length)
+            return JsonResponse(_session_data(session))
+            
+        except UploadSession.DoesNotExist:
+            return JsonResponse({'success': False, 'error': 'Upload not found'}, status=404)
+        except uploads.UploadError as e:
+            return _upload_error(e)
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Upload-Offset and Content-Length headers are required'
+            }, status=400)
+        except Exception as e:
+            logger.error(f"Error in UploadSessionAPIView.patch: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': 'Failed to store chunk'
+            }, status=500)
+    
+    @method_decorator(login_required)
+    def delete(self, request, upload_id):
+        """Cancel an upload and delete what it received"""
+        try:
+            session = UploadSession.objects.get(id=upload_id, user=request.user)
+        except UploadSession.DoesNotExist:
+            return JsonResponse({'success': False, 'error': 'Upload not found'}, status=404)
+        uploads.discard(session)
+        return JsonResponse({'success': True})
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadCompleteAPIView(BaseAPIView):
+    """API endpoint that turns a fully received upload into a video"""
+    
+    @method_decorator(login_required)
+    def post(self, request, upload_id):
+        """Finalize an upload"""
+        try:
+            video = uploads.finalize(upload_id, request.user)
+            return JsonResponse({
+                'success': True,
+                'message': 'Video uploaded successfully',
+                'video_id': video.id,
+                'job_id': video.processing_job.id
+            })
+            
+        except UploadSession.DoesNotExist:
+            return JsonResponse({'success': False, 'error': 'Upload not found'}, status=404)
+        except uploads.UploadError as e:
+            return _upload_error(e)
+        except Exception as e:
+            logger.error(f"Error in UploadCompleteAPIView.post: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': 'Failed to finalize upload'
+            }, status=500)
+
+class JobAPIView(BaseAPIView):
+    """API endpoint for polling a background job, e.g. an upload's processing"""
+    
+    @method_decorator(login_required)
+    def get(self, request, job_id):
+        """Get the state of one of the user's jobs"""
+        try:
+            job = Job.objects.get(id=job_id, user=request.user)
+            return JsonResponse({
+                'success': True,
+                'job': {
+                    'id': job.id,
+                    'name': job.name,
+                    'status': job.status,
+                    'attempts': job.attempts,
+                    'result': job.result,
+                    'error': job.last_error,
+                    'created_at': job.created_at.isoformat(),
+                    'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+                }
+            })
+            
+        except Job.DoesNotExist:
+            return JsonResponse({'success': False, 'error': 'Job not found'}, status=404)
+        except Exception as e:
+            logger.error(f"Error in JobAPIView.get: {str(e)}")
+            return JsonResponse({
+                'success': False,
+                'error': 'Failed to load job'
+            }, status=500)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class RatingAPIView(BaseAPIView):
     """API endpoint for video rating"""
@@ -379,26 +626,15 @@ class RatingAPIView(BaseAPIView):
             
             video = Video.objects.get(id=video_id, is_active=True)
             
-            # Create or update rating
-            rating, created = VideoRating.objects.update_or_create(
-                video=video,
-                user=request.user,
-                defaults={'rating': int(rating_value)}
-            )
-            
-            # Recalculate average rating
-            avg_rating = VideoRating.objects.filter(video=video).aggregate(
-                avg=Avg('rating')
-            )['avg']
-            
-            video.average_rating = avg_rating
-            video.save(update_fields=['average_rating'])
+            # Create or update rating and apply the difference to the aggregates
+            rating = apply_rating(video, request.user, int(rating_value))
             
             return JsonResponse({
                 'success': True,
                 'user_rating': rating.rating,
-                'average_rating': float(avg_rating or 0),
-                'total_ratings': VideoRating.objects.filter(video=video).count()
+                'average_rating': float(video.average_rating),
+                'total_ratings': video.ratings_count,
+                'rating_distribution': video.rating_distribution
             })
             
         except Video.DoesNotExist:
@@ -1,6 +1,30 @@
+import os
+import sys
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
+
+# manage.py commands that serve requests. Other commands (migrate, test...)
+# skip building in-process indexes at startup; it would only compete with
+# them for the database
+SERVER_COMMANDS = ('runserver', 'start_server')
+
+
+def serves_requests():
+    """Whether this process is a web server rather than some other management command"""
+    if os.path.basename(sys.argv[0]) in ('manage.py', 'django-admin'):
+        return len(sys.argv) > 1 and sys.argv[1] in SERVER_COMMANDS
+    return True
 
 
 class VideosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'videos'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
+        from .search import drop_rename_blocking_triggers, ensure_search_triggers
+        pre_migrate.connect(drop_rename_blocking_triggers, sender=self)
+        post_migrate.connect(ensure_search_triggers, sender=self)
+        if serves_requests():
+            from .suggest import suggest_index
+            suggest_index.warm_up()
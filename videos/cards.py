@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import cache
+from video_sharing.cache import LocalLRUCache, bump_generation, generation
+from .models import Video
+
+# Fields a page query needs so cards can be looked up and the page cursored
+CARD_KEY_FIELDS = ('id', 'card_version', 'updated_at', 'created_at', 'hotness')
+
+l1_cache = LocalLRUCache(
+    max_size=getattr(settings, 'VIDEO_CARD_L1_SIZE', 1024),
+    timeout=getattr(settings, 'VIDEO_CARD_L1_TIMEOUT', 60),
+)
+
+
+def video_card(video):
+    """Serialize a video (with ``creator`` loaded) into its list card"""
+    return {
+        'id': video.id,
+        'title': video.title,
+        'description': video.description,
+        'creator': video.creator.username,
+        'genre': video.genre,
+        'age_rating': video.age_rating,
+        'views': video.views,
+        'likes': video.likes,
+        'dislikes': video.dislikes,
+        'average_rating': float(video.average_rating),
+        'ratings_count': video.ratings_count,
+        'comments_count': video.comments_count,
+        'created_at': video.created_at.isoformat(),
+        'video_url': video.video_url,
+        'thumbnail': None  # Add thumbnail logic if needed
+    }
+
+
+def card_key(video):
+    """
+    Cache key of a video's card.
+
+    ``save()`` always moves ``updated_at``, and the counter, view and
+    username updates that bypass ``save()`` bump ``card_version`` instead,
+    so any write that changes the card produces a new key.
+    """
+    return f'video-card:{video.id}:{video.updated_at.timestamp()}:{video.card_version}'
+
+
+def get_cards(videos):
+    """
+    Return the cards of ``videos`` in order.
+
+    ``videos`` only needs ``CARD_KEY_FIELDS`` loaded. Cards come from the
+    in-process LRU first, then one ``get_many`` on the shared cache, and only
+    the remaining misses are hydrated from the database in a single query.
+    """
+    keys = [card_key(video) for video in videos]
+    cards = l1_cache.get_many(keys)
+
+    missing = [key for key in keys if key not in cards]
+    if missing:
+        shared = cache.get_many(missing)
+        cards.update(shared)
+        l1_cache.set_many(shared)
+
+    missing_ids = {video.id: key for video, key in zip(videos, keys) if key not in cards}
+    if missing_ids:
+        hydrated = {}
+        rows = Video.objects.select_related('creator').filter(id__in=missing_ids)
+        for video in rows:
+            # Store under the version actually read, which may be newer
+            hydrated[card_key(video)] = video_card(video)
+            cards[missing_ids[video.id]] = hydrated[card_key(video)]
+        cache.set_many(hydrated, getattr(settings, 'VIDEO_CARD_CACHE_TIMEOUT', 3600))
+        l1_cache.set_many(hydrated)
+
+    return [cards[key] for key in keys if key in cards]
+
+
+def list_generation():
+    return generation('video-list')
+
+
+def invalidate_video_lists():
+    """
+    Retire every cached list page.
+
+    Called when videos are added, edited, removed or re-ranked. Counter
+    updates do not need it: pages only cache ids, and the cards they point
+    to are versioned separately.
+    """
+    bump_generation('video-list')
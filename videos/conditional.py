@@ -0,0 +1,32 @@
+import hashlib
+import json
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+
+def make_etag(*parts):
+    """
+    Weak ETag over the validators of a response.
+
+    ``parts`` are the cheap things the body is derived from (card keys,
+    cache generations, filter parameters), never the body itself, so the
+    tag can be computed and compared before the body is built.
+    """
+    raw = json.dumps(parts, default=str, sort_keys=True, separators=(',', ':'))
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+def not_modified(request, etag):
+    """Return a 304 response when the client's copy is current, else None"""
+    return get_conditional_response(request, etag=etag)
+
+
+def with_etag(response, etag):
+    """
+    Attach ``etag`` and ask clients and proxies to revalidate before reuse.
+
+    Only ETags are sent: counter updates bump ``card_version`` without
+    touching ``updated_at``, so a Last-Modified date would miss them.
+    """
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
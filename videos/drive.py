@@ -0,0 +1,267 @@
+import hashlib
+import io
+import mimetypes
+import threading
+import httplib2
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.deconstruct import deconstructible
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload, MediaIoBaseUpload
+from .models import DRIVE_FILE_URL
+
+SCOPES = ['https://www.googleapis.com/auth/drive']
+
+# Fields kept in the metadata cache
+FILE_FIELDS = 'id,size,modifiedTime'
+
+_service = None
+_service_lock = threading.Lock()
+_local = threading.local()
+
+
+def _thread_http(credentials):
+    http = getattr(_local, 'http', None)
+    if http is None:
+        http = _local.http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=60))
+    return http
+
+
+def drive_service():
+    """
+    The process's Drive API client, built on first use.
+
+    Building it reads the key file and parses the discovery document, so
+    it is done once. httplib2 connections are not thread-safe, so requests
+    are made over a connection of the calling thread's own.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                if not settings.GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE:
+                    raise ImproperlyConfigured('GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE is not set')
+                credentials = service_account.Credentials.from_service_account_file(
+                    settings.GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE, scopes=SCOPES
+                )
+
+                def request_builder(http, *args, **kwargs):
+                    return HttpRequest(_thread_http(credentials), *args, **kwargs)
+
+                _service = build(
+                    'drive', 'v3', credentials=credentials,
+                    requestBuilder=request_builder, cache_discovery=False,
+                )
+    return _service
+
+
+class DriveReader(io.RawIOBase):
+    """
+    Seekable read-only stream of a Drive file, fetched chunk by chunk.
+
+    Sequential reads continue one ``MediaIoBaseDownload``; a seek elsewhere
+    starts a new one at the new position, so a ranged read only downloads
+    the chunks it touches. Only the current chunk is held in memory.
+    """
+
+    def __init__(self, service, file_id, size, chunk_size):
+        self.service = service
+        self.file_id = file_id
+        self.size = size
+        self.chunk_size = chunk_size
+        self._position = 0
+        self._chunk = b''
+        self._chunk_start = 0
+        self._downloader = None
+        self._next_offset = 0
+        self._sink = io.BytesIO()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('Negative seek position')
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        if not self._chunk_start <= self._position < self._chunk_start + len(self._chunk):
+            self._fetch()
+            if not self._chunk:
+                return 0
+        start = self._position - self._chunk_start
+        length = min(len(buffer), len(self._chunk) - start)
+        buffer[:length] = self._chunk[start:start + length]
+        self._position += length
+        return length
+
+    def _fetch(self):
+        if self._downloader is None or self._next_offset != self._position:
+            request = self.service.files().get_media(fileId=self.file_id)
+            self._downloader = MediaIoBaseDownload(self._sink, request, chunksize=self.chunk_size)
+            # The download API has no public start offset; this is the
+            # counter its Range headers are built from
+            self._downloader._progress = self._position
+            self._next_offset = self._position
+        self._sink.seek(0)
+        self._sink.truncate()
+        self._downloader.next_chunk(num_retries=settings.GOOGLE_DRIVE_NUM_RETRIES)
+        self._chunk = self._sink.getvalue()
+        self._chunk_start = self._next_offset
+        self._next_offset += len(self._chunk)
+
+
+def drive_file_id(url):
+    """Id of the Drive file behind a ``DriveStorage.url()``, or None"""
+    match = DRIVE_FILE_URL.search(url or '')
+    return match.group(1) if match else None
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+@deconstructible
+class DriveStorage(Storage):
+    """
+    Django storage keeping files in a Google Drive folder.
+
+    Storage names become Drive file names inside ``folder_id``
+    (GOOGLE_DRIVE_FOLDER_ID). Uploads are resumable and sent in
+    ``chunk_size`` pieces (GOOGLE_DRIVE_CHUNK_SIZE) straight from the file
+    object; ``open()`` streams, see ``DriveReader``. Each name's id, size
+    and modification time are kept in the cache for
+    GOOGLE_DRIVE_METADATA_CACHE_TIMEOUT seconds, misses included, so
+    ``exists``, ``size`` and ``url`` do not call the API every time.
+    """
+
+    def __init__(self, folder_id=None, chunk_size=None, service=None):
+        self.folder_id = folder_id or settings.GOOGLE_DRIVE_FOLDER_ID
+        self.chunk_size = chunk_size or settings.GOOGLE_DRIVE_CHUNK_SIZE
+        self._service = service
+
+    @property
+    def service(self):
+        return self._service or drive_service()
+
+    def _cache_key(self, name):
+        return f'drive-meta:{self.folder_id}:{hashlib.sha1(name.encode()).hexdigest()}'
+
+    def _remember(self, name, metadata):
+        # A miss is cached as an empty dict
+        cache.set(self._cache_key(name), metadata, settings.GOOGLE_DRIVE_METADATA_CACHE_TIMEOUT)
+
+    def _metadata(self, name):
+        """Drive metadata of ``name``, or None when there is no such file"""
+        metadata = cache.get(self._cache_key(name))
+        if metadata is None:
+            query = f"name = '{_escape(name)}' and trashed = false"
+            if self.folder_id:
+                query += f" and '{_escape(self.folder_id)}' in parents"
+            found = self.service.files().list(
+                q=query, fields=f'files({FILE_FIELDS})', pageSize=1, spaces='drive'
+            ).execute(num_retries=settings.GOOGLE_DRIVE_NUM_RETRIES).get('files', [])
+            metadata = found[0] if found else {}
+            self._remember(name, metadata)
+        return metadata or None
+
+    def _existing(self, name):
+        metadata = self._metadata(name)
+        if metadata is None:
+            raise FileNotFoundError(f'{name} is not on Google Drive')
+        return metadata
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError('Drive files are written with save(), not open()')
+        return self._reader(self._existing(name), name)
+
+    def _reader(self, metadata, name):
+        size = int(metadata.get('size', 0))
+        reader = DriveReader(self.service, metadata['id'], size, self.chunk_size)
+        file = File(io.BufferedReader(reader, buffer_size=min(self.chunk_size, 1024 * 1024)), name)
+        file.size = size
+        return file
+
+    def open_id(self, file_id):
+        """Open a file known by its Drive id (from its URL) rather than its name"""
+        try:
+            metadata = self.service.files().get(fileId=file_id, fields='id,name,size').execute(
+                num_retries=settings.GOOGLE_DRIVE_NUM_RETRIES
+            )
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise FileNotFoundError(f'{file_id} is not on Google Drive') from e
+            raise
+        return self._reader(metadata, metadata['name'])
+
+    def _save(self, name, content):
+        content.seek(0)
+        media = MediaIoBaseUpload(
+            content,
+            mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            chunksize=self.chunk_size,
+            resumable=True,
+        )
+        body = {'name': name}
+        if self.folder_id:
+            body['parents'] = [self.folder_id]
+        request = self.service.files().create(body=body, media_body=media, fields=FILE_FIELDS)
+        response = None
+        while response is None:
+            _, response = request.next_chunk(num_retries=settings.GOOGLE_DRIVE_NUM_RETRIES)
+        self._remember(name, response)
+        return name
+
+    def delete(self, name):
+        metadata = self._metadata(name)
+        if metadata is None:
+            return
+        try:
+            self.service.files().delete(fileId=metadata['id']).execute(
+                num_retries=settings.GOOGLE_DRIVE_NUM_RETRIES
+            )
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+        self._remember(name, {})
+
+    def exists(self, name):
+        return self._metadata(name) is not None
+
+    def size(self, name):
+        return int(self._existing(name).get('size', 0))
+
+    def share(self, name):
+        """Make a file readable by anyone with its URL"""
+        self.service.permissions().create(
+            fileId=self._existing(name)['id'], body={'role': 'reader', 'type': 'anyone'}, fields='id'
+        ).execute(num_retries=settings.GOOGLE_DRIVE_NUM_RETRIES)
+
+    def url(self, name):
+        return f"https://drive.google.com/file/d/{self._existing(name)['id']}/view"
+
+    def get_modified_time(self, name):
+        modified = parse_datetime(self._existing(name)['modifiedTime'])
+        return modified if settings.USE_TZ else timezone.make_naive(modified)
@@ -0,0 +1,175 @@
+import mimetypes
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+from .drive import FILE_FIELDS, drive_service
+
+# Drive accepts up to 100 calls per batch request
+BATCH_SIZE = 100
+
+# Rate limiting and transient server errors; anything else is final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retryable(error):
+    return isinstance(error, HttpError) and error.resp.status in RETRY_STATUSES
+
+
+def backoff(attempt):
+    """Full-jitter exponential backoff before retry number ``attempt + 1``"""
+    delay = min(settings.GOOGLE_DRIVE_RETRY_BACKOFF * 2 ** attempt, settings.GOOGLE_DRIVE_RETRY_BACKOFF_MAX)
+    return random.uniform(0, delay)
+
+
+def call(func, retries=None):
+    """Call ``func``, retrying 429 and 5xx answers with jittered backoff"""
+    if retries is None:
+        retries = settings.GOOGLE_DRIVE_NUM_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except HttpError as e:
+            if not retryable(e) or attempt == retries:
+                raise
+            time.sleep(backoff(attempt))
+
+
+def batch_execute(requests, service=None, retries=None):
+    """
+    Run API calls in ``BatchHttpRequest`` groups of ``BATCH_SIZE``.
+
+    ``requests`` maps keys to functions building an ``HttpRequest`` (calls
+    that are retried have to be built again). Calls that fail with 429 or
+    5xx are retried together in a later batch. Returns a dict mapping each
+    key to its response or to the error it finally failed with; when a
+    whole batch request fails, that error is every one of its keys' result.
+    """
+    service = service or drive_service()
+    if retries is None:
+        retries = settings.GOOGLE_DRIVE_NUM_RETRIES
+    results = {}
+    pending = list(requests)
+    for attempt in range(retries + 1):
+        for start in range(0, len(pending), BATCH_SIZE):
+            keys = pending[start:start + BATCH_SIZE]
+
+            def store(request_id, response, exception):
+                key = keys[int(request_id)]
+                results[key] = exception if exception is not None else response
+
+            batch = service.new_batch_http_request(callback=store)
+            for index, key in enumerate(keys):
+                results.pop(key, None)
+                batch.add(requests[key](), request_id=str(index))
+            try:
+                call(batch.execute, retries)
+            except Exception as e:
+                for key in keys:
+                    results.setdefault(key, e)
+
+        pending = [key for key in pending if retryable(results[key])]
+        if not pending or attempt == retries:
+            break
+        time.sleep(backoff(attempt))
+    return results
+
+
+def _upload(service, name, file, folder_id, chunk_size):
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            return _upload(service, name, f, folder_id, chunk_size)
+    media = MediaIoBaseUpload(
+        file,
+        mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        chunksize=chunk_size,
+        resumable=True,
+    )
+    body = {'name': name}
+    if folder_id:
+        body['parents'] = [folder_id]
+    request = service.files().create(body=body, media_body=media, fields=FILE_FIELDS)
+    response = None
+    while response is None:
+        _, response = call(request.next_chunk)
+    return response
+
+
+def bulk_upload(files, folder_id=None, public=False, service=None, workers=None):
+    """
+    Upload ``(name, file object or path)`` pairs with a bounded thread pool.
+
+    Media cannot be batched, so up to ``workers`` (GOOGLE_DRIVE_MAX_WORKERS)
+    resumable uploads run at once. With ``public`` the uploaded files are
+    then made readable by anyone in batched permission calls, and each
+    result says whether that worked under ``public``. Returns the metadata
+    of each file in order, or the exception its upload raised.
+    """
+    service = service or drive_service()
+    workers = workers or settings.GOOGLE_DRIVE_MAX_WORKERS
+
+    def upload(item):
+        name, file = item
+        try:
+            return _upload(service, name, file, folder_id, settings.GOOGLE_DRIVE_CHUNK_SIZE)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(upload, files))
+
+    if public:
+        uploaded = [result for result in results if isinstance(result, dict)]
+        failed = bulk_share([result['id'] for result in uploaded], service)
+        for result in uploaded:
+            result['public'] = result['id'] not in failed
+    return results
+
+
+def bulk_share(file_ids, service=None):
+    """
+    Make files readable by anyone with the link, in batched calls.
+
+    Returns a dict mapping the ids whose permission call failed to the error.
+    """
+    service = service or drive_service()
+    results = batch_execute({
+        file_id: (lambda file_id=file_id: service.permissions().create(
+            fileId=file_id, body={'role': 'reader', 'type': 'anyone'}, fields='id'
+        ))
+        for file_id in file_ids
+    }, service)
+    return {file_id: result for file_id, result in results.items() if isinstance(result, Exception)}
+
+
+def bulk_info(file_ids, fields=FILE_FIELDS, service=None):
+    """Metadata of many files in batched calls; missing files map to their HttpError"""
+    service = service or drive_service()
+    return batch_execute({
+        file_id: (lambda file_id=file_id: service.files().get(fileId=file_id, fields=fields))
+        for file_id in file_ids
+    }, service)
+
+
+def bulk_delete(file_ids, service=None):
+    """
+    Delete many files in batched calls.
+
+    Returns a dict mapping each id to True, or to the error that kept it;
+    files that were already gone count as deleted.
+    """
+    service = service or drive_service()
+    results = batch_execute({
+        file_id: (lambda file_id=file_id: service.files().delete(fileId=file_id))
+        for file_id in file_ids
+    }, service)
+    return {
+        file_id: True if not isinstance(result, Exception) or _missing(result) else result
+        for file_id, result in results.items()
+    }
+
+
+def _missing(error):
+    return isinstance(error, HttpError) and error.resp.status == 404
@@ -0,0 +1,211 @@
+import email
+import http.client
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+import httplib2
+from googleapiclient.discovery import build
+
+UPLOAD_URI = 'https://www.googleapis.com/upload/drive/v3/files'
+
+
+class FakeHttp:
+    """httplib2.Http stand-in that sends every request to a FakeDrive"""
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        return self.drive.request(uri, method, body, headers or {})
+
+
+class FakeDrive:
+    """
+    In-process fake of the Google Drive v3 endpoints used by videos.drive.
+
+    Covers listing by name and parent, metadata, ranged media downloads,
+    resumable uploads, deletes, permissions and batch requests, enough to
+    run DriveStorage and videos.drive_bulk offline. ``latency`` seconds are
+    slept per HTTP round trip (a batch is one round trip) so throughput
+    can be benchmarked; ``fail_next`` queues error statuses to answer the
+    next calls with.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.files = {}
+        self.uploads = {}
+        self.round_trips = 0
+        self._failures = []
+        self._lock = threading.Lock()
+
+    def service(self):
+        """A Drive API client talking to this fake"""
+        return build('drive', 'v3', http=FakeHttp(self), static_discovery=True)
+
+    def fail_next(self, *statuses):
+        with self._lock:
+            self._failures.extend(statuses)
+
+    def request(self, uri, method, body, headers):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+        parsed = urlparse(uri)
+        if parsed.path.startswith('/batch/'):
+            return self._batch(body, headers)
+        status, response_headers, content = self._dispatch(method, parsed, body, headers)
+        response_headers['status'] = str(status)
+        if isinstance(content, str):
+            content = content.encode()
+        return httplib2.Response(response_headers), content
+
+    # Batches
+
+    def _batch(self, body, headers):
+        if isinstance(body, bytes):
+            body = body.decode()
+        message = email.message_from_string(f"content-type: {headers['content-type']}\r\n\r\n{body}")
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().partition('\n')
+            method, target, _ = request_line.split(' ')
+            sub_request = email.message_from_string(rest)
+            status, _, content = self._dispatch(
+                method, urlparse(target), sub_request.get_payload(), dict(sub_request.items())
+            )
+            if isinstance(content, bytes):
+                content = content.decode()
+            content_id = part['Content-ID'].replace('<', '<response-', 1)
+            parts.append(
+                f'--{boundary}\r\n'
+                f'Content-Type: application/http\r\n'
+                f'Content-ID: {content_id}\r\n\r\n'
+                f'HTTP/1.1 {status} {http.client.responses.get(status, "")}\r\n'
+                f'Content-Type: application/json\r\n\r\n'
+                f'{content}\r\n'
+            )
+        content = ''.join(parts) + f'--{boundary}--\r\n'
+        response = httplib2.Response({
+            'status': '200',
+            'content-type': f'multipart/mixed; boundary={boundary}',
+        })
+        return response, content.encode()
+
+    # Single calls
+
+    def _dispatch(self, method, parsed, body, headers):
+        with self._lock:
+            if self._failures:
+                status = self._failures.pop(0)
+                return status, {}, self._error(status, 'Injected failure')
+
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        path = parsed.path
+        with self._lock:
+            if path == '/upload/drive/v3/files':
+                if method == 'POST':
+                    return self._start_upload(body, query)
+                if method == 'PUT':
+                    return self._upload_chunk(body, headers, query)
+            if path == '/drive/v3/files' and method == 'GET':
+                return 200, {}, json.dumps({'files': [
+                    self._fields(f, query.get('fields')) for f in self._search(query.get('q', ''))
+                ]})
+
+            match = re.fullmatch(r'/drive/v3/files/([^/]+)(/permissions)?', path)
+            if not match or match.group(1) not in self.files:
+                return 404, {}, self._error(404, 'File not found')
+            file = self.files[match.group(1)]
+            if match.group(2) and method == 'POST':
+                file['permissions'].append(json.loads(body or '{}'))
+                return 200, {}, json.dumps({'id': 'anyoneWithLink'})
+            if method == 'DELETE':
+                del self.files[file['id']]
+                return 204, {}, ''
+            if method == 'GET' and query.get('alt') == 'media':
+                return self._download(file, headers)
+            if method == 'GET':
+                return 200, {}, json.dumps(self._fields(file, query.get('fields')))
+        return 400, {}, self._error(400, f'Unsupported call {method} {path}')
+
+    def _error(self, status, message):
+        return json.dumps({'error': {'code': status, 'message': message}})
+
+    def _fields(self, file, fields):
+        data = {
+            'id': file['id'],
+            'name': file['name'],
+            'size': str(len(file['data'])),
+            'modifiedTime': file['modifiedTime'],
+            'parents': file['parents'],
+        }
+        if fields and fields != '*':
+            fields = re.sub(r'^files\((.*)\)$', r'\1', fields)
+            data = {key: value for key, value in data.items() if key in fields.split(',')}
+        return data
+
+    def _search(self, q):
+        name = re.search(r"name = '((?:[^'\\]|\\.)*)'", q)
+        parent = re.search(r"'((?:[^'\\]|\\.)*)' in parents", q)
+        unescape = lambda value: re.sub(r'\\(.)', r'\1', value)
+        return [
+            file for file in self.files.values()
+            if (not name or file['name'] == unescape(name.group(1)))
+            and (not parent or unescape(parent.group(1)) in file['parents'])
+        ]
+
+    def _start_upload(self, body, query):
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {'meta': json.loads(body or '{}'), 'data': bytearray(), 'fields': query.get('fields')}
+        return 200, {'location': f'{UPLOAD_URI}?uploadType=resumable&upload_id={upload_id}'}, ''
+
+    def _upload_chunk(self, body, headers, query):
+        upload = self.uploads.get(query.get('upload_id'))
+        if upload is None:
+            return 404, {}, self._error(404, 'Upload session not found')
+        headers = {key.lower(): value for key, value in headers.items()}
+        match = re.fullmatch(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)', headers.get('content-range', ''))
+        if match is None:
+            return 400, {}, self._error(400, 'Bad Content-Range')
+        if match.group(1) is not None:
+            if int(match.group(1)) != len(upload['data']):
+                return 400, {}, self._error(400, 'Chunk does not continue the upload')
+            if hasattr(body, 'read'):
+                # Large chunks come as a slice of the upload stream
+                body = body.read()
+            upload['data'] += body if isinstance(body, bytes) else body.encode()
+        total = match.group(3)
+        if total == '*' or len(upload['data']) < int(total):
+            received = {'range': f"bytes=0-{len(upload['data']) - 1}"} if upload['data'] else {}
+            return 308, received, ''
+
+        del self.uploads[query['upload_id']]
+        file = {
+            'id': uuid.uuid4().hex,
+            'name': upload['meta'].get('name', 'Untitled'),
+            'parents': upload['meta'].get('parents', []),
+            'data': bytes(upload['data']),
+            'modifiedTime': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+            'permissions': [],
+        }
+        self.files[file['id']] = file
+        return 200, {}, json.dumps(self._fields(file, upload['fields']))
+
+    def _download(self, file, headers):
+        data = file['data']
+        headers = {key.lower(): value for key, value in headers.items()}
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', headers.get('range', ''))
+        if match is None:
+            return 200, {'content-length': str(len(data))}, data
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+        if start >= len(data):
+            return 416, {'content-range': f'bytes */{len(data)}'}, b''
+        return 206, {'content-range': f'bytes {start}-{end}/{len(data)}'}, data[start:end + 1]
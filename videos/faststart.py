@@ -0,0 +1,198 @@
+import logging
+import os
+import shutil
+import struct
+import tempfile
+from django.conf import settings
+from django.db.models import F
+from .media_store import media_storage, release_blob, store_local_file
+from .models import Video
+from .mp4 import MP4ParseError, iter_boxes, read_at
+from .upload_handlers import SNIFF_LENGTH, sniff_container
+
+logger = logging.getLogger(__name__)
+
+# moov is patched in memory; anything bigger is not a file we should touch
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+# Bytes copied at a time while rewriting
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# Boxes on the way from moov to the stco/co64 chunk offset tables
+OFFSET_PATH = {b'trak', b'mdia', b'minf', b'stbl'}
+
+
+class FastStartError(MP4ParseError):
+    """Raised when a file cannot be rewritten with moov first"""
+
+
+def _layout(f, size):
+    """
+    Return ``(insert_at, moov_start, moov_end)`` for a file whose moov
+    follows its media data, or None when moov already comes first or is
+    missing. ``insert_at`` is the start of the first mdat.
+    """
+    first_mdat = None
+    box_start = 0
+    for kind, payload, box_end in iter_boxes(f, 0, size):
+        if kind == 'mdat' and first_mdat is None:
+            first_mdat = box_start
+        elif kind == 'moov':
+            return None if first_mdat is None else (first_mdat, box_start, box_end)
+        box_start = box_end
+    return None
+
+
+def _patch_offsets(moov, start, end, shift):
+    """Rewrite every stco/co64 entry in ``moov[start:end]`` through ``shift``"""
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', moov, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', moov, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise FastStartError(f'Invalid box inside moov at {offset}')
+        body = offset + header
+
+        if kind in OFFSET_PATH:
+            _patch_offsets(moov, body, offset + size, shift)
+        elif kind in (b'stco', b'co64'):
+            entry, limit = ('>I', 0xFFFFFFFF) if kind == b'stco' else ('>Q', 0xFFFFFFFFFFFFFFFF)
+            width = struct.calcsize(entry)
+            count = struct.unpack_from('>I', moov, body + 4)[0]
+            if body + 8 + count * width > offset + size:
+                raise FastStartError(f'Truncated {kind.decode()} table')
+            for position in range(body + 8, body + 8 + count * width, width):
+                value = shift(struct.unpack_from(entry, moov, position)[0])
+                if value > limit:
+                    # Would need stco widened to co64, which resizes moov
+                    raise FastStartError('Chunk offsets overflow stco')
+                struct.pack_into(entry, moov, position, value)
+        offset += size
+
+
+def _copy(src, dst, start, end):
+    src.seek(start)
+    remaining = end - start
+    while remaining:
+        block = src.read(min(COPY_BLOCK_SIZE, remaining))
+        if not block:
+            raise FastStartError('Unexpected end of file')
+        dst.write(block)
+        remaining -= len(block)
+
+
+def faststart(src, dst, size=None):
+    """
+    Copy the MP4/MOV ``src`` to ``dst`` with moov moved before the media.
+
+    Only the chunk offset tables (stco/co64) change: every chunk that sat
+    between the first mdat and the old moov position moves forward by the
+    size of moov. Nothing is decoded. Media data is streamed through
+    ``COPY_BLOCK_SIZE`` blocks; only moov itself is held in memory.
+    Returns False, writing nothing, when ``src`` needs no rewrite.
+    """
+    if size is None:
+        size = src.seek(0, os.SEEK_END)
+    layout = _layout(src, size)
+    if layout is None:
+        return False
+    insert_at, moov_start, moov_end = layout
+    moov_size = moov_end - moov_start
+    if moov_size > MAX_MOOV_SIZE:
+        raise FastStartError(f'moov is {moov_size} bytes')
+
+    moov = bytearray(read_at(src, moov_start, moov_size))
+    header = 16 if struct.unpack_from('>I', moov)[0] == 1 else 8
+
+    def shift(chunk_offset):
+        if insert_at <= chunk_offset < moov_start:
+            return chunk_offset + moov_size
+        return chunk_offset
+
+    _patch_offsets(moov, header, moov_size, shift)
+    _copy(src, dst, 0, insert_at)
+    dst.write(moov)
+    _copy(src, dst, insert_at, moov_start)
+    _copy(src, dst, moov_end, size)
+    return True
+
+
+def _is_isobmff(f):
+    f.seek(0)
+    head = f.read(SNIFF_LENGTH)
+    f.seek(0)
+    return sniff_container(head) == 'isobmff'
+
+
+def needs_faststart(f):
+    """Whether ``f`` is an MP4/MOV with moov after its media; reads only box headers"""
+    try:
+        return _is_isobmff(f) and _layout(f, f.seek(0, os.SEEK_END)) is not None
+    except (MP4ParseError, struct.error):
+        return False
+
+
+def faststart_path(path):
+    """Rewrite the local file at ``path`` in place if it needs it; returns whether it did"""
+    temp_path = f'{path}.faststart'
+    try:
+        with open(path, 'rb') as src:
+            if not _is_isobmff(src):
+                return False
+            with open(temp_path, 'wb') as dst:
+                changed = faststart(src, dst)
+    except (MP4ParseError, struct.error) as e:
+        logger.warning(f"Could not fast-start {path}: {str(e)}")
+        changed = False
+    if changed:
+        os.replace(temp_path, path)
+    elif os.path.exists(temp_path):
+        os.remove(temp_path)
+    return changed
+
+
+def faststart_stored(video):
+    """
+    Rewrite a video's stored file with moov first and store the result by content.
+
+    The file is rewritten from a local copy and only replaces the stored
+    one once that succeeded. The row is changed with update(), keeping the
+    signal handlers out of it, and ``video`` is updated to match. Returns
+    whether the file was rewritten.
+    """
+    storage = media_storage()
+    temp_path = None
+    try:
+        with storage.open(video.video_file.name, 'rb') as stored:
+            if not needs_faststart(stored):
+                return False
+            fd, temp_path = tempfile.mkstemp(suffix='.part', dir=settings.FILE_UPLOAD_TEMP_DIR)
+            with os.fdopen(fd, 'wb') as temp:
+                stored.seek(0)
+                shutil.copyfileobj(stored, temp, COPY_BLOCK_SIZE)
+        if not faststart_path(temp_path):
+            return False
+
+        old_name, old_hash = video.video_file.name, video.content_hash
+        blob = store_local_file(temp_path, old_name)
+        Video.objects.filter(id=video.id).update(
+            video_file=blob.name,
+            file_size=blob.size,
+            content_hash=blob.sha256,
+            card_version=F('card_version') + 1,
+        )
+        video.video_file, video.file_size, video.content_hash = blob.name, blob.size, blob.sha256
+        if old_hash:
+            release_blob(old_hash)
+        elif not Video.objects.filter(video_file=old_name).exists():
+            # Files from before content-addressed storage
+            storage.delete(old_name)
+        return True
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,254 @@
+import bisect
+import struct
+from .mp4 import (
+    MP4ParseError, children, find_moov, iter_boxes, read_at, read_table, timescale_and_duration, track_samples
+)
+
+# Fragmented MP4 (ISO/IEC 14496-12 8.8) cut from a progressive file's sample
+# tables, as HLS wants it (RFC 8216 3.3): an initialization segment of ftyp
+# and a moov with empty sample tables and an mvex, then one moof + mdat per
+# media segment. Only the moof is built; the samples themselves are copied
+# from the original file.
+
+# Tracks carried over; hint, text and timecode tracks are dropped
+HANDLERS = (b'vide', b'soun')
+
+# Boxes of a trak left out of the initialization segment: track references
+# may point at dropped tracks, and user data has no use there
+DROPPED_TRAK_BOXES = ('tref', 'udta', 'meta')
+
+# Sample flags (8.8.3.1): sync samples depend on no other sample, the rest
+# depend on earlier ones and are marked non-sync
+SYNC_SAMPLE_FLAGS = 0x02000000
+NON_SYNC_SAMPLE_FLAGS = 0x01010000
+
+# tfhd: data offsets are relative to the start of the moof
+DEFAULT_BASE_IS_MOOF = 0x020000
+
+# trun: which fields are present
+DATA_OFFSET_PRESENT = 0x000001
+SAMPLE_DURATION_PRESENT = 0x000100
+SAMPLE_SIZE_PRESENT = 0x000200
+SAMPLE_FLAGS_PRESENT = 0x000400
+SAMPLE_COMPOSITION_OFFSET_PRESENT = 0x000800
+
+
+def box(kind, *parts):
+    payload = b''.join(parts)
+    return struct.pack('>I4s', 8 + len(payload), kind.encode()) + payload
+
+
+def full_box(kind, version, flags, *parts):
+    return box(kind, struct.pack('>I', version << 24 | flags), *parts)
+
+
+def _boxes(f, start, end):
+    """Like ``iter_boxes``, with where each box starts: ``(type, box_start, payload_start, box_end)``"""
+    box_start = start
+    for kind, payload, box_end in iter_boxes(f, start, end):
+        yield kind, box_start, payload, box_end
+        box_start = box_end
+
+
+def _rebuild(f, start, end, replace=None, only=None):
+    """
+    The boxes in ``[start, end)`` as bytes, copied unless named in ``replace``.
+
+    ``replace`` maps box types to functions of ``(payload_start, box_end)``
+    returning the new box, or None to drop it. With ``only``, other box
+    types are dropped too.
+    """
+    replace = replace or {}
+    parts = []
+    for kind, box_start, payload, box_end in _boxes(f, start, end):
+        if kind in replace:
+            rebuilt = replace[kind](payload, box_end)
+            if rebuilt is not None:
+                parts.append(rebuilt)
+        elif only is None or kind in only:
+            parts.append(read_at(f, box_start, box_end - box_start))
+    return b''.join(parts)
+
+
+def _read_track(f, start, end):
+    boxes = children(f, start, end)
+    if 'tkhd' not in boxes or 'mdia' not in boxes:
+        return None
+    mdia = children(f, *boxes['mdia'])
+    if not all(name in mdia for name in ('hdlr', 'mdhd', 'minf')):
+        return None
+    handler = read_at(f, mdia['hdlr'][0] + 8, 4)
+    stbl = children(f, *mdia['minf']).get('stbl')
+    if handler not in HANDLERS or not stbl:
+        return None
+    tables = children(f, *stbl)
+    if 'stsd' not in tables:
+        return None
+    samples = track_samples(f, tables)
+    if samples is None or not samples['sizes']:
+        return None
+    if any(description != 1 for _, _, description in read_table(f, tables['stsc'], '>III')):
+        # trex names a single sample description for the whole track
+        raise MP4ParseError('Tracks with several sample descriptions are not supported')
+
+    tkhd = boxes['tkhd'][0]
+    track_id_at = tkhd + (20 if read_at(f, tkhd, 1)[0] == 1 else 12)
+    return {
+        'id': struct.unpack('>I', read_at(f, track_id_at, 4))[0],
+        'handler': handler,
+        'timescale': timescale_and_duration(f, mdia['mdhd'][0])[0],
+        'trak': (start, end),
+        **samples,
+    }
+
+
+def read_movie(f, size):
+    """
+    The audio and video tracks of a progressive MP4, with their sample tables.
+
+    Returns a dict with the raw ``mvhd`` box and ``tracks``, each a dict of
+    its id, handler, timescale, the bounds of its trak box and the arrays
+    from ``track_samples``; or None when there is no video track with
+    sample tables to cut.
+    """
+    moov = find_moov(f, size)
+    if moov is None:
+        return None
+    mvhd = None
+    tracks = []
+    for kind, box_start, payload, box_end in _boxes(f, *moov):
+        if kind == 'mvhd':
+            mvhd = read_at(f, box_start, box_end - box_start)
+        elif kind == 'trak':
+            track = _read_track(f, payload, box_end)
+            if track is not None:
+                tracks.append(track)
+    if mvhd is None or not any(track['handler'] == b'vide' and track['timescale'] for track in tracks):
+        return None
+    return {'mvhd': mvhd, 'tracks': tracks}
+
+
+def plan_segments(movie, target_duration):
+    """
+    Split a movie into segments of about ``target_duration`` seconds.
+
+    Segments start on sync samples of the video track, so each can be
+    decoded on its own; other tracks are cut at the same times. Returns a
+    list of ``(duration, ranges)``, where ``ranges`` holds a ``(first, end)``
+    sample index range for each track of the movie.
+    """
+    tracks = movie['tracks']
+    video = next(track for track in tracks if track['handler'] == b'vide')
+    times = video['times']
+    timescale = video['timescale']
+    sync = video['sync'] if video['sync'] is not None else range(len(times))
+
+    starts = [0]
+    for index in sync:
+        if index > starts[-1] and times[index] - times[starts[-1]] >= target_duration * timescale:
+            starts.append(index)
+    ends = starts[1:] + [len(times)]
+    total = times[-1] + video['durations'][-1]
+
+    cuts = []
+    for track in tracks:
+        if track is video:
+            cuts.append(starts + [len(times)])
+            continue
+        # Cut at the first sample starting at or after each video cut
+        points = [
+            bisect.bisect_left(track['times'], times[index] * track['timescale'] / timescale)
+            for index in starts[1:]
+        ]
+        cuts.append([0] + points + [len(track['times'])])
+
+    result = []
+    for number, (start, end) in enumerate(zip(starts, ends)):
+        end_time = times[end] if end < len(times) else total
+        ranges = [(track_cuts[number], track_cuts[number + 1]) for track_cuts in cuts]
+        result.append(((end_time - times[start]) / timescale, ranges))
+    return result
+
+
+def init_segment(f, movie):
+    """ftyp and a moov whose tracks have empty sample tables and defaults in mvex"""
+    empty_tables = (
+        full_box('stts', 0, 0, struct.pack('>I', 0))
+        + full_box('stsc', 0, 0, struct.pack('>I', 0))
+        + full_box('stsz', 0, 0, struct.pack('>II', 0, 0))
+        + full_box('stco', 0, 0, struct.pack('>I', 0))
+    )
+
+    def stbl(payload, end):
+        return box('stbl', _rebuild(f, payload, end, only={'stsd'}), empty_tables)
+
+    def minf(payload, end):
+        return box('minf', _rebuild(f, payload, end, {'stbl': stbl}))
+
+    def mdia(payload, end):
+        return box('mdia', _rebuild(f, payload, end, {'minf': minf}))
+
+    dropped = {kind: (lambda payload, end: None) for kind in DROPPED_TRAK_BOXES}
+    traks = [box('trak', _rebuild(f, *track['trak'], {'mdia': mdia, **dropped})) for track in movie['tracks']]
+    mvex = box('mvex', *[
+        full_box('trex', 0, 0, struct.pack('>5I', track['id'], 1, 0, 0, 0)) for track in movie['tracks']
+    ])
+    ftyp = box('ftyp', b'iso6', struct.pack('>I', 0), b'iso6mp41')
+    return ftyp + box('moov', movie['mvhd'], *traks, mvex)
+
+
+def media_segment(movie, sequence, ranges):
+    """
+    One media segment: ``(header, runs, length)``.
+
+    ``header`` is the moof and the mdat box header, ``runs`` the
+    ``(offset, length)`` byte ranges of the original file that make up the
+    mdat payload, in order, and ``length`` the size of the whole segment.
+    Each track's samples are stored together, tracks in movie order.
+    """
+    tracks = [(track, first, end) for track, (first, end) in zip(movie['tracks'], ranges) if end > first]
+    data_size = sum(sum(track['sizes'][first:end]) for track, first, end in tracks)
+    if data_size + 8 > 0xFFFFFFFF:
+        raise MP4ParseError('Segment too large')
+
+    def moof(moof_size):
+        trafs = []
+        data_offset = moof_size + 8
+        for track, first, end in tracks:
+            composition = track['composition']
+            sync = track['sync']
+            sync = set(sync[bisect.bisect_left(sync, first):bisect.bisect_left(sync, end)]) if sync is not None else None
+            flags = DATA_OFFSET_PRESENT | SAMPLE_DURATION_PRESENT | SAMPLE_SIZE_PRESENT | SAMPLE_FLAGS_PRESENT
+            entries = []
+            for index in range(first, end):
+                sample_flags = SYNC_SAMPLE_FLAGS if sync is None or index in sync else NON_SYNC_SAMPLE_FLAGS
+                entry = struct.pack('>III', track['durations'][index], track['sizes'][index], sample_flags)
+                if composition is not None:
+                    entry += struct.pack('>i', composition[index])
+                entries.append(entry)
+            if composition is not None:
+                flags |= SAMPLE_COMPOSITION_OFFSET_PRESENT
+            trafs.append(box(
+                'traf',
+                full_box('tfhd', 0, DEFAULT_BASE_IS_MOOF, struct.pack('>I', track['id'])),
+                full_box('tfdt', 1, 0, struct.pack('>Q', track['times'][first])),
+                # Version 1: composition offsets are signed
+                full_box('trun', 1, flags, struct.pack('>Ii', end - first, data_offset), *entries),
+            ))
+            data_offset += sum(track['sizes'][first:end])
+        return box('moof', full_box('mfhd', 0, 0, struct.pack('>I', sequence)), *trafs)
+
+    # Data offsets count from the start of the moof, whose size does not
+    # depend on their values
+    header = moof(len(moof(0)))
+    header += struct.pack('>I4s', data_size + 8, b'mdat')
+
+    runs = []
+    for track, first, end in tracks:
+        for index in range(first, end):
+            offset, size = track['offsets'][index], track['sizes'][index]
+            if runs and runs[-1][0] + runs[-1][1] == offset:
+                runs[-1] = (runs[-1][0], runs[-1][1] + size)
+            else:
+                runs.append((offset, size))
+    return header, runs, len(header) + data_size
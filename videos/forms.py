@@ -2,6 +2,7 @@ from django import forms
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
 from .models import Video, Comment
+from .upload_handlers import EXTENSION_CONTAINERS, SNIFF_LENGTH, container_error, max_upload_size
 import os
 
 class VideoUploadForm(forms.ModelForm):
@@ -48,7 +49,9 @@ class VideoUploadForm(forms.ModelForm):
             }),
         }
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, upload_error=None, **kwargs):
+        # Set when videos.upload_handlers.VideoUploadHandler aborted the upload
+        self.upload_error = upload_error
         super().__init__(*args, **kwargs)
         self.fields['video_file'].validators.append(
             FileExtensionValidator(allowed_extensions=['mp4', 'avi', 'mov', 'wmv'])
@@ -57,23 +60,26 @@ class VideoUploadForm(forms.ModelForm):
         self.fields['external_url'].help_text = "Alternative to file upload - provide direct video URL"
     
     def clean_video_file(self):
+        if self.upload_error:
+            raise ValidationError(self.upload_error)
+        
         video_file = self.cleaned_data.get('video_file')
         if video_file:
-            # Check file size (100MB limit)
-            if video_file.size > 100 * 1024 * 1024:
-                raise ValidationError("File size cannot exceed 100MB.")
+            # Check file size; the upload handler normally stops oversized
+            # files before they are fully received
+            if video_file.size > max_upload_size():
+                raise ValidationError(f"File size cannot exceed {max_upload_size() // (1024 * 1024)}MB.")
             
-            # Check file extension
+            # Check the extension and that the content really is that
+            # container, rather than trusting the client's content type
             ext = os.path.splitext(video_file.name)[1].lower()
-            allowed_extensions = ['.mp4', '.avi', '.mov', '.wmv']
-            if ext not in allowed_extensions:
+            if ext not in EXTENSION_CONTAINERS:
                 raise ValidationError("Please upload a valid video file (MP4, AVI, MOV, WMV).")
-            
-            # Basic content type check
-            allowed_content_types = ['video/mp4', 'video/avi', 'video/quicktime', 'video/x-msvideo']
-            if hasattr(video_file, 'content_type') and video_file.content_type:
-                if video_file.content_type not in allowed_content_types:
-                    raise ValidationError("Invalid video file type. Please upload MP4, AVI, MOV, or WMV.")
+            head = video_file.read(SNIFF_LENGTH)
+            video_file.seek(0)
+            error = container_error(video_file.name, head)
+            if error:
+                raise ValidationError(error)
         
         return video_file
     
@@ -109,7 +115,7 @@ class VideoUploadForm(forms.ModelForm):
         video_file = cleaned_data.get('video_file')
         external_url = cleaned_data.get('external_url')
         
-        if not video_file and not external_url:
+        if not video_file and not external_url and not self.upload_error:
             raise ValidationError("Please either upload a video file or provide an external URL.")
         
         if video_file and external_url:
@@ -117,6 +123,14 @@ class VideoUploadForm(forms.ModelForm):
         
         return cleaned_data
 
+class VideoDetailsForm(forms.ModelForm):
+    """Video details sent when a resumable upload is opened"""
+    class Meta:
+        model = Video
+        fields = ['title', 'description', 'publisher', 'producer', 'genre', 'age_rating']
+    
+    clean_title = VideoUploadForm.clean_title
+
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
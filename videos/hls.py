@@ -0,0 +1,201 @@
+import logging
+import math
+import mimetypes
+import os
+import shutil
+import struct
+import tempfile
+from django.conf import settings
+from django.urls import reverse
+from video_sharing.cache import LocalLRUCache, get_or_compute
+from .fmp4 import init_segment, media_segment, plan_segments, read_movie
+from .mp4 import MP4ParseError
+from .streaming import RangeFile
+from .upload_handlers import SNIFF_LENGTH, sniff_container
+
+logger = logging.getLogger(__name__)
+
+# Parsed sample tables and segment plans, so each segment request does not
+# read the whole moov again; bounded by their size as well as their number
+movies = LocalLRUCache(
+    max_size=32,
+    timeout=300,
+    max_weight=settings.HLS_MOVIE_CACHE_BYTES,
+    weigh=lambda loaded: movie_weight(*loaded) if loaded else 0,
+)
+
+# Segments written out for the front-end server to send, see segment_file
+SEGMENT_PREFIX = 'hls'
+
+# Roughly what one entry of a segment plan costs in Python objects
+PLAN_ENTRY_BYTES = 200
+
+mimetypes.add_type('video/mp4', '.m4s')
+
+
+def _version(video):
+    return video.content_hash or video.video_file.name
+
+
+def movie_weight(movie, plan):
+    """Approximate size in bytes of a parsed movie and its segment plan"""
+    tables = ('times', 'durations', 'sizes', 'offsets', 'sync', 'composition')
+    weight = len(movie['mvhd']) + PLAN_ENTRY_BYTES * len(plan)
+    for track in movie['tracks']:
+        weight += sum(track[name].itemsize * len(track[name]) for name in tables if track[name] is not None)
+    return weight
+
+
+def load_movie(video, target_duration=None):
+    """
+    The parsed movie of a video's stored file and its segment plan.
+
+    Returns ``(movie, plan)`` (see videos.fmp4), or None when the file is
+    not an MP4 with sample tables for a video track. Raises
+    FileNotFoundError when the file is missing.
+    """
+    if target_duration is None:
+        target_duration = settings.HLS_SEGMENT_DURATION
+    key = (video.id, _version(video), target_duration)
+    found = movies.get_many([key])
+    if key in found:
+        return found[key]
+
+    result = None
+    with video.video_file.storage.open(video.video_file.name, 'rb') as f:
+        try:
+            if sniff_container(f.read(SNIFF_LENGTH)) == 'isobmff':
+                movie = read_movie(f, video.video_file.size)
+                if movie is not None:
+                    result = (movie, plan_segments(movie, target_duration))
+        except (MP4ParseError, struct.error) as e:
+            logger.warning(f"Could not segment video {video.pk} for HLS: {str(e)}")
+    movies.set_many({key: result})
+    return result
+
+
+def build_playlist(plan, init_uri, segment_uri):
+    """
+    HLS VOD media playlist of fragmented MP4 segments (RFC 8216 3.3).
+
+    ``init_uri`` is the initialization section (``EXT-X-MAP``) and
+    ``segment_uri(index)`` the URI of each media segment of ``plan``.
+    """
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:7',
+        f'#EXT-X-TARGETDURATION:{max(math.ceil(duration) for duration, _ in plan)}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+        '#EXT-X-INDEPENDENT-SEGMENTS',
+        f'#EXT-X-MAP:URI="{init_uri}"',
+    ]
+    for index, (duration, _) in enumerate(plan):
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(segment_uri(index))
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+def playlist_for(video):
+    """Build the playlist of a video's stored file, see ``build_playlist``"""
+    loaded = load_movie(video)
+    if loaded is None:
+        return None
+    duration = settings.HLS_SEGMENT_DURATION
+    query = f'?v={video.content_hash[:16]}' if video.content_hash else ''
+    return build_playlist(
+        loaded[1],
+        reverse('videos:video_hls_init', args=[video.id]) + query,
+        lambda index: reverse('videos:video_hls_segment', args=[video.id, duration, index]) + query,
+    )
+
+
+def cached_playlist(video):
+    """
+    The playlist of a video, cached under its file's content.
+
+    Segment URIs carry the content hash in the query string, so a CDN can
+    cache each segment for as long as it likes and a replaced file gets
+    new URLs. Returns None when the file cannot be segmented; raises
+    FileNotFoundError when it is missing.
+    """
+    return get_or_compute(
+        f'hls:{video.id}:{_version(video)}:{settings.HLS_SEGMENT_DURATION}',
+        lambda: playlist_for(video),
+        timeout=settings.HLS_PLAYLIST_CACHE_TIMEOUT,
+    )
+
+
+def init_for(video):
+    """Initialization segment of a video, or None when it cannot be segmented"""
+    loaded = load_movie(video)
+    if loaded is None:
+        return None
+    with video.video_file.storage.open(video.video_file.name, 'rb') as f:
+        return init_segment(f, loaded[0])
+
+
+def segment_for(video, index):
+    """
+    Media segment ``index`` of a video as ``(header, runs, length)``, see
+    videos.fmp4.media_segment; None when there is no such segment.
+    """
+    loaded = load_movie(video)
+    if loaded is None:
+        return None
+    movie, plan = loaded
+    if not 0 <= index < len(plan):
+        return None
+    return media_segment(movie, index + 1, plan[index][1])
+
+
+def segment_name(sha256, duration, index):
+    """Storage name of a written out media segment of the content with this hash"""
+    return f'{SEGMENT_PREFIX}/{sha256[:2]}/{sha256}/{duration}/{index}.m4s'
+
+
+def segment_file(video, index):
+    """
+    Storage name of media segment ``index`` of a video, written out on first use.
+
+    Lets MEDIA_DELIVERY hand segments to the front-end server like whole
+    files. Segments are keyed on the content hash, so they are cut once per
+    content and shared by every video with the same file; they are written
+    to a temporary file and renamed so a concurrent request never sees half
+    of one. Returns None when there is no such segment; raises
+    NotImplementedError for storages without local paths, and
+    FileNotFoundError when the video file is missing.
+    """
+    storage = video.video_file.storage
+    name = segment_name(video.content_hash, settings.HLS_SEGMENT_DURATION, index)
+    path = storage.path(name)
+    if os.path.exists(path):
+        return name
+    segment = segment_for(video, index)
+    if segment is None:
+        return None
+
+    header, runs, _ = segment
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.part', delete=False) as temp:
+        try:
+            temp.write(header)
+            with storage.open(video.video_file.name, 'rb') as f:
+                for offset, size in runs:
+                    shutil.copyfileobj(RangeFile(f, offset, size), temp)
+        except BaseException:
+            temp.close()
+            os.remove(temp.name)
+            raise
+    os.replace(temp.name, path)
+    return name
+
+
+def delete_segments(sha256, storage):
+    """Remove the written out segments of the content with this hash"""
+    try:
+        path = storage.path(f'{SEGMENT_PREFIX}/{sha256[:2]}/{sha256}')
+    except NotImplementedError:
+        return
+    shutil.rmtree(path, ignore_errors=True)
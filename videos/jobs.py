@@ -0,0 +1,174 @@
+import logging
+import os
+import random
+import socket
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Registered job functions by name, see ``job``
+registry = {}
+
+# Ready jobs looked at per claim attempt; several workers racing for the
+# head of the queue fall through to the next ones instead of retrying
+CLAIM_BATCH = 10
+
+
+class JobType:
+    def __init__(self, func, name, priority, max_attempts, visibility_timeout):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+
+    def __call__(self, **payload):
+        return self.func(**payload)
+
+
+def job(name, priority=0, max_attempts=None, visibility_timeout=None):
+    """
+    Register a function as a background job.
+
+    The function is called with the job's payload as keyword arguments and
+    must be safe to run more than once: a worker that dies or overruns
+    ``visibility_timeout`` seconds leaves the job to be picked up again.
+    Its return value, if JSON serializable, is kept as the job's result.
+    """
+    def register(func):
+        registry[name] = JobType(func, name, priority, max_attempts, visibility_timeout)
+        return registry[name]
+    return register
+
+
+def enqueue(name, payload=None, user=None, priority=None, delay=0):
+    """
+    Queue a registered job and return its row.
+
+    The row is written in the caller's transaction, so a job queued while
+    saving something only becomes visible to workers once that commits.
+    """
+    job_type = registry[name]
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        user=user,
+        priority=job_type.priority if priority is None else priority,
+        max_attempts=job_type.max_attempts or settings.JOB_MAX_ATTEMPTS,
+        available_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def claim(worker_id):
+    """
+    Take the most urgent ready job for ``worker_id``, or return None.
+
+    Claiming is a conditional UPDATE on the row's ``available_at``, which
+    only one worker can win. That needs no row locks, so it behaves the
+    same on SQLite as on PostgreSQL.
+    """
+    now = timezone.now()
+    ready = Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING], available_at__lte=now)
+    candidates = ready.order_by('-priority', 'available_at', 'id').values_list(
+        'id', 'name', 'available_at'
+    )[:CLAIM_BATCH]
+    for job_id, name, available_at in candidates:
+        job_type = registry.get(name)
+        timeout = getattr(job_type, 'visibility_timeout', None) or settings.JOB_VISIBILITY_TIMEOUT
+        claimed = Job.objects.filter(
+            id=job_id, status__in=[Job.QUEUED, Job.RUNNING], available_at=available_at
+        ).update(
+            status=Job.RUNNING,
+            locked_by=worker_id,
+            attempts=F('attempts') + 1,
+            available_at=now + timedelta(seconds=timeout),
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter after ``attempts`` failed runs"""
+    delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+    return random.uniform(delay / 2, delay)
+
+
+def run_job(job):
+    """
+    Run a claimed job and record the outcome; returns whether it succeeded.
+
+    Outcomes are only written while the job is still ours: if it overran
+    its visibility timeout and another worker took it over, that worker's
+    run is the one that counts.
+    """
+    mine = Job.objects.filter(id=job.id, locked_by=job.locked_by, attempts=job.attempts)
+    job_type = registry.get(job.name)
+    try:
+        if job_type is None:
+            raise LookupError(f'Unknown job {job.name}')
+        if job.attempts > job.max_attempts:
+            raise TimeoutError('Timed out on every attempt')
+        result = job_type(**job.payload)
+    except Exception as e:
+        logger.error(f"Job {job.id} ({job.name}) attempt {job.attempts} failed: {str(e)}")
+        if job_type is None or job.attempts >= job.max_attempts:
+            mine.update(status=Job.FAILED, last_error=str(e), finished_at=timezone.now())
+        else:
+            mine.update(
+                status=Job.QUEUED,
+                last_error=str(e),
+                available_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+            )
+        return False
+    mine.update(status=Job.DONE, result=result, last_error='', finished_at=timezone.now())
+    return True
+
+
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def work(worker_id, stop=None, once=False, poll_interval=None):
+    """
+    Claim and run jobs until ``stop`` is set, or the queue is empty with ``once``.
+
+    Returns the number of jobs run.
+    """
+    stop = stop or threading.Event()
+    if poll_interval is None:
+        poll_interval = settings.JOB_POLL_INTERVAL
+    count = 0
+    while not stop.is_set():
+        # Like a request: drop connections that broke or outlived CONN_MAX_AGE
+        close_old_connections()
+        job = claim(worker_id)
+        if job is None:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
+        count += 1
+    return count
+
+
+def run_pending():
+    """
+    Run every ready job in this thread and return how many ran.
+
+    For tests and one-off maintenance; unlike ``work`` it leaves the
+    database connection alone, so it can run inside a transaction.
+    """
+    count = 0
+    worker_id = worker_name()
+    while (job := claim(worker_id)) is not None:
+        run_job(job)
+        count += 1
+    return count
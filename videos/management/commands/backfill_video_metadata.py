@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from videos.models import Video
+from videos.mp4 import METADATA_FIELDS, apply_metadata
+
+class Command(BaseCommand):
+    help = 'Read duration, dimensions, codec and bitrate from uploaded MP4/MOV files'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-read every uploaded video, not only those missing a duration'
+        )
+    
+    def handle(self, *args, **options):
+        videos = Video.objects.exclude(Q(video_file='') | Q(video_file__isnull=True))
+        if not options['all']:
+            videos = videos.filter(duration__isnull=True)
+        
+        updated = skipped = 0
+        for video in videos.only('id', 'video_file', *METADATA_FIELDS).iterator():
+            try:
+                with video.video_file.open('rb') as f:
+                    found = apply_metadata(video, f, video.video_file.size)
+            except OSError as e:
+                self.stderr.write(f'Video {video.id}: {str(e)}')
+                found = False
+            if not found:
+                skipped += 1
+                continue
+            # update() keeps updated_at and the signal handlers out of it
+            Video.objects.filter(id=video.id).update(
+                **{field: getattr(video, field) for field in METADATA_FIELDS}
+            )
+            updated += 1
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Read metadata of {updated} videos ({skipped} skipped)')
+        )
@@ -0,0 +1,72 @@
+import io
+import os
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from videos.drive_bulk import bulk_delete, bulk_upload
+from videos.drive_fake import FakeDrive
+from videos.utils import GoogleDriveStorage
+
+class Command(BaseCommand):
+    help = 'Compare one-by-one and bulk Google Drive uploads against the in-process fake'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=50, help='Files to upload per run')
+        parser.add_argument('--size', type=int, default=256 * 1024, help='Bytes per file')
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.05,
+            help='Simulated seconds per HTTP round trip'
+        )
+        parser.add_argument('--workers', type=int, default=8, help='Upload threads for the bulk run')
+
+    def handle(self, *args, **options):
+        payload = os.urandom(options['size'])
+        count = options['files']
+
+        def report(label, drive, started, done):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{label:<10} {done / elapsed:8.1f} files/s  '
+                f'{done * len(payload) / elapsed / (1024 * 1024):8.2f} MB/s  '
+                f'{drive.round_trips} round trips'
+            )
+
+        with override_settings(GOOGLE_DRIVE_CHUNK_SIZE=max(256 * 1024, len(payload))):
+            # Baseline: the create + permission pair GoogleDriveStorage.upload_file makes
+            drive = FakeDrive(latency=options['latency'])
+            helper = GoogleDriveStorage(service=drive.service())
+            started = time.monotonic()
+            done = 0
+            for index in range(count):
+                path = self._temp_file(payload)
+                done += helper.upload_file(path, f'serial-{index}.mp4') is not None
+                os.remove(path)
+            report('serial', drive, started, done)
+
+            drive = FakeDrive(latency=options['latency'])
+            service = drive.service()
+            started = time.monotonic()
+            results = bulk_upload(
+                [(f'bulk-{index}.mp4', io.BytesIO(payload)) for index in range(count)],
+                public=True, service=service, workers=options['workers'],
+            )
+            report('bulk', drive, started, sum(isinstance(result, dict) for result in results))
+
+            started = time.monotonic()
+            trips = drive.round_trips
+            deleted = bulk_delete([result['id'] for result in results], service=service)
+            self.stdout.write(
+                f'{"delete":<10} {len(deleted) / (time.monotonic() - started):8.1f} files/s  '
+                f'{drive.round_trips - trips} round trips'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def _temp_file(self, payload):
+        fd, path = tempfile.mkstemp(suffix='.mp4')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        return path
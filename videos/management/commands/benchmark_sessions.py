@@ -0,0 +1,88 @@
+import threading
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+ENGINES = [
+    ('db', 'django.contrib.sessions.backends.db'),
+    ('low-write', 'video_sharing.sessions'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec of the database session engine and video_sharing.sessions, '
+        'both with SESSION_SAVE_EVERY_REQUEST, on the configured database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.create_user(username=f'bench-{uuid.uuid4().hex[:12]}', password=uuid.uuid4().hex)
+        session_keys = []
+        url = reverse('videos:api_user_status')
+        try:
+            for label, engine in ENGINES:
+                with override_settings(SESSION_ENGINE=engine, SESSION_SAVE_EVERY_REQUEST=True):
+                    clients = []
+                    for _ in range(options['threads']):
+                        client = Client()
+                        client.force_login(user)
+                        session_keys.append(client.session.session_key)
+                        clients.append(client)
+                    requests, writes, elapsed = self._run(clients, url, options['seconds'])
+                self.stdout.write(
+                    f'{label:<10} {requests / elapsed:8.1f} requests/s  '
+                    f'{writes} session writes for {requests} requests'
+                )
+        finally:
+            Session.objects.filter(session_key__in=session_keys).delete()
+            user.delete()
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def _run(self, clients, url, seconds):
+        """Hammer ``url`` from one thread per client; returns (requests, session writes, seconds)"""
+        totals = []
+        lock = threading.Lock()
+        ready = threading.Barrier(len(clients) + 1)
+        deadline = []
+
+        def client_loop(client):
+            requests = writes = 0
+
+            def count_writes(execute, sql, params, many, context):
+                nonlocal writes
+                if sql.startswith(('UPDATE "django_session"', 'INSERT INTO "django_session"')):
+                    writes += 1
+                return execute(sql, params, many, context)
+
+            try:
+                with connection.execute_wrapper(count_writes):
+                    ready.wait()
+                    while time.monotonic() < deadline[0]:
+                        client.get(url)
+                        requests += 1
+            finally:
+                connection.close()
+            with lock:
+                totals.append((requests, writes))
+
+        threads = [threading.Thread(target=client_loop, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        started = time.monotonic()
+        deadline.append(started + seconds)
+        ready.wait()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        return sum(r for r, _ in totals), sum(w for _, w in totals), elapsed
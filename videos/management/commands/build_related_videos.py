@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from videos.recommendations import build_related_videos
+
+class Command(BaseCommand):
+    help = 'Recompute the related videos rail from ratings, comments, genres and creators'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=10,
+            help='Number of related videos to keep per video'
+        )
+    
+    def handle(self, *args, **options):
+        count = build_related_videos(top_k=options['top_k'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Stored {count} related video links')
+        )
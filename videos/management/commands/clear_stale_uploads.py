@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from videos.uploads import discard, expired_sessions
+
+class Command(BaseCommand):
+    help = 'Delete resumable uploads that stopped receiving chunks, and their temp files'
+    
+    def handle(self, *args, **options):
+        cleared = 0
+        for session in expired_sessions().iterator():
+            discard(session)
+            cleared += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Cleared {cleared} stale uploads')
+        )
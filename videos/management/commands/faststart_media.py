@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from videos.faststart import faststart_stored, needs_faststart
+from videos.media_store import media_storage
+from videos.models import Video
+
+class Command(BaseCommand):
+    help = 'Rewrite stored MP4/MOV files so the moov box comes before the media data'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report which videos would be rewritten'
+        )
+    
+    def handle(self, *args, **options):
+        storage = media_storage()
+        videos = Video.objects.exclude(Q(video_file='') | Q(video_file__isnull=True))
+        rewritten = 0
+        
+        for video in videos.only('id', 'video_file', 'content_hash').iterator():
+            try:
+                if options['dry_run']:
+                    with storage.open(video.video_file.name, 'rb') as stored:
+                        if needs_faststart(stored):
+                            rewritten += 1
+                            self.stdout.write(f'Would rewrite video {video.id} ({video.video_file.name})')
+                elif faststart_stored(video):
+                    rewritten += 1
+            except OSError as e:
+                self.stderr.write(f'Video {video.id}: {str(e)}')
+        
+        verb = 'Would rewrite' if options['dry_run'] else 'Rewrote'
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {rewritten} videos with moov first')
+        )
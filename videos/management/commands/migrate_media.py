@@ -0,0 +1,140 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from videos.drive import DriveStorage
+from videos.media_transfer import ON_DRIVE, local_storage, move_to_drive, move_to_local
+from videos.models import MediaMigrationCheckpoint, Video
+
+# Seconds between progress lines
+REPORT_INTERVAL = 10
+
+
+class Command(BaseCommand):
+    help = 'Move video files from local storage to Google Drive or back, resuming where the last run stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('direction', choices=['drive', 'local'], help='Where to move the files to')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.GOOGLE_DRIVE_MAX_WORKERS,
+            help='Concurrent transfers (default: GOOGLE_DRIVE_MAX_WORKERS)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=100, help='Videos fetched per database query')
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint of an interrupted run and start from the first video'
+        )
+
+    def handle(self, *args, **options):
+        direction = options['direction']
+        try:
+            local_storage()
+        except ValueError as e:
+            raise CommandError(e)
+        drive = DriveStorage()
+
+        checkpoint, _ = MediaMigrationCheckpoint.objects.get_or_create(direction=direction)
+        if options['restart']:
+            checkpoint.last_video_id = 0
+            checkpoint.save()
+        elif checkpoint.last_video_id:
+            self.stdout.write(f'Resuming after video {checkpoint.last_video_id}')
+
+        if direction == 'drive':
+            videos = Video.objects.exclude(Q(video_file='') | Q(video_file__isnull=True))
+            move = move_to_drive
+        else:
+            videos = Video.objects.filter(ON_DRIVE)
+            move = move_to_local
+        videos = videos.filter(id__gt=checkpoint.last_video_id).order_by('id').only(
+            'id', 'video_file', 'external_url', 'file_size', 'content_hash'
+        )
+
+        def transfer(video):
+            try:
+                return move(video, drive)
+            finally:
+                connection.close()
+
+        started = last_report = time.monotonic()
+        moved = failed = transferred = 0
+        in_flight = {}
+        failed_ids = []
+        last_submitted = checkpoint.last_video_id
+        # Keep a bounded number of transfers queued so the queryset is
+        # consumed as workers free up instead of all at once
+        window = options['workers'] * 2
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            pages = self._pages(videos, options['chunk_size'])
+            exhausted = False
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < window:
+                    video = next(pages, None)
+                    if video is None:
+                        exhausted = True
+                    else:
+                        in_flight[pool.submit(transfer, video)] = last_submitted = video.id
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    video_id = in_flight.pop(future)
+                    try:
+                        size = future.result()
+                    except Exception as e:
+                        failed += 1
+                        failed_ids.append(video_id)
+                        self.stderr.write(f'Video {video_id}: {e}')
+                        continue
+                    if size is not None:
+                        moved += 1
+                        transferred += size
+
+                # Transfers finish out of order; everything below the oldest
+                # one still running (or failed) is done
+                pending = list(in_flight.values()) + failed_ids
+                last_id = min(pending) - 1 if pending else last_submitted
+                if last_id > checkpoint.last_video_id:
+                    checkpoint.last_video_id = last_id
+                    checkpoint.save(update_fields=['last_video_id', 'updated_at'])
+
+                if time.monotonic() - last_report >= REPORT_INTERVAL:
+                    last_report = time.monotonic()
+                    self._report(moved, transferred, last_report - started)
+
+        self._report(moved, transferred, time.monotonic() - started)
+        if failed:
+            raise CommandError(
+                f'{failed} videos failed; run again to retry them from video {checkpoint.last_video_id + 1}'
+            )
+        checkpoint.delete()
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} videos to {direction}'))
+
+    def _pages(self, videos, chunk_size):
+        """
+        Yield videos in id order, fetching ``chunk_size`` at a time.
+
+        Each page is a fresh query seeking past the last id rather than one
+        long-lived cursor: on SQLite an open read cursor keeps the workers
+        from committing their updates.
+        """
+        last_id = 0
+        while True:
+            page = list(videos.filter(id__gt=last_id)[:chunk_size])
+            if not page:
+                return
+            yield from page
+            last_id = page[-1].id
+
+    def _report(self, files, size, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        self.stdout.write(
+            f'{files} files, {size / (1024 * 1024):.1f} MB in {elapsed:.1f}s: '
+            f'{files / elapsed:.2f} files/s, {size / elapsed / (1024 * 1024):.2f} MB/s'
+        )
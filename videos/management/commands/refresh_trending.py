@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from videos.models import Video
+from videos.trending import refresh_hotness
+
+class Command(BaseCommand):
+    help = 'Recompute trending hotness scores for videos whose engagement changed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of videos to read and write per batch'
+        )
+        parser.add_argument(
+            '--include-inactive',
+            action='store_true',
+            help='Also rescore inactive videos'
+        )
+    
+    def handle(self, *args, **options):
+        videos = Video.objects.all()
+        if not options['include_inactive']:
+            videos = videos.filter(is_active=True)
+        
+        updated = refresh_hotness(videos, batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Updated hotness for {updated} videos')
+        )
@@ -0,0 +1,81 @@
+import multiprocessing
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from videos.jobs import work, worker_name
+
+
+def _thread_worker(index, stop, once, counts):
+    try:
+        counts[index] = work(worker_name(index), stop, once)
+    finally:
+        connection.close()
+
+
+def _process_worker(index, stop, once):
+    work(worker_name(index), stop, once)
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs (upload processing and friends) from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.JOB_WORKERS,
+            help='Number of workers (default: JOB_WORKERS)'
+        )
+        parser.add_argument(
+            '--processes',
+            action='store_true',
+            help='Run workers as forked processes instead of threads, for CPU-bound jobs'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no job is ready instead of polling for more'
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        once = options['once']
+        kind = 'processes' if options['processes'] else 'threads'
+        self.stdout.write(f'Starting {workers} worker {kind}')
+
+        if options['processes']:
+            # Children must not share the parent's database connection
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            stop = context.Event()
+            pool = [
+                context.Process(target=_process_worker, args=(index, stop, once), daemon=True)
+                for index in range(workers)
+            ]
+        else:
+            stop = threading.Event()
+            counts = [0] * workers
+            pool = [
+                threading.Thread(target=_thread_worker, args=(index, stop, once, counts), daemon=True)
+                for index in range(workers)
+            ]
+
+        for worker in pool:
+            worker.start()
+        try:
+            for worker in pool:
+                # Short joins keep Ctrl-C responsive
+                while worker.is_alive():
+                    worker.join(1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping; letting running jobs finish')
+            stop.set()
+            for worker in pool:
+                worker.join()
+
+        if not options['processes']:
+            self.stdout.write(self.style.SUCCESS(f'Workers stopped after {sum(counts)} jobs'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Workers stopped'))
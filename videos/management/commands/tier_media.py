@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from videos.tiering import retier
+
+
+class Command(BaseCommand):
+    help = 'Queue moves of videos between local storage (hot) and Google Drive (cold) by recent views'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the moves that would be queued'
+        )
+
+    def handle(self, *args, **options):
+        promote, demote = retier(dry_run=options['dry_run'])
+        verb = 'Would queue' if options['dry_run'] else 'Queued'
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {len(promote)} videos to local storage and {len(demote)} to Google Drive')
+        )
@@ -0,0 +1,123 @@
+import hashlib
+import os
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .hls import delete_segments
+from .models import MediaBlob, Video
+
+# Blobs live at videos/ab/cd/abcd....ext
+BLOB_PREFIX = 'videos'
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def media_storage():
+    return Video._meta.get_field('video_file').storage
+
+
+def blob_name(sha256, filename):
+    """Storage name of the content with this hash, sharded on its first two bytes"""
+    ext = os.path.splitext(filename)[1].lower()
+    return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+
+def hash_file(file):
+    """SHA-256 of a file object, read in chunks from the start"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def acquire_blob(sha256, size, filename, write):
+    """
+    Take a reference to the blob with this hash and return it.
+
+    Known content only gets its ``ref_count`` bumped. New content is stored
+    by calling ``write(name)``, which must put it at ``name`` in the media
+    storage and return the name used. Since names are derived from the
+    content, a file already at ``name`` (left by a rolled back upload, say)
+    is reused as is.
+    """
+    storage = media_storage()
+    with transaction.atomic():
+        if MediaBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1):
+            return MediaBlob.objects.get(sha256=sha256)
+
+        name = blob_name(sha256, filename)
+        if not storage.exists(name):
+            name = write(name)
+        try:
+            with transaction.atomic():
+                return MediaBlob.objects.create(sha256=sha256, name=name, size=size, ref_count=1)
+        except IntegrityError:
+            # The same content was stored concurrently; keep theirs
+            blob = MediaBlob.objects.get(sha256=sha256)
+            if blob.name != name:
+                storage.delete(name)
+            MediaBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+            blob.ref_count += 1
+            return blob
+
+
+def store_upload(uploaded_file):
+    """Store an uploaded file by content and return its blob"""
+    sha256 = getattr(uploaded_file, 'sha256', None) or hash_file(uploaded_file)
+    uploaded_file.seek(0)
+    return acquire_blob(
+        sha256, uploaded_file.size, uploaded_file.name,
+        lambda name: media_storage().save(name, uploaded_file),
+    )
+
+
+def store_local_file(path, filename):
+    """
+    Store a finished local file by content and return its blob.
+
+    On local storage the file is renamed into place instead of copied.
+    The file at ``path`` is gone afterwards either way.
+    """
+    storage = media_storage()
+
+    def write(name):
+        try:
+            target = storage.path(name)
+        except NotImplementedError:
+            with open(path, 'rb') as source:
+                return storage.save(name, File(source))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        file_move_safe(path, target)
+        return name
+
+    with open(path, 'rb') as source:
+        sha256 = hash_file(source)
+    blob = acquire_blob(sha256, os.path.getsize(path), filename, write)
+    if os.path.exists(path):
+        os.remove(path)
+    return blob
+
+
+def release_blob(sha256):
+    """
+    Drop one reference to a blob, deleting the file and any HLS segments
+    written out from it with the last one.
+
+    The file is removed only after the transaction commits, and only if no
+    upload has brought the same content back in the meantime.
+    """
+    with transaction.atomic():
+        MediaBlob.objects.filter(sha256=sha256, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        blob = MediaBlob.objects.select_for_update().filter(sha256=sha256, ref_count=0).first()
+        if blob is None:
+            return
+        blob.delete()
+
+        def delete_file():
+            if not MediaBlob.objects.filter(sha256=sha256).exists():
+                media_storage().delete(blob.name)
+                delete_segments(sha256, media_storage())
+        transaction.on_commit(delete_file)
@@ -0,0 +1,121 @@
+import os
+import tempfile
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F, Q
+from .drive import DriveStorage, drive_file_id
+from .media_store import media_storage, release_blob, store_local_file
+from .models import Video
+
+# A video is either stored locally, with ``video_file`` set and served by
+# stream_video, or on Drive, with ``video_file`` empty and ``external_url``
+# pointing at its Drive file. These move it between the two; each copies
+# the file in chunks first and then switches the row over in one
+# transaction, so an interrupted move leaves the video where it was.
+# ``content_hash`` is only set while the video holds a reference to a
+# local blob, so deleting or replacing a Drive video releases nothing.
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+ON_DRIVE = (Q(video_file='') | Q(video_file__isnull=True)) & Q(external_url__contains='drive.google.com/file/d/')
+
+
+def local_storage():
+    """The media storage, which is where the local copies live"""
+    storage = media_storage()
+    if not isinstance(storage, FileSystemStorage):
+        raise ValueError('Moving media needs the default storage to be local')
+    return storage
+
+
+def _release_local(video, name):
+    if video.content_hash:
+        release_blob(video.content_hash)
+    else:
+        # Files from before content-addressed storage
+        def delete_file():
+            if not Video.objects.filter(video_file=name).exists():
+                local_storage().delete(name)
+        transaction.on_commit(delete_file)
+
+
+def move_to_drive(video, drive=None):
+    """
+    Move a local video's file to Drive and return the bytes uploaded.
+
+    The Drive file keeps the storage name, so content that is already
+    there (another video with the same hash) is not uploaded again. The
+    row's blob reference is released and its ``content_hash`` cleared in
+    the same transaction that points it at Drive. Returns
+    None when the video was not local any more by the time it was switched.
+    """
+    drive = drive or DriveStorage()
+    storage = local_storage()
+    name = video.video_file.name
+    uploaded = 0
+    drive_name = name
+    if not drive.exists(name):
+        with storage.open(name, 'rb') as f:
+            drive_name = drive.save(name, f)
+            uploaded = f.size
+    drive.share(drive_name)
+    url = drive.url(drive_name)
+
+    with transaction.atomic():
+        switched = Video.objects.filter(id=video.id, video_file=name).update(
+            video_file='', external_url=url, content_hash='', card_version=F('card_version') + 1
+        )
+        if not switched:
+            return None
+        _release_local(video, name)
+    video.video_file, video.external_url, video.content_hash = None, url, ''
+    return uploaded
+
+
+def move_to_local(video, drive=None):
+    """
+    Move a video stored on Drive back to local storage and return the bytes downloaded.
+
+    The download is hashed and stored by content, so content still stored
+    locally for another video is referenced rather than kept twice. The
+    Drive file is deleted once no video points
+    at it. Returns None when the video was not on Drive any more by the
+    time it was switched.
+    """
+    drive = drive or DriveStorage()
+    local_storage()  # refuse before downloading anything
+    url = video.external_url
+    with drive.open_id(drive_file_id(url)) as source:
+        drive_name = source.name
+        # Downloaded outside any transaction, then hashed and moved into place
+        fd, temp_path = tempfile.mkstemp(suffix='.part', dir=settings.FILE_UPLOAD_TEMP_DIR)
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b''):
+                    temp.write(block)
+            downloaded = source.size
+            blob = store_local_file(temp_path, drive_name)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    with transaction.atomic():
+        switched = Video.objects.filter(ON_DRIVE, id=video.id, external_url=url).update(
+            video_file=blob.name,
+            external_url=None,
+            file_size=blob.size,
+            content_hash=blob.sha256,
+            card_version=F('card_version') + 1,
+        )
+        if not switched:
+            release_blob(blob.sha256)
+            return None
+
+        def delete_drive_copy():
+            if not Video.objects.filter(external_url=url).exists():
+                drive.delete(drive_name)
+        transaction.on_commit(delete_drive_copy)
+    video.video_file, video.external_url = blob.name, None
+    video.file_size, video.content_hash = blob.size, blob.sha256
+    return downloaded
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Video = apps.get_model('videos', 'Video')
+    Comment = apps.get_model('videos', 'Comment')
+    VideoRating = apps.get_model('videos', 'VideoRating')
+
+    def per_video(queryset, aggregate):
+        return Coalesce(Subquery(
+            queryset.filter(video=OuterRef('pk'))
+            .values('video')
+            .annotate(value=aggregate)
+            .values('value')
+        ), 0)
+
+    Video.objects.update(
+        comments_count=per_video(Comment.objects.filter(is_active=True), Count('id')),
+        ratings_count=per_video(VideoRating.objects.all(), Count('id')),
+        rating_sum=per_video(VideoRating.objects.all(), Sum('rating')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='ratings_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
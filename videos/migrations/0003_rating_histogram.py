@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_histogram(apps, schema_editor):
+    Video = apps.get_model('videos', 'Video')
+    VideoRating = apps.get_model('videos', 'VideoRating')
+
+    def stars_count(stars):
+        return Coalesce(Subquery(
+            VideoRating.objects.filter(video=OuterRef('pk'), rating=stars)
+            .values('video')
+            .annotate(value=Count('id'))
+            .values('value')
+        ), 0)
+
+    Video.objects.update(**{
+        f'rating_{stars}_count': stars_count(stars) for stars in range(1, 6)
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0002_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0003_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['video', '-created_at'], name='comment_video_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='video_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['genre', '-created_at', '-id'], name='video_active_genre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['creator', '-created_at', '-id'], name='video_creator_active_idx'),
+        ),
+    ]
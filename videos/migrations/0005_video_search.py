@@ -0,0 +1,90 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Full-text index over title, description and creator username, keyed by
+# video id. Triggers keep it in step with every write path, including
+# queryset.update(), and an FTS5-less SQLite simply skips it. Migrations
+# that rebuild videos_video drop them; videos.search recreates them after
+# every migrate.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE videos_video_fts USING fts5(
+        title, description, creator,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER videos_video_fts_insert AFTER INSERT ON videos_video BEGIN
+        INSERT INTO videos_video_fts (rowid, title, description, creator)
+        SELECT new.id, new.title, new.description, username
+        FROM users_customuser WHERE id = new.creator_id;
+    END
+    """,
+    """
+    CREATE TRIGGER videos_video_fts_update
+    AFTER UPDATE OF title, description, creator_id ON videos_video BEGIN
+        DELETE FROM videos_video_fts WHERE rowid = old.id;
+        INSERT INTO videos_video_fts (rowid, title, description, creator)
+        SELECT new.id, new.title, new.description, username
+        FROM users_customuser WHERE id = new.creator_id;
+    END
+    """,
+    """
+    CREATE TRIGGER videos_video_fts_delete AFTER DELETE ON videos_video BEGIN
+        DELETE FROM videos_video_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER videos_video_fts_creator
+    AFTER UPDATE OF username ON users_customuser BEGIN
+        UPDATE videos_video_fts SET creator = new.username
+        WHERE rowid IN (SELECT id FROM videos_video WHERE creator_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO videos_video_fts (rowid, title, description, creator)
+    SELECT v.id, v.title, v.description, u.username
+    FROM videos_video v JOIN users_customuser u ON u.id = v.creator_id
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS videos_video_fts_creator',
+    'DROP TRIGGER IF EXISTS videos_video_fts_delete',
+    'DROP TRIGGER IF EXISTS videos_video_fts_update',
+    'DROP TRIGGER IF EXISTS videos_video_fts_insert',
+    'DROP TABLE IF EXISTS videos_video_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+        except OperationalError:
+            return
+        cursor.execute('DROP TABLE temp.fts5_probe')
+        for sql in CREATE_SQL:
+            cursor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_query_indexes'),
+        ('videos', '0004_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:25
+
+import math
+from django.conf import settings
+from django.db import migrations, models
+
+# videos.trending as of this migration, copied so later changes there
+# cannot alter it
+HOTNESS_WEIGHTS = {
+    'views': 1,
+    'likes': 4,
+    'comments_count': 6,
+    'rating_sum': 2,
+}
+
+
+def hotness_score(created_at, **engagement):
+    decay_seconds = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * 3600 / math.log(2)
+    weighted = sum(weight * (engagement.get(field) or 0) for field, weight in HOTNESS_WEIGHTS.items())
+    return math.log1p(max(weighted, 0)) + created_at.timestamp() / decay_seconds
+
+
+def drop_search_triggers(apps, schema_editor):
+    # SQLite rebuilds videos_video to add columns, and cannot rename the
+    # rebuilt table while the username trigger from 0005 refers to it.
+    # videos.search.ensure_search_triggers recreates them after migrate.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for trigger in ('creator', 'delete', 'update', 'insert'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS videos_video_fts_{trigger}')
+
+
+def backfill_hotness(apps, schema_editor):
+    Video = apps.get_model('videos', 'Video')
+    videos = []
+    for row in Video.objects.values('id', 'created_at', *HOTNESS_WEIGHTS).iterator():
+        video_id, created_at = row.pop('id'), row.pop('created_at')
+        videos.append(Video(id=video_id, hotness=hotness_score(created_at, **row)))
+    Video.objects.bulk_update(videos, ['hotness'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0005_video_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='video',
+            name='hotness',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-hotness', '-id'], name='video_active_hotness_idx'),
+        ),
+        migrations.RunPython(backfill_hotness, migrations.RunPython.noop),
+    ]
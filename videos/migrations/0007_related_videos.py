@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0006_video_hotness'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedVideo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='videos.video')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='videos.video')),
+            ],
+            options={
+                'ordering': ['video', 'rank'],
+                'unique_together': {('video', 'rank')},
+            },
+        ),
+    ]
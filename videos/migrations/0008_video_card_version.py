@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0007_related_videos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='card_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0010_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='bitrate',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='video_codec',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0012_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaMigrationCheckpoint',
+            fields=[
+                ('direction', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('last_video_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
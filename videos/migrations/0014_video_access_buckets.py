@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0013_media_migration_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoAccessBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.IntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('video', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='access_buckets', to='videos.video')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='video_access_bucket_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='videoaccessbucket',
+            constraint=models.UniqueConstraint(fields=('video', 'bucket'), name='video_access_bucket_unique'),
+        ),
+    ]
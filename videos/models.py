@@ -1,10 +1,19 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 import os
+import re
+import uuid
 
 User = get_user_model()
 
+# Links to files on Google Drive, as made by videos.drive.DriveStorage.url()
+DRIVE_FILE_URL = re.compile(r'drive\.google\.com/file/d/([\w-]+)')
+
 def video_upload_path(instance, filename):
     return f'videos/{instance.creator.username}/{filename}'
 
@@ -43,28 +52,93 @@ class Video(models.Model):
     # Metadata
     duration = models.DurationField(blank=True, null=True)
     file_size = models.BigIntegerField(blank=True, null=True)
+    # Read from the file's moov box on upload, see videos.mp4
+    width = models.PositiveIntegerField(blank=True, null=True)
+    height = models.PositiveIntegerField(blank=True, null=True)
+    video_codec = models.CharField(max_length=16, blank=True)
+    bitrate = models.PositiveIntegerField(blank=True, null=True)  # bits per second
+    # SHA-256 of the uploaded file, which is stored once per content, see
+    # videos.media_store
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     
     # Engagement
     views = models.PositiveIntegerField(default=0)
     likes = models.PositiveIntegerField(default=0)
     dislikes = models.PositiveIntegerField(default=0)
     
+    # Denormalized counters, maintained by videos.signals
+    comments_count = models.PositiveIntegerField(default=0)
+    ratings_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    
+    # Precomputed trending score, see videos.trending
+    hotness = models.FloatField(default=0)
+    
+    # Bumped by updates that bypass save(), see videos.cards
+    card_version = models.PositiveIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     
     class Meta:
         ordering = ['-created_at']
+        # Feed queries filter on is_active and seek on (created_at, id). The
+        # indexes are partial on is_active because SQLite compiles the filter
+        # to a bare column test that cannot drive an index prefix.
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=Q(is_active=True),
+                name='video_active_created_idx',
+            ),
+            models.Index(
+                fields=['genre', '-created_at', '-id'],
+                condition=Q(is_active=True),
+                name='video_active_genre_idx',
+            ),
+            models.Index(
+                fields=['creator', '-created_at', '-id'],
+                condition=Q(is_active=True),
+                name='video_creator_active_idx',
+            ),
+            models.Index(
+                fields=['-hotness', '-id'],
+                condition=Q(is_active=True),
+                name='video_active_hotness_idx',
+            ),
+        ]
     
     def __str__(self):
         return self.title
     
     @property
     def video_url(self):
+        # The row says which storage tier holds the file, see videos.tiering
         if self.video_file:
-            return self.video_file.url
+            # Served by videos.views.stream_video, which supports seeking
+            return reverse('videos:stream_video', args=[self.id])
+        match = DRIVE_FILE_URL.search(self.external_url or '')
+        if match:
+            # Cold tier: Drive serves the file itself rather than its viewer page
+            return f'https://drive.google.com/uc?export=download&id={match.group(1)}'
         return self.external_url
     
+    @property
+    def average_rating(self):
+        if self.ratings_count:
+            return self.rating_sum / self.ratings_count
+        return 0
+    
+    @property
+    def rating_distribution(self):
+        return {stars: getattr(self, f'rating_{stars}_count') for stars in range(1, 6)}
+    
     def get_file_size_mb(self):
         if self.file_size:
             return round(self.file_size / (1024 * 1024), 2)
@@ -79,6 +153,13 @@ class Comment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['video', '-created_at'],
+                condition=Q(is_active=True),
+                name='comment_video_active_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Comment by {self.user.username} on {self.video.title}"
@@ -102,3 +183,140 @@ class VideoRating(models.Model):
     
     def __str__(self):
         return f"{self.user.username} rated {self.video.title}: {self.rating}"
+
+class RelatedVideo(models.Model):
+    """Precomputed nearest neighbours of a video, see videos.recommendations"""
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        ordering = ['video', 'rank']
+        unique_together = ('video', 'rank')
+    
+    def __str__(self):
+        return f"{self.video_id} -> {self.related_id} (#{self.rank})"
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress, see videos.uploads.
+
+    Chunks are appended to a temp file under RESUMABLE_UPLOAD_DIR; the video
+    details given when the session was opened are kept in ``metadata``
+    until the upload is finalized into a Video.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    metadata = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size}) by {self.user.username}"
+    
+    @property
+    def temp_path(self):
+        return os.path.join(settings.RESUMABLE_UPLOAD_DIR, f'{self.id}.part')
+
+class MediaBlob(models.Model):
+    """
+    One stored file, addressed by the SHA-256 of its content.
+
+    ``ref_count`` is the number of videos using it; the file is deleted
+    when the last one goes. See videos.media_store.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+class Job(models.Model):
+    """
+    A unit of background work, run by ``manage.py run_workers``; see videos.jobs.
+
+    Ready jobs are those queued or running with ``available_at`` in the
+    past. A worker claiming a job pushes ``available_at`` out by the job's
+    visibility timeout, so a job whose worker died becomes ready again;
+    a failed attempt pushes it out by the retry backoff.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)  # higher runs first
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-priority', 'available_at'],
+                condition=Q(status__in=['queued', 'running']),
+                name='job_ready_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+class MediaMigrationCheckpoint(models.Model):
+    """
+    How far ``manage.py migrate_media`` got moving files in one direction.
+
+    Every video up to ``last_video_id`` has been handled, so an interrupted
+    run picks up after it. Removed when a run finishes.
+    """
+    direction = models.CharField(max_length=10, primary_key=True)
+    last_video_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"to {self.direction} after video {self.last_video_id}"
+
+class VideoAccessBucket(models.Model):
+    """
+    Views of a video in one time slot of the tiering window; see videos.tiering.
+
+    ``bucket`` numbers slots of TIER_BUCKET_MINUTES since the epoch. There
+    is no database constraint on ``video`` so buffered views of a deleted
+    video can still be written; slots past the window are pruned.
+    """
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, db_constraint=False, related_name='access_buckets')
+    bucket = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['video', 'bucket'], name='video_access_bucket_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket'], name='video_access_bucket_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.video_id} @ {self.bucket}: {self.count}"
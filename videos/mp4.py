@@ -0,0 +1,263 @@
+import logging
+import os
+import struct
+from array import array
+from datetime import timedelta
+from .upload_handlers import SNIFF_LENGTH, sniff_container
+
+logger = logging.getLogger(__name__)
+
+# Boxes looked at per container level before giving up on a malformed file
+MAX_BOXES = 4096
+
+# Video fields set by ``apply_metadata``
+METADATA_FIELDS = ['duration', 'width', 'height', 'video_codec', 'bitrate']
+
+
+class MP4ParseError(ValueError):
+    """Raised when a file is not a well-formed ISO base media file"""
+
+
+def read_at(f, offset, length):
+    f.seek(offset)
+    data = f.read(length)
+    if len(data) < length:
+        raise MP4ParseError('Unexpected end of file')
+    return data
+
+
+def iter_boxes(f, start, end):
+    """
+    Yield ``(type, payload_start, box_end)`` for the boxes in ``[start, end)``.
+
+    Only the 8 or 16 header bytes of each box are read; payloads such as
+    ``mdat`` are skipped with a seek.
+    """
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + 8 > end:
+            return
+        size, kind = struct.unpack('>I4s', read_at(f, offset, 8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', read_at(f, offset + 8, 8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise MP4ParseError(f'Invalid size for box at {offset}')
+        yield kind.decode('latin-1'), offset + header_size, min(offset + size, end)
+        offset += size
+    raise MP4ParseError('Too many boxes')
+
+
+def children(f, start, end):
+    """Map of the first box of each type directly inside ``[start, end)``"""
+    boxes = {}
+    for kind, payload, box_end in iter_boxes(f, start, end):
+        boxes.setdefault(kind, (payload, box_end))
+    return boxes
+
+
+def timescale_and_duration(f, payload):
+    """Timescale and duration from an ``mvhd`` or ``mdhd`` payload"""
+    version = read_at(f, payload, 1)[0]
+    if version == 1:
+        return struct.unpack('>IQ', read_at(f, payload + 20, 12))
+    return struct.unpack('>II', read_at(f, payload + 12, 8))
+
+
+def _track(f, start, end):
+    """Handler type, duration in seconds, size and codec of a ``trak``"""
+    boxes = children(f, start, end)
+    track = {'handler': None, 'duration': 0, 'width': None, 'height': None, 'codec': ''}
+
+    if 'tkhd' in boxes:
+        payload = boxes['tkhd'][0]
+        # Width and height are 16.16 fixed point at the end of the header
+        offset = 88 if read_at(f, payload, 1)[0] == 1 else 76
+        width, height = struct.unpack('>II', read_at(f, payload + offset, 8))
+        track['width'], track['height'] = width >> 16, height >> 16
+
+    if 'mdia' not in boxes:
+        return track
+    mdia = children(f, *boxes['mdia'])
+    if 'hdlr' in mdia:
+        track['handler'] = read_at(f, mdia['hdlr'][0] + 8, 4).decode('latin-1')
+    if 'mdhd' in mdia:
+        timescale, duration = timescale_and_duration(f, mdia['mdhd'][0])
+        if timescale:
+            track['duration'] = duration / timescale
+
+    stbl = None
+    if 'minf' in mdia:
+        stbl = children(f, *mdia['minf']).get('stbl')
+    if stbl:
+        stsd = children(f, *stbl).get('stsd')
+        if stsd and stsd[1] - stsd[0] >= 16:
+            # Skip version/flags and entry count to the first sample entry
+            track['codec'] = read_at(f, stsd[0] + 12, 4).decode('latin-1').strip()
+    return track
+
+
+def read_table(f, box, fmt, skip=0):
+    """
+    Entries of a sample table box such as stts, stss, stsc or stco.
+
+    The payload is version/flags, ``skip`` more bytes, an entry count and
+    then the entries, unpacked with ``fmt``.
+    """
+    payload, box_end = box
+    count = struct.unpack('>I', read_at(f, payload + 4 + skip, 4))[0]
+    width = struct.calcsize(fmt)
+    start = payload + 8 + skip
+    if start + count * width > box_end:
+        raise MP4ParseError('Truncated sample table')
+    return list(struct.iter_unpack(fmt, read_at(f, start, count * width)))
+
+
+def find_moov(f, size):
+    """Payload bounds of the ``moov`` box, or None"""
+    # Walk the top level only until moov; fragmented files have thousands
+    # of moof/mdat pairs after it
+    return next(((start, end) for kind, start, end in iter_boxes(f, 0, size) if kind == 'moov'), None)
+
+
+def track_samples(f, tables):
+    """
+    Decode time, duration, size and file offset of every sample of a track.
+
+    ``tables`` maps the track's stbl children to their bounds, as returned
+    by ``children``: stts gives the timing, stsc, stsz and stco/co64 where
+    each sample lives, stss the sync samples (keyframes) and ctts the
+    composition offsets. Returns a dict of per-sample arrays ``times``,
+    ``durations``, ``sizes``, ``offsets`` and ``composition`` (None without
+    ctts), plus ``sync``, the indexes of the sync samples (None when every
+    sample is one). Arrays rather than lists keep a long movie's tables at
+    a few bytes per sample. Returns None when a required table is missing, as in
+    fragmented files, which keep their sample tables in moof boxes.
+    """
+    chunks = tables.get('stco') or tables.get('co64')
+    if not all(name in tables for name in ('stts', 'stsc', 'stsz')) or not chunks:
+        return None
+
+    times = array('Q')
+    durations = array('I')
+    elapsed = 0
+    for count, delta in read_table(f, tables['stts'], '>II'):
+        times.extend(range(elapsed, elapsed + count * delta, delta) if delta else [elapsed] * count)
+        durations.extend([delta] * count)
+        elapsed += count * delta
+
+    sample_size, count = struct.unpack('>II', read_at(f, tables['stsz'][0] + 4, 8))
+    if sample_size:
+        sizes = array('I', [sample_size]) * count
+    else:
+        sizes = array('I', (entry for entry, in read_table(f, tables['stsz'], '>I', skip=4)))
+
+    chunk_offsets = [offset for offset, in read_table(f, chunks, '>I' if 'stco' in tables else '>Q')]
+    offsets = array('Q')
+    stsc = read_table(f, tables['stsc'], '>III')
+    try:
+        for index, (first_chunk, per_chunk, _) in enumerate(stsc):
+            last_chunk = stsc[index + 1][0] - 1 if index + 1 < len(stsc) else len(chunk_offsets)
+            for chunk in range(first_chunk - 1, last_chunk):
+                offset = chunk_offsets[chunk]
+                for _ in range(per_chunk):
+                    offsets.append(offset)
+                    offset += sizes[len(offsets) - 1]
+    except IndexError:
+        raise MP4ParseError('Sample tables disagree on the number of samples')
+    if not len(times) == len(sizes) == len(offsets):
+        raise MP4ParseError('Sample tables disagree on the number of samples')
+
+    sync = None
+    if 'stss' in tables:
+        sync = array('I', (number - 1 for number, in read_table(f, tables['stss'], '>I')))
+        if any(not 0 <= index < len(times) for index in sync):
+            raise MP4ParseError('Sync sample out of range')
+
+    composition = None
+    if 'ctts' in tables:
+        # Version 1 offsets are signed; version 0 ones are too in practice
+        composition = array('i')
+        for count, offset in read_table(f, tables['ctts'], '>Ii'):
+            composition.extend([offset] * count)
+        if len(composition) != len(times):
+            raise MP4ParseError('Sample tables disagree on the number of samples')
+
+    return {
+        'times': times,
+        'durations': durations,
+        'sizes': sizes,
+        'offsets': offsets,
+        'sync': sync,
+        'composition': composition,
+    }
+
+
+def read_metadata(f, size=None):
+    """
+    Read duration, video size, codec and bitrate from an MP4/MOV file.
+
+    ``f`` is a seekable binary file. Only box headers and the few fields
+    needed from ``mvhd``, ``tkhd``, ``mdhd``, ``hdlr`` and ``stsd`` are read,
+    so the cost does not depend on the file size, and ``moov`` is found
+    wherever it is, including after ``mdat``. Returns a dict, or None when
+    the file has no ``moov`` box.
+    """
+    if size is None:
+        size = f.seek(0, os.SEEK_END)
+    moov = find_moov(f, size)
+    if moov is None:
+        return None
+    moov_start, moov_end = moov
+
+    duration = 0
+    tracks = []
+    for kind, payload, box_end in iter_boxes(f, moov_start, moov_end):
+        if kind == 'mvhd':
+            timescale, units = timescale_and_duration(f, payload)
+            if timescale:
+                duration = units / timescale
+        elif kind == 'trak':
+            tracks.append(_track(f, payload, box_end))
+
+    # Fragmented files leave mvhd empty; fall back to the longest track
+    duration = duration or max((track['duration'] for track in tracks), default=0)
+    video = next((track for track in tracks if track['handler'] == 'vide'), None)
+    return {
+        'duration': duration,
+        'width': video['width'] if video else None,
+        'height': video['height'] if video else None,
+        'video_codec': video['codec'] if video else '',
+        'bitrate': int(size * 8 / duration) if duration else None,
+    }
+
+
+def apply_metadata(video, f, size=None):
+    """
+    Set a video's duration, dimensions, codec and bitrate from its file.
+
+    Files that are not MP4/MOV or cannot be parsed are left alone; a bad
+    header should never fail an upload.
+    """
+    try:
+        f.seek(0)
+        if sniff_container(f.read(SNIFF_LENGTH)) != 'isobmff':
+            return False
+        metadata = read_metadata(f, size)
+    except (MP4ParseError, OSError, struct.error) as e:
+        logger.warning(f"Could not read metadata of video {video.pk}: {str(e)}")
+        return False
+    finally:
+        f.seek(0)
+    if metadata is None:
+        return False
+
+    video.duration = timedelta(seconds=metadata['duration']) if metadata['duration'] else None
+    video.width = metadata['width']
+    video.height = metadata['height']
+    video.video_codec = metadata['video_codec']
+    video.bitrate = metadata['bitrate']
+    return True
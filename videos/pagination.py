@@ -0,0 +1,83 @@
+import base64
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Keyset ordering shared by every cursor-paginated feed. ``id`` breaks ties
+# between videos created in the same instant so the order is total.
+CURSOR_ORDERING = ('-created_at', '-id')
+
+# Keyset ordering of the trending feed, see videos.trending
+TRENDING_ORDERING = ('-hotness', '-id')
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded"""
+
+
+def encode_cursor(value, pk):
+    """Encode the ``(created_at, id)`` or ``(hotness, id)`` of the last row into an opaque token"""
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([value, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, key='created_at'):
+    """Decode a token produced by ``encode_cursor`` back to ``(value, id)``"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if key == 'created_at':
+            value = parse_datetime(value)
+        else:
+            value = float(value)
+        pk = int(pk)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if value is None:
+        raise InvalidCursor('Invalid cursor')
+    return value, pk
+
+
+class CursorPage:
+    """A page of results fetched by seeking past a cursor"""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def cursor_paginate(queryset, cursor, per_page, key='created_at'):
+    """
+    Return the ``CursorPage`` of ``queryset`` that follows ``cursor``.
+
+    Rows are ordered by ``key`` then ``id``, both descending, and seeked
+    with ``WHERE (key, id) < cursor`` instead of an ``OFFSET`` scan. No
+    ``COUNT(*)`` is run; one extra row is fetched to know whether a further
+    page exists.
+    """
+    queryset = queryset.order_by(f'-{key}', '-id')
+    if cursor:
+        value, pk = decode_cursor(cursor, key)
+        queryset = queryset.filter(
+            Q(**{f'{key}__lt': value}) |
+            Q(**{key: value, 'id__lt': pk})
+        )
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, key), last.id)
+    return CursorPage(rows, next_cursor)
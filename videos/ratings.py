@@ -0,0 +1,33 @@
+import copy
+from django.db import transaction
+from .models import VideoRating
+
+# Video columns kept up to date by the rating signals
+RATING_FIELDS = [
+    'ratings_count', 'rating_sum',
+    'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+]
+
+
+def apply_rating(video, user, value):
+    """
+    Create or change ``user``'s rating of ``video`` and return it.
+
+    The stored rating is locked and read once, and only the difference
+    between the old and new value is applied to the video's sum, count and
+    per-star counters, all in one transaction. ``video`` is refreshed with
+    the new aggregates so callers never scan ``VideoRating``.
+    """
+    with transaction.atomic():
+        rating = VideoRating.objects.select_for_update().filter(video=video, user=user).first()
+        if rating is None:
+            rating = VideoRating(video=video, user=user, rating=value)
+            rating._previous = None
+            rating.save()
+        elif rating.rating != value:
+            rating._previous = copy.copy(rating)
+            rating.rating = value
+            rating.save(update_fields=['rating'])
+
+    video.refresh_from_db(fields=RATING_FIELDS)
+    return rating
@@ -0,0 +1,138 @@
+import numpy as np
+from django.db import transaction
+from video_sharing.cache import bump_generation
+from .models import Video, Comment, VideoRating, RelatedVideo
+
+# Interaction strength of one rating (scaled by stars) and one comment
+RATING_WEIGHT = 1.0 / 5
+COMMENT_WEIGHT = 0.5
+
+# Bonus added to the cosine similarity of videos sharing a genre or creator
+GENRE_AFFINITY = 0.1
+CREATOR_AFFINITY = 0.2
+
+# Videos whose similarity rows are computed at once
+BLOCK_SIZE = 256
+
+
+def interaction_matrix(video_ids):
+    """
+    Build the sparse user x video interaction matrix from ratings and comments.
+
+    Returns coordinate arrays ``(rows, cols, weights)``: one entry per
+    (user, video) pair with repeated interactions summed, sorted by user.
+    Only users with at least one interaction get a row, and memory grows
+    with the number of interactions, not users x videos.
+    """
+    column = {video_id: i for i, video_id in enumerate(video_ids)}
+    users, videos, weights = [], [], []
+    ratings = VideoRating.objects.filter(video__is_active=True).values_list('user_id', 'video_id', 'rating')
+    for user_id, video_id, rating in ratings.iterator():
+        if video_id in column:
+            users.append(user_id)
+            videos.append(column[video_id])
+            weights.append(rating * RATING_WEIGHT)
+    comments = Comment.objects.filter(video__is_active=True, is_active=True).values_list('user_id', 'video_id')
+    for user_id, video_id in comments.iterator():
+        if video_id in column:
+            users.append(user_id)
+            videos.append(column[video_id])
+            weights.append(COMMENT_WEIGHT)
+
+    _, rows = np.unique(np.array(users, dtype=np.int64), return_inverse=True)
+    cells, cell = np.unique(rows * len(video_ids) + np.array(videos, dtype=np.int64), return_inverse=True)
+    data = np.bincount(cell, weights=np.array(weights, dtype=np.float64), minlength=len(cells))
+    rows, cols = np.divmod(cells, len(video_ids))
+    return rows, cols, data.astype(np.float32)
+
+
+def _normalize_columns(matrix, n_videos):
+    """Scale every video column to unit length so dot products are cosines"""
+    rows, cols, data = matrix
+    norms = np.sqrt(np.bincount(cols, weights=data.astype(np.float64) ** 2, minlength=n_videos))
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return rows, cols, (data * inverse[cols]).astype(np.float32)
+
+
+def _co_occurrence(matrix, start, end, n_videos):
+    """
+    Dot products of video columns ``start:end`` with every column, as a
+    dense ``(end - start) x n_videos`` block.
+
+    Only users who interacted with a video of the block contribute, each
+    pairing those entries with all of their own.
+    """
+    rows, cols, data = matrix
+    block = np.zeros((end - start, n_videos), dtype=np.float32)
+    selected = np.flatnonzero((cols >= start) & (cols < end))
+    if not len(selected):
+        return block
+    # Entries are sorted by user: each user's run is first[user]:first[user + 1]
+    first = np.searchsorted(rows, np.arange(rows[-1] + 2))
+    users = rows[selected]
+    counts = first[users + 1] - first[users]
+    pairs = np.repeat(selected, counts)
+    offsets = np.arange(len(pairs)) - np.repeat(np.cumsum(counts) - counts, counts)
+    others = np.repeat(first[users], counts) + offsets
+    np.add.at(block, (cols[pairs] - start, cols[others]), data[pairs] * data[others])
+    return block
+
+
+def compute_neighbours(video_ids, genres, creators, matrix, top_k):
+    """
+    Yield ``(video_index, [(neighbour_index, score), ...])`` for every video.
+
+    Similarity is the cosine between interaction columns plus the genre and
+    creator affinity bonuses. Rows are computed ``BLOCK_SIZE`` videos at a
+    time so memory stays at ``BLOCK_SIZE x len(video_ids)``.
+    """
+    n = len(video_ids)
+    normalized = _normalize_columns(matrix, n)
+    genres = np.asarray(genres)
+    creators = np.asarray(creators)
+    k = min(top_k, n - 1)
+    if k <= 0:
+        return
+
+    for start in range(0, n, BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, n)
+        scores = _co_occurrence(normalized, start, end, n)
+        scores += GENRE_AFFINITY * (genres[start:end, None] == genres[None, :])
+        scores += CREATOR_AFFINITY * (creators[start:end, None] == creators[None, :])
+        scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        for row in range(end - start):
+            yield start + row, [
+                (int(col), float(score))
+                for col, score in zip(top[row], top_scores[row])
+                if score > 0
+            ]
+
+
+def build_related_videos(top_k=10):
+    """Recompute the related-videos table for all active videos"""
+    rows = list(Video.objects.filter(is_active=True).order_by('id').values_list('id', 'genre', 'creator_id'))
+    if not rows:
+        RelatedVideo.objects.all().delete()
+        bump_generation('related-videos')
+        return 0
+    video_ids, genres, creators = (list(column) for column in zip(*rows))
+    matrix = interaction_matrix(video_ids)
+
+    links = [
+        RelatedVideo(video_id=video_ids[i], related_id=video_ids[j], rank=rank, score=score)
+        for i, neighbours in compute_neighbours(video_ids, genres, creators, matrix, top_k)
+        for rank, (j, score) in enumerate(neighbours)
+    ]
+    with transaction.atomic():
+        RelatedVideo.objects.all().delete()
+        RelatedVideo.objects.bulk_create(links, batch_size=500)
+    # Detail responses embed the rail, see videos.conditional
+    bump_generation('related-videos')
+    return len(links)
@@ -0,0 +1,159 @@
+import re
+from functools import lru_cache
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .pagination import CURSOR_ORDERING
+
+FTS_TABLE = 'videos_video_fts'
+
+# bm25() column weights for (title, description, creator)
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available(using='default'):
+    """Whether the FTS5 index from migration 0005 exists on this database"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    return _has_fts_table(using, str(connection.settings_dict['NAME']))
+
+
+@lru_cache(maxsize=None)
+def _has_fts_table(using, name):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+# Keep the index in step with every write to videos and usernames,
+# queryset.update() included. Same definitions as migration 0005.
+TRIGGERS = {
+    'videos_video_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS videos_video_fts_insert AFTER INSERT ON videos_video BEGIN
+            INSERT INTO {FTS_TABLE} (rowid, title, description, creator)
+            SELECT new.id, new.title, new.description, username
+            FROM users_customuser WHERE id = new.creator_id;
+        END
+    """,
+    'videos_video_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS videos_video_fts_update
+        AFTER UPDATE OF title, description, creator_id ON videos_video BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE} (rowid, title, description, creator)
+            SELECT new.id, new.title, new.description, username
+            FROM users_customuser WHERE id = new.creator_id;
+        END
+    """,
+    'videos_video_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS videos_video_fts_delete AFTER DELETE ON videos_video BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+    """,
+    'videos_video_fts_creator': f"""
+        CREATE TRIGGER IF NOT EXISTS videos_video_fts_creator
+        AFTER UPDATE OF username ON users_customuser BEGIN
+            UPDATE {FTS_TABLE} SET creator = new.username
+            WHERE rowid IN (SELECT id FROM videos_video WHERE creator_id = new.id);
+        END
+    """,
+}
+
+# The trigger on users_customuser names videos_video, so SQLite refuses to
+# rename a rebuilt videos_video (as migrations adding a column do) while it
+# exists
+RENAME_BLOCKING_TRIGGERS = ('videos_video_fts_creator',)
+
+REBUILD_SQL = [
+    f'DELETE FROM {FTS_TABLE}',
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, creator)
+    SELECT v.id, v.title, v.description, u.username
+    FROM videos_video v JOIN users_customuser u ON u.id = v.creator_id
+    """,
+]
+
+
+def drop_rename_blocking_triggers(using='default', **kwargs):
+    """pre_migrate: let migrations rebuild videos_video, see ``ensure_search_triggers``"""
+    if connections[using].vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        for name in RENAME_BLOCKING_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def ensure_search_triggers(using='default', **kwargs):
+    """
+    post_migrate: create whichever index triggers are missing.
+
+    Rebuilding videos_video to add a column drops the triggers on it, so
+    any migration can remove them. When one on videos_video was gone, rows
+    may have changed unseen in the meantime and the index is rebuilt.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    _has_fts_table.cache_clear()
+    if not fts_available(using):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        missing = set(TRIGGERS) - {name for name, in cursor.fetchall()}
+        if not missing:
+            return
+        with transaction.atomic(using=using):
+            for name in missing:
+                cursor.execute(TRIGGERS[name])
+            if missing - set(RENAME_BLOCKING_TRIGGERS):
+                for sql in REBUILD_SQL:
+                    cursor.execute(sql)
+
+
+def build_match_query(query):
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Every word must match, and each is a quoted prefix term so search-as-
+    you-type finds "tutorial" from "tuto" and user input can never inject
+    FTS5 operators.
+    """
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+
+def search_videos(queryset, query):
+    """
+    Filter ``queryset`` to videos matching ``query`` on title, description
+    or creator username.
+
+    With the FTS5 index the result is ordered by BM25 relevance, newest
+    first on ties. Without it this falls back to the ``icontains`` scan,
+    ordered newest first.
+    """
+    match = build_match_query(query)
+    if not match or not fts_available(queryset.db):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(creator__username__icontains=query)
+        ).order_by(*CURSOR_ORDERING)
+
+    table = queryset.model._meta.db_table
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    return queryset.filter(
+        id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,)
+        )
+    ).annotate(
+        search_rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (match,)
+        )
+    ).order_by('search_rank', *CURSOR_ORDERING)
@@ -0,0 +1,174 @@
+from collections import Counter
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .cards import invalidate_video_lists
+from .jobs import enqueue
+from .media_store import release_blob, store_upload
+from .models import Video, Comment, VideoRating
+from .suggest import suggest_index
+from .trending import video_hotness
+
+User = get_user_model()
+
+
+def _bump(video_id, **deltas):
+    """Apply counter deltas to a video with a single atomic UPDATE"""
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        changes['card_version'] = F('card_version') + 1
+        Video.objects.filter(id=video_id).update(**changes)
+
+
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=VideoRating)
+def remember_previous_state(sender, instance, raw=False, **kwargs):
+    """
+    Stash the stored row so post_save can apply only the difference.
+
+    Callers that already hold the stored row (see videos.ratings) set
+    ``_previous`` themselves to save the lookup.
+    """
+    if hasattr(instance, '_previous'):
+        return
+    instance._previous = None
+    if instance.pk and not raw:
+        instance._previous = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance.__dict__.pop('_previous', None)
+    was_counted = previous is not None and previous.is_active
+    if previous is not None and previous.video_id != instance.video_id:
+        _bump(previous.video_id, comments_count=-int(was_counted))
+        was_counted = False
+    _bump(instance.video_id, comments_count=int(instance.is_active) - int(was_counted))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.is_active:
+        _bump(instance.video_id, comments_count=-1)
+
+
+def _rating_deltas(rating, sign):
+    """Counter deltas for adding (sign=1) or removing (sign=-1) one rating"""
+    return {
+        'ratings_count': sign,
+        'rating_sum': sign * rating,
+        f'rating_{rating}_count': sign,
+    }
+
+
+@receiver(post_save, sender=VideoRating)
+def rating_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance.__dict__.pop('_previous', None)
+    if previous is not None and previous.video_id != instance.video_id:
+        _bump(previous.video_id, **_rating_deltas(previous.rating, -1))
+        previous = None
+    if previous is None:
+        _bump(instance.video_id, **_rating_deltas(instance.rating, 1))
+    elif previous.rating != instance.rating:
+        deltas = Counter(_rating_deltas(instance.rating, 1))
+        deltas.update(_rating_deltas(previous.rating, -1))
+        _bump(instance.video_id, **deltas)
+
+
+@receiver(post_delete, sender=VideoRating)
+def rating_deleted(sender, instance, **kwargs):
+    _bump(instance.video_id, **_rating_deltas(instance.rating, -1))
+
+
+@receiver(pre_save, sender=Video)
+def score_new_video(sender, instance, raw=False, **kwargs):
+    """Give new videos a hotness so they enter the trending feed at once"""
+    if instance._state.adding and not raw:
+        instance.hotness = video_hotness(instance)
+
+
+@receiver(pre_save, sender=Video)
+def store_video_content(sender, instance, raw=False, **kwargs):
+    """
+    Put newly uploaded files in content-addressed storage.
+    
+    Runs before the field would save the file under video_upload_path, so
+    identical uploads share one stored copy. The blob the video used
+    before, if any, is released once the save went through, and the new
+    file is handed to the process_video job (see videos.tasks).
+    """
+    upload = instance.video_file
+    if raw or not upload or upload._committed:
+        return
+    if instance.pk:
+        instance._released_hash = sender.objects.filter(pk=instance.pk).values_list(
+            'content_hash', flat=True
+        ).first()
+    blob = store_upload(upload.file)
+    instance._stored_upload = True
+    instance.video_file = blob.name
+    instance.file_size = blob.size
+    instance.content_hash = blob.sha256
+
+
+@receiver(post_save, sender=Video)
+def video_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        suggest_index.update_video(instance)
+        invalidate_video_lists()
+        released = instance.__dict__.pop('_released_hash', None)
+        if released and released != instance.content_hash:
+            release_blob(released)
+        if instance.__dict__.pop('_stored_upload', False):
+            # Queued in the same transaction, so workers never see a job
+            # for a video that was rolled back
+            instance.processing_job = enqueue(
+                'process_video', {'video_id': instance.id}, user=instance.creator
+            )
+
+
+@receiver(post_delete, sender=Video)
+def video_deleted(sender, instance, **kwargs):
+    suggest_index.remove_video(instance.id)
+    invalidate_video_lists()
+    if instance.content_hash:
+        release_blob(instance.content_hash)
+
+
+# User fields shown on video cards or indexed for completions
+USER_INDEXED_FIELDS = ('username', 'user_type', 'is_active')
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Stash the stored indexed fields so post_save can tell whether they changed"""
+    instance._previous_indexed = None
+    if update_fields is not None and not set(update_fields) & set(USER_INDEXED_FIELDS):
+        # Such as the last_login update on every login
+        return
+    if instance.pk and not raw:
+        instance._previous_indexed = sender.objects.filter(pk=instance.pk).values_list(*USER_INDEXED_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    previous = instance.__dict__.pop('_previous_indexed', None)
+    if raw:
+        return
+    if not created:
+        if previous is None or previous == tuple(getattr(instance, field) for field in USER_INDEXED_FIELDS):
+            return
+        if previous[0] != instance.username:
+            Video.objects.filter(creator=instance).update(card_version=F('card_version') + 1)
+            invalidate_video_lists()
+    suggest_index.update_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    suggest_index.remove_user(instance.id)
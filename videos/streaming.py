@@ -0,0 +1,225 @@
+import mimetypes
+import uuid
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+# Overlapping or adjacent ranges are merged; past this many a Range header
+# is ignored and the whole file is sent, so a client cannot make us build
+# thousands of tiny parts
+MAX_RANGES = 16
+
+
+class UnsatisfiableRange(ValueError):
+    """Raised when none of the requested ranges overlaps the file"""
+
+
+def parse_range(header, size):
+    """
+    Parse an RFC 7233 ``Range`` header against a file of ``size`` bytes.
+
+    Returns a sorted list of inclusive ``(start, end)`` pairs with
+    overlapping ranges merged, or None when the header is absent, malformed
+    or not worth honouring (the whole file should then be sent). Raises
+    ``UnsatisfiableRange`` when the header is valid but no range overlaps
+    the file.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        first, dash, last = spec.strip().partition('-')
+        if not dash:
+            return None
+        try:
+            if not first:
+                # Suffix range: the final ``last`` bytes
+                length = int(last)
+                if length < 0:
+                    return None
+                if length == 0 or size == 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if end is None:
+            end = size - 1
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise UnsatisfiableRange(header)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+class RangeFile:
+    """
+    File-like view of ``length`` bytes of ``file`` starting at ``start``.
+
+    ``FileResponse`` pulls fixed-size blocks through ``read``; this stops
+    them at the end of the range. It deliberately has no ``tell``/``seek``
+    so ``FileResponse`` does not derive a Content-Length from the whole file.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_validators(stored):
+    """Strong ETag and modification time of a stored file"""
+    storage = stored.storage
+    size = stored.size
+    modified = storage.get_modified_time(stored.name)
+    etag = f'"{size:x}-{int(modified.timestamp() * 1_000_000):x}"'
+    return etag, int(modified.timestamp())
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    # Dates only validate when they are exact, see RFC 7233 section 3.2
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _offload(stored, content_type):
+    """Hand the transfer to the front-end server, see MEDIA_DELIVERY"""
+    mode = getattr(settings, 'MEDIA_DELIVERY', 'django')
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(stored.name)
+        return response
+    if mode == 'x-sendfile':
+        try:
+            path = stored.path
+        except NotImplementedError:
+            # Remote storages have no local path to hand over
+            return None
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+    return None
+
+
+def _multipart(stored, ranges, size, content_type, block_size):
+    """``multipart/byteranges`` response for several ranges"""
+    boundary = uuid.uuid4().hex
+    headers = [
+        (
+            f'--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f'--{boundary}--\r\n'.encode()
+    length = sum(len(header) + end - start + 1 + 2 for header, (start, end) in zip(headers, ranges))
+
+    def parts():
+        with stored.storage.open(stored.name, 'rb') as file:
+            for header, (start, end) in zip(headers, ranges):
+                yield header
+                part = RangeFile(file, start, end - start + 1)
+                for block in iter(lambda: part.read(block_size), b''):
+                    yield block
+                yield b'\r\n'
+        yield closing
+
+    response = StreamingHttpResponse(
+        parts(), status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+    )
+    response['Content-Length'] = length + len(closing)
+    return response
+
+
+def serve_file(request, stored):
+    """
+    Serve a stored file with HTTP range and conditional request support.
+
+    Depending on ``MEDIA_DELIVERY`` the bytes are either streamed here in
+    ``MEDIA_STREAM_BLOCK_SIZE`` reads, or nginx (``X-Accel-Redirect``) or
+    Apache (``X-Sendfile``) is told which file to send. The front-end server
+    then handles ranges and validators itself and no Python time is spent
+    on the payload.
+    """
+    content_type = mimetypes.guess_type(stored.name)[0] or 'application/octet-stream'
+    response = _offload(stored, content_type)
+    if response is not None:
+        return response
+
+    etag, last_modified = file_validators(stored)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _ranged_response(request, stored, etag, last_modified, content_type)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _ranged_response(request, stored, etag, last_modified, content_type):
+    size = stored.size
+    block_size = getattr(settings, 'MEDIA_STREAM_BLOCK_SIZE', 64 * 1024)
+
+    ranges = None
+    if _if_range_matches(request, etag, last_modified):
+        try:
+            ranges = parse_range(request.META.get('HTTP_RANGE'), size)
+        except UnsatisfiableRange:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if ranges and len(ranges) > 1:
+        return _multipart(stored, ranges, size, content_type, block_size)
+
+    start, end = ranges[0] if ranges else (0, size - 1)
+    file = stored.storage.open(stored.name, 'rb')
+    response = FileResponse(
+        RangeFile(file, start, end - start + 1),
+        status=206 if ranges else 200,
+        content_type=content_type,
+    )
+    response.block_size = block_size
+    response['Content-Length'] = end - start + 1
+    if ranges:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
+from .models import Video
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    """Case-fold and collapse whitespace so lookups ignore both"""
+    return ' '.join(text.casefold().split())
+
+
+def _title_keys(title):
+    """Index a title from the start of every word, so 'tuto' finds 'Guitar tutorial'"""
+    words = normalize(title).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class PrefixIndex:
+    """
+    In-process completion index over video titles and creator usernames.
+
+    Entries live in one sorted list of ``(key, kind, id, text)`` tuples, so a
+    lookup is a ``bisect`` to the first key at or after the prefix followed by
+    a short forward scan. The index is built from the database at startup
+    (see ``warm_up``), or on first use if that did not happen, updated in place from save/delete signals and rebuilt in the background
+    every ``SEARCH_SUGGEST_REBUILD_INTERVAL`` seconds to pick up writes made
+    by other processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held across the first build so concurrent lookups run one query
+        self._build_lock = threading.Lock()
+        self._entries = []
+        self._keys = {}
+        self._built_at = None
+        self._rebuilding = False
+
+    @property
+    def rebuild_interval(self):
+        return getattr(settings, 'SEARCH_SUGGEST_REBUILD_INTERVAL', 300)
+
+    def lookup(self, prefix, limit=8):
+        """Return up to ``limit`` completions for ``prefix``"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if self._built_at is None:
+            self._build_once()
+        elif time.monotonic() - self._built_at > self.rebuild_interval:
+            self._rebuild_in_background()
+
+        results = []
+        seen = set()
+        with self._lock:
+            entries = self._entries
+            i = bisect_left(entries, (prefix,))
+            while i < len(entries) and len(results) < limit:
+                key, kind, item_id, text = entries[i]
+                if not key.startswith(prefix):
+                    break
+                if (kind, item_id) not in seen:
+                    seen.add((kind, item_id))
+                    results.append({'type': kind, 'id': item_id, 'text': text})
+                i += 1
+        return results
+
+    def rebuild(self):
+        """Load every active video title and creator username"""
+        entries = []
+        keys = {}
+        videos = Video.objects.filter(is_active=True).values_list('id', 'title')
+        for video_id, title in videos.iterator():
+            item_keys = _title_keys(title)
+            keys[('video', video_id)] = item_keys
+            entries.extend((key, 'video', video_id, title) for key in item_keys)
+        creators = User.objects.filter(user_type='creator', is_active=True).values_list('id', 'username')
+        for user_id, username in creators.iterator():
+            key = normalize(username)
+            keys[('creator', user_id)] = {key}
+            entries.append((key, 'creator', user_id, username))
+        entries.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+            self._built_at = time.monotonic()
+
+    def warm_up(self):
+        """Build the index in a background thread, returned, so the first lookup finds it ready"""
+        def run():
+            try:
+                self._build_once()
+            except DatabaseError as e:
+                # Not migrated yet; the first lookup builds it instead
+                logger.warning(f"Could not build the suggest index: {str(e)}")
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run, name='suggest-index-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def _build_once(self):
+        with self._build_lock:
+            if self._built_at is None:
+                self.rebuild()
+
+    def clear(self):
+        """Drop the index; the next lookup rebuilds it"""
+        with self._lock:
+            self._entries = []
+            self._keys = {}
+            self._built_at = None
+
+    def update_video(self, video):
+        if video.is_active:
+            self._replace('video', video.id, video.title, _title_keys(video.title))
+        else:
+            self._replace('video', video.id, None, set())
+
+    def update_user(self, user):
+        if user.user_type == 'creator' and user.is_active:
+            self._replace('creator', user.id, user.username, {normalize(user.username)})
+        else:
+            self._replace('creator', user.id, None, set())
+
+    def remove_video(self, video_id):
+        self._replace('video', video_id, None, set())
+
+    def remove_user(self, user_id):
+        self._replace('creator', user_id, None, set())
+
+    def _replace(self, kind, item_id, text, new_keys):
+        with self._lock:
+            if self._built_at is None:
+                # Nothing to keep in step until the index is built
+                return
+            entries = self._entries
+            for key in self._keys.pop((kind, item_id), ()):
+                i = bisect_left(entries, (key, kind, item_id))
+                if i < len(entries) and entries[i][:3] == (key, kind, item_id):
+                    del entries[i]
+            for key in new_keys:
+                insort(entries, (key, kind, item_id, text))
+            if new_keys:
+                self._keys[(kind, item_id)] = new_keys
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                self.rebuild()
+            finally:
+                self._rebuilding = False
+                connection.close()
+
+        threading.Thread(target=run, name='suggest-index-rebuild', daemon=True).start()
+
+
+suggest_index = PrefixIndex()
@@ -0,0 +1,75 @@
+import logging
+import os
+from django.conf import settings
+from django.db.models import F
+from .cards import CARD_KEY_FIELDS, get_cards
+from .drive import DriveStorage
+from .faststart import faststart_stored
+from .hls import cached_playlist
+from .jobs import job
+from .media_store import media_storage
+from .media_transfer import ON_DRIVE, move_to_drive, move_to_local
+from .models import Video
+from .mp4 import METADATA_FIELDS, apply_metadata
+from .utils import GoogleDriveStorage
+
+logger = logging.getLogger(__name__)
+
+
+@job('process_video', priority=10)
+def process_video(video_id):
+    """
+    Post-upload processing of a video's file, queued when a new file is saved.
+
+    Rewrites it with moov first, reads its metadata, warms the card and
+    playlist caches and, when Google Drive is configured, mirrors it there.
+    Every step can run again after a retry without doing harm.
+    """
+    video = Video.objects.filter(id=video_id).first()
+    if video is None or not video.video_file:
+        return None
+
+    result = {'faststart': False}
+    if settings.FASTSTART_UPLOADS:
+        result['faststart'] = faststart_stored(video)
+
+    with video.video_file.open('rb') as f:
+        result['metadata'] = apply_metadata(video, f, video.video_file.size)
+    if result['metadata']:
+        Video.objects.filter(id=video.id).update(
+            card_version=F('card_version') + 1,
+            **{field: getattr(video, field) for field in METADATA_FIELDS}
+        )
+
+    get_cards(Video.objects.filter(id=video.id).only(*CARD_KEY_FIELDS))
+    result['playlist'] = cached_playlist(video) is not None
+
+    # Mirror local files to Drive; files stored on Drive need no copy
+    mirror = not isinstance(media_storage(), DriveStorage)
+    if mirror and settings.GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE and not video.external_url:
+        url = GoogleDriveStorage().upload_file(
+            video.video_file.path, os.path.basename(video.video_file.name)
+        )
+        if url is None:
+            # Raising hands the upload to the job's retries
+            raise RuntimeError('Google Drive upload failed')
+        Video.objects.filter(id=video.id).update(external_url=url)
+    return result
+
+
+@job('promote_video', priority=5)
+def promote_video(video_id):
+    """Move a video that turned hot from Drive to local storage, see videos.tiering"""
+    video = Video.objects.filter(ON_DRIVE, id=video_id).first()
+    if video is None:
+        return None
+    return {'downloaded': move_to_local(video)}
+
+
+@job('demote_video')
+def demote_video(video_id):
+    """Move a video that went cold from local storage to Drive, see videos.tiering"""
+    video = Video.objects.filter(id=video_id).exclude(video_file='').exclude(video_file__isnull=True).first()
+    if video is None:
+        return None
+    return {'uploaded': move_to_drive(video)}
@@ -1,10 +1,79 @@
-from django.test import TestCase, Client
+from django.apps import apps
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.sessions.models import Session
+from unittest import mock, skipUnless
+from concurrent.futures import Executor, Future
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMockSequence
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from videos.models import Video, VideoRating, Comment
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+import hashlib
+import httplib2
+import io
+import json
+import struct
+import os
+import shutil
+import tempfile
+import threading
+import time
+from videos.models import Video, VideoRating, Comment, RelatedVideo, UploadSession, MediaBlob, Job, MediaMigrationCheckpoint, VideoAccessBucket
+from videos.pagination import InvalidCursor, cursor_paginate, decode_cursor
+from video_sharing.cache import get_or_compute
+from video_sharing.sessions import SessionStore
+from videos.cards import l1_cache
+from videos.search import TRIGGERS, ensure_search_triggers, fts_available, search_videos
+from videos.drive import DriveStorage
+from videos.drive_bulk import bulk_delete, bulk_info, bulk_upload
+from videos.drive_fake import FakeDrive
+from videos.faststart import faststart
+from videos.fmp4 import init_segment, media_segment, plan_segments, read_movie
+from videos.hls import load_movie, movie_weight, movies as hls_movies, playlist_for, segment_for, segment_name
+from videos.jobs import claim, enqueue, job, run_job, run_pending
+from videos.mp4 import MP4ParseError, iter_boxes, read_metadata
+from videos.streaming import UnsatisfiableRange, parse_range
+from videos.upload_handlers import ASF_HEADER_GUID, VideoUploadHandler
+from videos.suggest import suggest_index
+from videos.tiering import record_access, recent_views, retier
+from videos.view_counter import ViewCountBuffer
+from videos.views import api_videos
+from videos.utils import GoogleDriveStorage
 
 User = get_user_model()
 
+# Start of a real MP4 file: an ``ftyp`` box
+MP4_HEADER = b'\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2'
+
+
+def mp4_box(kind, *children):
+    payload = b''.join(children)
+    return struct.pack('>I4s', 8 + len(payload), kind.encode()) + payload
+
+
+def mp4_movie(seconds=90, width=1280, height=720, mdat_size=4096, moov_first=False, tables=()):
+    """A minimal MP4: ftyp, mdat and a moov with one H.264 video track; ``tables`` go in its stbl"""
+    mvhd = mp4_box('mvhd', b'\x00' * 12, struct.pack('>II', 1000, seconds * 1000), b'\x00' * 80)
+    tkhd = mp4_box('tkhd', b'\x00' * 76, struct.pack('>II', width << 16, height << 16))
+    mdhd = mp4_box('mdhd', b'\x00' * 12, struct.pack('>II', 90000, seconds * 90000), b'\x00' * 4)
+    hdlr = mp4_box('hdlr', b'\x00' * 8, b'vide', b'\x00' * 13)
+    stsd = mp4_box('stsd', b'\x00' * 4, struct.pack('>I', 1), mp4_box('avc1', b'\x00' * 78))
+    moov = mp4_box('moov', mvhd, mp4_box('trak', tkhd, mp4_box('mdia', mdhd, hdlr, mp4_box('minf', mp4_box('stbl', stsd, *tables)))))
+    mdat = mp4_box('mdat', b'\x00' * mdat_size)
+    return MP4_HEADER + (moov + mdat if moov_first else mdat + moov)
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
 class VideoSharingPlatformTests(TestCase):
     """Basic tests for the VideoShare platform"""
     
@@ -138,3 +207,2004 @@ class VideoSharingPlatformTests(TestCase):
         # Test subscriptions page
         response = self.client.get(reverse('users:subscriptions'))
         self.assertEqual(response.status_code, 200)
+
+
+class CursorPaginationTests(TestCase):
+    """Tests for keyset pagination of the video feed"""
+    
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='pagecreator',
+            email='page@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.videos = [
+            Video.objects.create(
+                title=f'Video {i}',
+                creator=self.creator,
+                genre='music',
+                age_rating='G',
+                external_url='https://example.com/v.mp4'
+            )
+            for i in range(5)
+        ]
+    
+    def test_cursor_walks_every_video_once(self):
+        """Following next_cursor visits each video exactly once, newest first"""
+        seen = []
+        cursor = None
+        while True:
+            page = cursor_paginate(Video.objects.all(), cursor, 2)
+            seen.extend(video.id for video in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        expected = list(Video.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+    
+    def test_invalid_cursor_rejected(self):
+        """Garbage tokens raise InvalidCursor"""
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not-a-cursor')
+    
+    def test_dashboard_cursor_mode(self):
+        """Dashboard accepts a cursor and skips the total count"""
+        response = self.client.get(reverse('videos:dashboard'), {'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['total_videos'])
+        self.assertContains(response, 'Video 4')
+    
+    def test_dashboard_links_into_cursor_mode(self):
+        """Numbered pages link their Next to a cursor; a bad cursor is a 400"""
+        for i in range(5, 14):
+            Video.objects.create(title=f'Video {i}', creator=self.creator, genre='music', age_rating='G')
+        response = self.client.get(reverse('videos:dashboard'))
+        next_cursor = response.context['next_cursor']
+        self.assertContains(response, f'?cursor={next_cursor}')
+        
+        response = self.client.get(reverse('videos:dashboard'), {'cursor': next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [video.title for video in response.context['videos']],
+            ['Video 1', 'Video 0']
+        )
+        
+        response = self.client.get(reverse('videos:dashboard'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class EngagementCounterTests(TestCase):
+    """Tests for the denormalized engagement counters on Video"""
+    
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='countcreator',
+            email='count@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.video = Video.objects.create(
+            title='Counted Video',
+            creator=self.creator,
+            genre='music',
+            age_rating='G',
+            external_url='https://example.com/v.mp4'
+        )
+    
+    def test_comment_counter(self):
+        """Comment create, deactivate and delete keep comments_count in step"""
+        comment = Comment.objects.create(video=self.video, user=self.creator, content='hi')
+        Comment.objects.create(video=self.video, user=self.creator, content='again')
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.comments_count, 2)
+        
+        comment.is_active = False
+        comment.save()
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.comments_count, 1)
+        
+        comment.delete()
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.comments_count, 1)
+    
+    def test_rating_counters(self):
+        """Rating create, update and delete keep count and sum in step"""
+        rating = VideoRating.objects.create(video=self.video, user=self.creator, rating=4)
+        self.video.refresh_from_db()
+        self.assertEqual((self.video.ratings_count, self.video.rating_sum), (1, 4))
+        
+        rating.rating = 2
+        rating.save()
+        self.video.refresh_from_db()
+        self.assertEqual((self.video.ratings_count, self.video.rating_sum), (1, 2))
+        self.assertEqual(self.video.average_rating, 2)
+        
+        rating.delete()
+        self.video.refresh_from_db()
+        self.assertEqual((self.video.ratings_count, self.video.rating_sum), (0, 0))
+        self.assertEqual(self.video.average_rating, 0)
+    
+    def test_rating_endpoint_applies_difference(self):
+        """Re-rating moves one vote between histogram buckets"""
+        self.client.login(username='countcreator', password='testpass123')
+        url = reverse('videos:api_rate_video', kwargs={'video_id': self.video.id})
+        self.client.post(url, json.dumps({'rating': 5}), content_type='application/json')
+        response = self.client.post(url, json.dumps({'rating': 3}), content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['total_ratings'], 1)
+        self.assertEqual(data['average_rating'], 3.0)
+        self.assertEqual(data['rating_distribution'], {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0})
+    
+    def test_rate_video_view_uses_counters(self):
+        """rate_video returns the new average from the stored aggregates"""
+        VideoRating.objects.create(video=self.video, user=self.creator, rating=5)
+        consumer = User.objects.create_user(
+            username='countconsumer',
+            email='countconsumer@test.com',
+            password='testpass123'
+        )
+        self.client.login(username='countconsumer', password='testpass123')
+        response = self.client.post(
+            reverse('videos:rate_video', kwargs={'video_id': self.video.id}),
+            {'rating': 2}
+        )
+        self.assertEqual(response.json()['average_rating'], 3.5)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.rating_distribution, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+        self.assertTrue(VideoRating.objects.filter(user=consumer, rating=2).exists())
+    
+    def test_list_endpoint_reads_counters(self):
+        """The list API serves engagement without per-row queries"""
+        Comment.objects.create(video=self.video, user=self.creator, content='hi')
+        # Page query, key lookup of the page's ids and one hydration query
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('videos:api_videos_list'), {'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['videos'][0]['comments_count'], 1)
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600)
+class ViewCountBufferTests(TestCase):
+    """Tests for the write-behind view counter"""
+    
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='viewcreator',
+            email='view@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.videos = [
+            Video.objects.create(
+                title=f'Viewed {i}',
+                creator=self.creator,
+                genre='music',
+                age_rating='G',
+                external_url='https://example.com/v.mp4'
+            )
+            for i in range(3)
+        ]
+        self.buffer = ViewCountBuffer()
+        self.addCleanup(self.buffer.stop)
+    
+    def test_views_buffered_until_flush(self):
+        """Hits stay in memory until flushed in one batch"""
+        first, second, third = self.videos
+        for _ in range(3):
+            self.buffer.increment(first.id)
+        self.buffer.increment(second.id)
+        self.buffer.increment(third.id)
+        
+        first.refresh_from_db()
+        self.assertEqual(first.views, 0)
+        self.assertEqual(self.buffer.pending(first.id), 3)
+        
+        self.assertEqual(self.buffer.flush(), 3)
+        views = dict(Video.objects.values_list('id', 'views'))
+        self.assertEqual(views, {first.id: 3, second.id: 1, third.id: 1})
+        self.assertEqual(self.buffer.pending(first.id), 0)
+    
+    def test_stop_flushes_pending(self):
+        """Stopping the buffer writes what is left"""
+        self.buffer.increment(self.videos[0].id, 2)
+        self.buffer.stop()
+        self.videos[0].refresh_from_db()
+        self.assertEqual(self.videos[0].views, 2)
+    
+    def test_exit_hook_registered_once(self):
+        """Restarting the flusher does not register another flush at exit"""
+        with mock.patch('videos.view_counter.atexit.register') as register:
+            self.buffer.increment(self.videos[0].id)
+            self.buffer.stop()
+            self.buffer.increment(self.videos[0].id)
+        register.assert_called_once_with(self.buffer.stop)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class QueryPlanTests(TestCase):
+    """The hot list queries are served by an index, not a table scan"""
+    
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='plancreator',
+            email='plan@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.video = Video.objects.create(
+            title='Planned',
+            creator=self.creator,
+            genre='music',
+            age_rating='G',
+            external_url='https://example.com/v.mp4'
+        )
+    
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_dashboard_feed(self):
+        videos = Video.objects.filter(is_active=True).order_by('-created_at', '-id')
+        self.assertUsesIndex(videos[:13], 'video_active_created_idx')
+    
+    def test_genre_feed(self):
+        videos = Video.objects.filter(is_active=True, genre='music').order_by('-created_at', '-id')
+        self.assertUsesIndex(videos[:13], 'video_active_genre_idx')
+    
+    def test_creator_videos(self):
+        videos = Video.objects.filter(creator=self.creator, is_active=True)
+        self.assertUsesIndex(videos[:10], 'video_creator_active_idx')
+    
+    def test_video_comments(self):
+        comments = self.video.comments.filter(is_active=True)
+        self.assertUsesIndex(comments[:10], 'comment_video_active_idx')
+    
+    def test_trending_feed(self):
+        videos = Video.objects.filter(is_active=True).order_by('-hotness', '-id')
+        self.assertUsesIndex(videos[:13], 'video_active_hotness_idx')
+    
+    def test_registration_email_check(self):
+        self.assertUsesIndex(User.objects.filter(email='plan@test.com'), 'user_email_idx')
+
+
+class SearchTests(TestCase):
+    """Tests for full-text video search"""
+    
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='guitarhero',
+            email='search@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.in_title = Video.objects.create(
+            title='Guitar tutorial',
+            description='Learn chords',
+            creator=self.creator,
+            genre='music',
+            age_rating='G'
+        )
+        self.in_description = Video.objects.create(
+            title='Weekend vlog',
+            description='A short guitar session',
+            creator=self.creator,
+            genre='lifestyle',
+            age_rating='G'
+        )
+    
+    def search(self, query):
+        return list(search_videos(Video.objects.filter(is_active=True), query))
+    
+    def test_prefix_match_ranked_by_relevance(self):
+        """Partial words match and title hits rank above description hits"""
+        if not fts_available():
+            self.skipTest('FTS5 is not available')
+        self.assertEqual(self.search('guit'), [self.in_title, self.in_description])
+        self.assertEqual(self.search('tuto chords'), [self.in_title])
+    
+    def test_index_follows_writes(self):
+        """Edits to videos and creator usernames reach the index"""
+        if not fts_available():
+            self.skipTest('FTS5 is not available')
+        self.in_description.title = 'Banjo basics'
+        self.in_description.save()
+        self.assertEqual(self.search('banjo'), [self.in_description])
+        
+        self.creator.username = 'strummer'
+        self.creator.save()
+        self.assertEqual(len(self.search('strummer')), 2)
+        
+        self.in_title.delete()
+        self.assertEqual(self.search('chords'), [])
+    
+    def test_index_follows_queryset_updates(self):
+        """Bulk updates bypass signals but still reach the index"""
+        if not fts_available():
+            self.skipTest('FTS5 is not available')
+        Video.objects.filter(id=self.in_description.id).update(description='Mandolin picking')
+        self.assertEqual(self.search('mandolin'), [self.in_description])
+        self.assertEqual(self.search('session'), [])
+        
+        User.objects.filter(id=self.creator.id).update(username='picker')
+        self.assertEqual(len(self.search('picker')), 2)
+    
+    def test_migrate_restores_triggers(self):
+        """Triggers dropped by a table rebuild come back, with the rows changed meanwhile"""
+        if not fts_available():
+            self.skipTest('FTS5 is not available')
+        with connection.cursor() as cursor:
+            for name in TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {name}')
+        Video.objects.filter(id=self.in_description.id).update(title='Banjo basics')
+        self.assertEqual(self.search('banjo'), [])
+        
+        ensure_search_triggers()
+        self.assertEqual(self.search('banjo'), [self.in_description])
+        Video.objects.filter(id=self.in_title.id).update(title='Ukulele tutorial')
+        self.assertEqual(self.search('ukulele'), [self.in_title])
+    
+    def test_fallback_without_fts(self):
+        """Without FTS5 search falls back to substring matching"""
+        with mock.patch('videos.search.fts_available', return_value=False):
+            self.assertEqual(self.search('uitar'), [self.in_description, self.in_title])
+    
+    def test_api_search(self):
+        """The list API keeps the query parameter"""
+        response = self.client.get(reverse('videos:api_videos_list'), {'query': 'guitar'})
+        data = response.json()
+        self.assertEqual(data['pagination']['total_count'], 2)
+        self.assertEqual(
+            [video['id'] for video in data['videos']],
+            [video.id for video in self.search('guitar')]
+        )
+
+
+class SearchSuggestTests(TestCase):
+    """Tests for the in-process completion index"""
+    
+    def setUp(self):
+        suggest_index.clear()
+        self.addCleanup(suggest_index.clear)
+        self.creator = User.objects.create_user(
+            username='tutorbot',
+            email='suggest@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.video = Video.objects.create(
+            title='Guitar Tutorial',
+            creator=self.creator,
+            genre='music',
+            age_rating='G',
+            external_url='https://example.com/v.mp4'
+        )
+    
+    def suggest(self, prefix):
+        response = self.client.get(reverse('videos:api_search_suggest'), {'q': prefix})
+        return [(s['type'], s['text']) for s in response.json()['suggestions']]
+    
+    def test_title_and_creator_completions(self):
+        """Prefixes match titles from any word and creator usernames"""
+        self.assertEqual(self.suggest('gui'), [('video', 'Guitar Tutorial')])
+        self.assertEqual(self.suggest('TUT'), [('creator', 'tutorbot'), ('video', 'Guitar Tutorial')])
+        self.assertEqual(self.suggest('xyz'), [])
+    
+    def test_lookups_do_not_query_once_built(self):
+        """After the first build lookups are served from memory"""
+        suggest_index.rebuild()
+        with self.assertNumQueries(0):
+            suggest_index.lookup('gui')
+    
+    def test_concurrent_first_lookups_build_once(self):
+        """Lookups racing to an unbuilt index wait for a single build"""
+        builds = []
+        
+        def slow_build():
+            builds.append(1)
+            time.sleep(0.05)
+            suggest_index._built_at = time.monotonic()
+        
+        with mock.patch.object(suggest_index, 'rebuild', side_effect=slow_build):
+            threads = [threading.Thread(target=suggest_index.lookup, args=('gui',)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(builds), 1)
+    
+    def test_incremental_updates(self):
+        """Saves and deletes reach a built index without a rebuild"""
+        suggest_index.rebuild()
+        self.video.title = 'Banjo Basics'
+        self.video.save()
+        Video.objects.create(
+            title='Guitar Gear',
+            creator=self.creator,
+            genre='music',
+            age_rating='G'
+        )
+        self.assertEqual(suggest_index.lookup('banjo')[0]['text'], 'Banjo Basics')
+        self.assertEqual([s['text'] for s in suggest_index.lookup('guitar')], ['Guitar Gear'])
+        
+        self.video.delete()
+        self.assertEqual(suggest_index.lookup('banjo'), [])
+    
+    def test_built_at_startup(self):
+        """Server processes build the index when the app loads, other commands do not"""
+        config = apps.get_app_config('videos')
+        for argv, warmed in (
+            (['manage.py', 'runserver'], True),
+            (['gunicorn', 'video_sharing.wsgi'], True),
+            (['manage.py', 'migrate'], False),
+        ):
+            with mock.patch('sys.argv', argv), mock.patch.object(suggest_index, 'warm_up') as warm_up:
+                config.ready()
+            self.assertEqual(warm_up.called, warmed, argv)
+        
+        def build():
+            suggest_index._built_at = time.monotonic()
+        
+        with mock.patch.object(suggest_index, 'rebuild', side_effect=build) as rebuild:
+            suggest_index.warm_up().join()
+            suggest_index.lookup('gui')
+        self.assertEqual(rebuild.call_count, 1)
+    
+    def test_username_changes(self):
+        """Renaming a creator reaches the index and their cards; other saves leave them alone"""
+        suggest_index.rebuild()
+        card_version = self.video.card_version
+        
+        self.creator.username = 'banjoist'
+        self.creator.save()
+        self.assertEqual(suggest_index.lookup('banjo'), [{'type': 'creator', 'id': self.creator.id, 'text': 'banjoist'}])
+        self.assertEqual(suggest_index.lookup('tutorb'), [])
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.card_version, card_version + 1)
+        
+        self.creator.first_name = 'Ban'
+        self.creator.save()
+        self.creator.last_login = timezone.now()
+        self.creator.save(update_fields=['last_login'])
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.card_version, card_version + 1)
+
+
+class TrendingTests(TestCase):
+    """Tests for the precomputed trending feed"""
+    
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='trendcreator',
+            email='trend@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.old_hit, self.new_quiet, self.new_hit = [
+            Video.objects.create(
+                title=title,
+                creator=self.creator,
+                genre='music',
+                age_rating='G',
+                external_url='https://example.com/v.mp4'
+            )
+            for title in ('Old hit', 'New quiet', 'New hit')
+        ]
+        Video.objects.filter(id=self.old_hit.id).update(
+            created_at=timezone.now() - timedelta(days=30), views=1000
+        )
+        Video.objects.filter(id=self.new_hit.id).update(views=50)
+    
+    def trending_ids(self, **params):
+        response = self.client.get(reverse('videos:api_videos_list'), {'sort': 'trending', **params})
+        return response.json()
+    
+    def test_refresh_orders_by_decayed_engagement(self):
+        """Fresh engagement outranks larger but month-old engagement"""
+        out = StringIO()
+        call_command('refresh_trending', stdout=out)
+        self.assertIn('Updated hotness for 2 videos', out.getvalue())
+        
+        data = self.trending_ids()
+        self.assertEqual(
+            [video['id'] for video in data['videos']],
+            [self.new_hit.id, self.new_quiet.id, self.old_hit.id]
+        )
+        
+        call_command('refresh_trending', stdout=out)
+        self.assertIn('Updated hotness for 0 videos', out.getvalue())
+    
+    def test_trending_cursor(self):
+        """Cursor pages follow the hotness order"""
+        call_command('refresh_trending', stdout=StringIO())
+        first = self.trending_ids(cursor='', per_page=2)
+        second = self.trending_ids(cursor=first['pagination']['next_cursor'], per_page=2)
+        self.assertEqual(
+            [video['id'] for video in first['videos'] + second['videos']],
+            [self.new_hit.id, self.new_quiet.id, self.old_hit.id]
+        )
+        self.assertFalse(second['pagination']['has_next'])
+
+
+class RelatedVideoTests(TestCase):
+    """Tests for the item-to-item related videos rail"""
+    
+    def setUp(self):
+        self.creator = User.objects.create_user(
+            username='relcreator',
+            email='rel@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.viewers = [
+            User.objects.create_user(username=f'viewer{i}', email=f'viewer{i}@test.com', password='testpass123')
+            for i in range(3)
+        ]
+        self.base, self.co_rated, self.same_genre, self.unrelated = [
+            Video.objects.create(
+                title=title,
+                creator=self.creator if title != 'Unrelated' else self.viewers[0],
+                genre=genre,
+                age_rating='G',
+                external_url='https://example.com/v.mp4'
+            )
+            for title, genre in (
+                ('Base', 'music'), ('Co-rated', 'news'), ('Same genre', 'music'), ('Unrelated', 'sports')
+            )
+        ]
+        for viewer in self.viewers:
+            VideoRating.objects.create(video=self.base, user=viewer, rating=5)
+            VideoRating.objects.create(video=self.co_rated, user=viewer, rating=4)
+        Comment.objects.create(video=self.unrelated, user=self.creator, content='meh')
+    
+    def test_neighbours_blend_interactions_and_affinity(self):
+        """Co-rated videos rank first, then genre/creator matches"""
+        out = StringIO()
+        call_command('build_related_videos', '--top-k', '2', stdout=out)
+        related = list(self.base.related_links.values_list('related_id', flat=True))
+        self.assertEqual(related, [self.co_rated.id, self.same_genre.id])
+        self.assertFalse(
+            RelatedVideo.objects.filter(video=self.unrelated, related=self.base).exists()
+        )
+    
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+    def test_detail_api_serves_related(self):
+        """The detail payload carries the stored neighbours"""
+        call_command('build_related_videos', stdout=StringIO())
+        response = self.client.get(
+            reverse('videos:api_video_detail', kwargs={'video_id': self.base.id})
+        )
+        related = response.json()['video']['related']
+        self.assertEqual(related[0]['id'], self.co_rated.id)
+        
+        response = self.client.get(reverse('videos:video_detail', kwargs={'video_id': self.base.id}))
+        self.assertContains(response, 'Related Videos')
+
+
+class VideoCardCacheTests(TestCase):
+    """Tests for the two-tier video card cache"""
+    
+    def setUp(self):
+        cache.clear()
+        l1_cache.clear()
+        self.creator = User.objects.create_user(
+            username='cardcreator',
+            email='card@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.video = Video.objects.create(
+            title='Carded',
+            creator=self.creator,
+            genre='music',
+            age_rating='G',
+            external_url='https://example.com/v.mp4'
+        )
+    
+    def fetch(self):
+        return self.client.get(reverse('videos:api_videos_list'), {'cursor': ''}).json()['videos']
+    
+    def test_warm_pages_skip_hydration(self):
+        """Cached cards are served without touching the video rows again"""
+        self.fetch()
+        with self.assertNumQueries(1):
+            self.fetch()
+        
+        l1_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.fetch()[0]['title'], 'Carded')
+    
+    def test_writes_invalidate_cards(self):
+        """Saves, counter updates and creator renames produce fresh cards"""
+        self.fetch()
+        Comment.objects.create(video=self.video, user=self.creator, content='hi')
+        self.assertEqual(self.fetch()[0]['comments_count'], 1)
+        
+        self.video.refresh_from_db()
+        self.video.title = 'Renamed'
+        self.video.save()
+        self.assertEqual(self.fetch()[0]['title'], 'Renamed')
+        
+        self.creator.username = 'newname'
+        self.creator.save()
+        self.assertEqual(self.fetch()[0]['creator'], 'newname')
+
+
+class CacheAsideTests(TestCase):
+    """Tests for the stampede-protected cache-aside helper"""
+    
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+    
+    def compute(self, value='fresh', delay=0):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+    
+    def test_concurrent_misses_compute_once(self):
+        """Callers arriving during a computation share its result"""
+        barrier = threading.Barrier(8)
+        results = []
+        
+        def worker():
+            barrier.wait()
+            results.append(get_or_compute('stampede', self.compute(delay=0.2), timeout=60))
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['fresh'] * 8)
+        self.assertEqual(self.calls, 1)
+    
+    def test_stale_served_while_revalidating(self):
+        """Expired entries are served to everyone but the lock holder"""
+        cache.set('feed', {'value': 'stale', 'expires': time.time() - 1, 'delta': 0}, 60)
+        cache.set('feed:lock', 1, 60)
+        self.assertEqual(get_or_compute('feed', self.compute(), timeout=60), 'stale')
+        self.assertEqual(self.calls, 0)
+        
+        cache.delete('feed:lock')
+        self.assertEqual(get_or_compute('feed', self.compute(), timeout=60), 'fresh')
+        self.assertEqual(get_or_compute('feed', self.compute('newer'), timeout=60), 'fresh')
+        self.assertEqual(self.calls, 1)
+    
+    def test_early_refresh_near_expiry(self):
+        """Slow entries close to expiry are refreshed before they lapse"""
+        cache.set('slow', {'value': 'old', 'expires': time.time() + 5, 'delta': 10}, 60)
+        with mock.patch('video_sharing.cache.random.random', return_value=0.9):
+            self.assertEqual(get_or_compute('slow', self.compute(), timeout=60), 'fresh')
+        with mock.patch('video_sharing.cache.random.random', return_value=0.0):
+            self.assertEqual(get_or_compute('slow', self.compute('newer'), timeout=60), 'fresh')
+        self.assertEqual(self.calls, 1)
+    
+    def test_list_pages_follow_new_videos(self):
+        """Creating a video retires the cached list pages"""
+        creator = User.objects.create_user(
+            username='listcreator',
+            email='list@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        url = reverse('videos:api_videos_list')
+        self.assertEqual(self.client.get(url).json()['videos'], [])
+        Video.objects.create(
+            title='Just in',
+            creator=creator,
+            genre='music',
+            age_rating='G',
+            external_url='https://example.com/v.mp4'
+        )
+        self.assertEqual([v['title'] for v in self.client.get(url).json()['videos']], ['Just in'])
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class ConditionalGetTests(TestCase):
+    """Tests for ETag revalidation of the JSON endpoints"""
+    
+    def setUp(self):
+        cache.clear()
+        self.creator = User.objects.create_user(
+            username='etagcreator',
+            email='etag@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.video = Video.objects.create(
+            title='Tagged',
+            creator=self.creator,
+            genre='music',
+            age_rating='G',
+            external_url='https://example.com/v.mp4'
+        )
+    
+    def revalidate(self, url, **params):
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        again = self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+        return first['ETag'], again
+    
+    def test_list_revalidates_until_a_card_changes(self):
+        """Unchanged pages answer 304; a new comment changes the tag"""
+        url = reverse('videos:api_videos_list')
+        etag, again = self.revalidate(url)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b'')
+        
+        Comment.objects.create(video=self.video, user=self.creator, content='hi')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['videos'][0]['comments_count'], 1)
+        
+        # Other filters are other representations
+        self.assertEqual(self.client.get(url, {'genre': 'news'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_detail_304_skips_the_body(self):
+        """Revalidating a detail page runs one query and still counts the view"""
+        url = reverse('videos:api_video_detail', args=[self.video.id])
+        # Buffered views leave the row, and so the tag, alone until a flush
+        with mock.patch('videos.api_views.view_buffer') as buffer:
+            first = self.client.get(url)
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(buffer.increment.call_count, 2)
+        
+        VideoRating.objects.create(video=self.video, user=self.creator, rating=4)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+    
+    def test_user_status_and_legacy_list(self):
+        """The user status and legacy list endpoints revalidate too"""
+        etag, again = self.revalidate(reverse('videos:api_user_status'))
+        self.assertEqual(again.status_code, 304)
+        
+        self.client.login(username='etagcreator', password='testpass123')
+        self.assertEqual(
+            self.client.get(reverse('videos:api_user_status'), HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+        
+        first = api_videos(RequestFactory().get('/'))
+        again = api_videos(RequestFactory().get('/', HTTP_IF_NONE_MATCH=first['ETag']))
+        self.assertEqual(again.status_code, 304)
+
+
+class RangeParsingTests(TestCase):
+    """Tests for RFC 7233 Range header parsing"""
+    
+    def test_ranges(self):
+        """Single, open, suffix and merged ranges resolve against the size"""
+        self.assertEqual(parse_range('bytes=0-99', 1000), [(0, 99)])
+        self.assertEqual(parse_range('bytes=900-', 1000), [(900, 999)])
+        self.assertEqual(parse_range('bytes=-100', 1000), [(900, 999)])
+        self.assertEqual(parse_range('bytes=500-5000', 1000), [(500, 999)])
+        self.assertEqual(parse_range('bytes=0-9, 5-19, 50-59', 1000), [(0, 19), (50, 59)])
+    
+    def test_invalid_and_unsatisfiable(self):
+        """Malformed headers are ignored; ranges past the end raise"""
+        for header in (None, '', 'items=0-1', 'bytes=5-1', 'bytes=a-b', 'bytes=0'):
+            self.assertIsNone(parse_range(header, 1000))
+        too_many = 'bytes=' + ','.join(f'{i * 10}-{i * 10}' for i in range(20))
+        self.assertIsNone(parse_range(too_many, 1000))
+        with self.assertRaises(UnsatisfiableRange):
+            parse_range('bytes=1000-', 1000)
+        with self.assertRaises(UnsatisfiableRange):
+            parse_range('bytes=-0', 1000)
+
+
+class VideoStreamingTests(TestCase):
+    """Tests for the ranged media delivery view"""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, MEDIA_STREAM_BLOCK_SIZE=7)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.payload = bytes(range(256)) * 4
+        creator = User.objects.create_user(
+            username='streamer',
+            email='stream@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.video = Video(
+            title='Streamed',
+            creator=creator,
+            genre='music',
+            age_rating='G'
+        )
+        self.video.video_file.save('clip.mp4', ContentFile(self.payload))
+        self.url = reverse('videos:stream_video', args=[self.video.id])
+    
+    def test_full_and_single_range(self):
+        """Whole-file and single-range responses carry the right bytes"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.payload)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(self.video.video_url, self.url)
+        
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1024')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), self.payload[100:200])
+    
+    def test_multiple_ranges(self):
+        """Several ranges come back as multipart/byteranges"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9,-10')
+        self.assertEqual(response.status_code, 206)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        self.assertIn(b'Content-Range: bytes 0-9/1024\r\n\r\n' + self.payload[:10], body)
+        self.assertIn(b'Content-Range: bytes 1014-1023/1024\r\n\r\n' + self.payload[-10:], body)
+    
+    def test_validators(self):
+        """ETag revalidation, stale If-Range and unsatisfiable ranges"""
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+    
+    def test_offload(self):
+        """Front-end servers are handed the file instead of its bytes"""
+        with override_settings(MEDIA_DELIVERY='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.video.video_file.name)
+        self.assertEqual(response.content, b'')
+        
+        with override_settings(MEDIA_DELIVERY='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.video.video_file.path)
+
+
+class ResumableUploadTests(TestCase):
+    """Tests for the chunked, resumable upload API"""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            RESUMABLE_UPLOAD_DIR=os.path.join(media_root, 'partial'),
+            RESUMABLE_UPLOAD_CHUNK_SIZE=64,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.creator = User.objects.create_user(
+            username='uploader',
+            email='upload@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.client.login(username='uploader', password='testpass123')
+        self.payload = MP4_HEADER + os.urandom(150 - len(MP4_HEADER))
+    
+    def open_upload(self, **overrides):
+        details = {
+            'title': 'Chunked',
+            'genre': 'music',
+            'age_rating': 'G',
+            'filename': 'clip.mp4',
+            'size': len(self.payload),
+            **overrides
+        }
+        return self.client.post(
+            reverse('videos:api_upload_sessions'), json.dumps(details), content_type='application/json'
+        )
+    
+    def send(self, url, offset, end):
+        return self.client.patch(
+            url, self.payload[offset:end],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset)
+        )
+    
+    def test_chunks_resume_and_finalize(self):
+        """Chunks land at their offsets and the file is moved into storage"""
+        response = self.open_upload()
+        self.assertEqual(response.status_code, 201)
+        url = response['Location']
+        
+        self.assertEqual(self.send(url, 0, 64).json()['offset'], 64)
+        # A retried chunk from a stale offset is refused with the real one
+        self.assertEqual(self.send(url, 0, 64).status_code, 409)
+        self.assertEqual(self.client.get(url).json()['offset'], 64)
+        self.assertEqual(self.send(url, 64, 200).status_code, 413)
+        
+        complete = reverse('videos:api_upload_complete', args=[response.json()['upload_id']])
+        self.assertEqual(self.client.post(complete).status_code, 409)
+        
+        self.send(url, 64, 128)
+        self.send(url, 128, 150)
+        response = self.client.post(complete)
+        self.assertEqual(response.status_code, 200)
+        
+        video = Video.objects.get(id=response.json()['video_id'])
+        self.assertEqual(video.title, 'Chunked')
+        self.assertEqual(video.file_size, 150)
+        digest = hashlib.sha256(self.payload).hexdigest()
+        self.assertEqual(video.video_file.name, f'videos/{digest[:2]}/{digest[2:4]}/{digest}.mp4')
+        self.assertEqual(video.content_hash, digest)
+        with video.video_file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.payload)
+        self.assertEqual(os.listdir(settings.RESUMABLE_UPLOAD_DIR), [])
+        self.assertFalse(UploadSession.objects.exists())
+    
+    def test_racing_chunk_refused(self):
+        """A chunk whose offset moved on while it streamed is not counted and not written"""
+        from videos import uploads
+        upload_id = self.open_upload().json()['upload_id']
+        accepted = self.payload[:64]
+        
+        class RacingStream(io.BytesIO):
+            raced = False
+            
+            def read(stream, size=-1):
+                if not stream.raced:
+                    # The other request finishes while this one is still reading
+                    stream.raced = True
+                    uploads.write_chunk(upload_id, self.creator, 0, io.BytesIO(accepted), 64)
+                return io.BytesIO.read(stream, size)
+        
+        with self.assertRaises(uploads.UploadError) as raised:
+            uploads.write_chunk(upload_id, self.creator, 0, RacingStream(b'x' * 64), 64)
+        self.assertEqual(raised.exception.status, 409)
+        session = UploadSession.objects.get(id=upload_id)
+        self.assertEqual(session.offset, 64)
+        with open(session.temp_path, 'rb') as temp:
+            self.assertEqual(temp.read(64), accepted)
+        self.assertEqual(os.listdir(settings.RESUMABLE_UPLOAD_DIR), [os.path.basename(session.temp_path)])
+    
+    def test_failed_finalize_can_be_retried(self):
+        """A finalize that rolls back leaves the received file in place"""
+        from videos import uploads
+        upload_id = self.open_upload().json()['upload_id']
+        for start in range(0, 150, 64):
+            chunk = self.payload[start:start + 64]
+            uploads.write_chunk(upload_id, self.creator, start, io.BytesIO(chunk), len(chunk))
+        
+        with mock.patch('videos.uploads.enqueue', side_effect=RuntimeError('queue down')):
+            with self.assertRaises(RuntimeError):
+                uploads.finalize(upload_id, self.creator)
+        session = UploadSession.objects.get(id=upload_id)
+        with open(session.temp_path, 'rb') as temp:
+            self.assertEqual(temp.read(), self.payload)
+        self.assertFalse(Video.objects.exists())
+        self.assertFalse(MediaBlob.objects.exists())
+        
+        video = uploads.finalize(upload_id, self.creator)
+        with video.video_file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.payload)
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+    
+    def test_rejected_uploads(self):
+        """Bad details, non-creators and cancelled uploads are handled"""
+        self.assertEqual(self.open_upload(filename='notes.txt').status_code, 400)
+        self.assertEqual(self.open_upload(title='').status_code, 400)
+        
+        url = self.open_upload()['Location']
+        self.assertEqual(self.client.delete(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(os.listdir(settings.RESUMABLE_UPLOAD_DIR), [])
+        
+        User.objects.create_user(username='viewer', password='testpass123')
+        self.client.login(username='viewer', password='testpass123')
+        self.assertEqual(self.open_upload().status_code, 403)
+
+
+class VideoUploadHandlerTests(TestCase):
+    """Tests for validating video uploads while they stream in"""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, VIDEO_UPLOAD_MAX_SIZE=4096)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        User.objects.create_user(
+            username='handlercreator',
+            email='handler@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.client.login(username='handlercreator', password='testpass123')
+    
+    def upload(self, name, content):
+        return self.client.post(reverse('videos:api_upload'), {
+            'title': 'Handled',
+            'genre': 'music',
+            'age_rating': 'G',
+            'video_file': SimpleUploadedFile(name, content, content_type='application/octet-stream'),
+        })
+    
+    def test_accepts_real_containers(self):
+        """Files whose bytes match their extension are saved"""
+        response = self.upload('clip.mp4', MP4_HEADER + b'\x00' * 100)
+        self.assertEqual(response.status_code, 200)
+        video = Video.objects.get(id=response.json()['video_id'])
+        self.assertEqual(video.file_size, len(MP4_HEADER) + 100)
+        
+        avi = b'RIFF\x00\x10\x00\x00AVI LIST' + b'\x00' * 64
+        self.assertEqual(self.upload('clip.avi', avi).status_code, 200)
+    
+    def test_rejects_wrong_container_and_size(self):
+        """Disguised and oversized files are refused with a reason"""
+        response = self.upload('clip.mp4', b'RIFF\x00\x10\x00\x00AVI LIST' + b'\x00' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('does not match its extension', response.json()['errors']['video_file'][0])
+        
+        response = self.upload('clip.mp4', MP4_HEADER + b'\x00' * 5000)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('less than', response.json()['errors']['video_file'][0])
+        self.assertFalse(Video.objects.exists())
+    
+    def test_stops_at_the_first_chunk_and_hashes(self):
+        """Bad signatures abort on the first chunk; good files get a SHA-256"""
+        request = RequestFactory().post('/')
+        handler = VideoUploadHandler(request)
+        handler.new_file('video_file', 'clip.wmv', 'video/x-ms-wmv', None)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(MP4_HEADER + b'\x00' * 1024, 0)
+        self.assertIn('does not match', request.upload_error)
+        
+        content = ASF_HEADER_GUID + b'\x01' * 2000
+        handler = VideoUploadHandler(RequestFactory().post('/'))
+        handler.new_file('video_file', 'clip.wmv', 'video/x-ms-wmv', None)
+        for start in range(0, len(content), 500):
+            handler.receive_data_chunk(content[start:start + 500], start)
+        uploaded = handler.file_complete(len(content))
+        self.assertEqual(uploaded.sha256, hashlib.sha256(content).hexdigest())
+        uploaded.close()
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Tests for deduplicated, reference-counted media storage"""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        User.objects.create_user(
+            username='dedupcreator',
+            email='dedup@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.client.login(username='dedupcreator', password='testpass123')
+        self.content = MP4_HEADER + os.urandom(512)
+        self.digest = hashlib.sha256(self.content).hexdigest()
+    
+    def upload(self, name):
+        response = self.client.post(reverse('videos:api_upload'), {
+            'title': 'Same clip',
+            'genre': 'music',
+            'age_rating': 'G',
+            'video_file': SimpleUploadedFile(name, self.content, content_type='video/mp4'),
+        })
+        return Video.objects.get(id=response.json()['video_id'])
+    
+    def test_identical_uploads_share_one_file(self):
+        """The same content is stored once under its sharded hash"""
+        first = self.upload('clip.mp4')
+        second = self.upload('renamed.mp4')
+        
+        self.assertEqual(first.video_file.name, f'videos/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.mp4')
+        self.assertEqual(second.video_file.name, first.video_file.name)
+        self.assertEqual((first.content_hash, first.file_size), (self.digest, len(self.content)))
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(os.listdir(os.path.dirname(first.video_file.path)), [f'{self.digest}.mp4'])
+    
+    def test_file_removed_with_last_reference(self):
+        """Deleting videos decrements the count; the last one deletes the file"""
+        first = self.upload('clip.mp4')
+        second = self.upload('clip.mp4')
+        path = first.video_file.path
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+
+class MP4MetadataTests(TestCase):
+    """Tests for reading video metadata from the moov box"""
+    
+    def test_moov_at_either_end(self):
+        """moov is found before or after mdat, with only small reads"""
+        for moov_first in (False, True):
+            movie = mp4_movie(moov_first=moov_first, mdat_size=1_000_000)
+            f = io.BytesIO(movie)
+            with mock.patch.object(f, 'read', wraps=f.read) as read:
+                metadata = read_metadata(f)
+            self.assertEqual(metadata['duration'], 90)
+            self.assertEqual((metadata['width'], metadata['height']), (1280, 720))
+            self.assertEqual(metadata['video_codec'], 'avc1')
+            self.assertEqual(metadata['bitrate'], len(movie) * 8 // 90)
+            self.assertLessEqual(max(call.args[0] for call in read.call_args_list), 16)
+    
+    def test_malformed_files(self):
+        """Files without moov return None; broken boxes raise"""
+        self.assertIsNone(read_metadata(io.BytesIO(MP4_HEADER + mp4_box('mdat', b'\x00' * 64))))
+        with self.assertRaises(MP4ParseError):
+            read_metadata(io.BytesIO(MP4_HEADER + struct.pack('>I4s', 4, b'moov')))
+    
+    def test_upload_and_backfill(self):
+        """Uploads are probed on arrival; the command fills older videos"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            creator = User.objects.create_user(
+                username='probecreator',
+                email='probe@test.com',
+                password='testpass123',
+                user_type='creator'
+            )
+            self.client.login(username='probecreator', password='testpass123')
+            response = self.client.post(reverse('videos:api_upload'), {
+                'title': 'Probed',
+                'genre': 'music',
+                'age_rating': 'G',
+                'video_file': SimpleUploadedFile('clip.mp4', mp4_movie(seconds=30), content_type='video/mp4'),
+            })
+            self.assertEqual(run_pending(), 1)
+            video = Video.objects.get(id=response.json()['video_id'])
+            self.assertEqual(video.duration, timedelta(seconds=30))
+            self.assertEqual((video.width, video.height, video.video_codec), (1280, 720, 'avc1'))
+            
+            legacy = Video(title='Legacy', creator=creator, genre='music', age_rating='G')
+            legacy.video_file.save('old.mp4', ContentFile(mp4_movie(seconds=12, width=640, height=360)))
+            out = StringIO()
+            call_command('backfill_video_metadata', stdout=out)
+            self.assertIn('Read metadata of 1 videos', out.getvalue())
+            legacy.refresh_from_db()
+            self.assertEqual(legacy.duration, timedelta(seconds=12))
+            self.assertEqual((legacy.width, legacy.height), (640, 360))
+
+
+class FastStartTests(TestCase):
+    """Tests for rewriting MP4s with moov first"""
+    
+    def test_rewrite_moves_moov_and_patches_offsets(self):
+        """moov moves before mdat and chunk offsets follow the media"""
+        movie = bytearray(mp4_movie(mdat_size=64))
+        mdat_payload = len(MP4_HEADER) + 8
+        movie[mdat_payload:mdat_payload + 8] = b'FRAMEONE'
+        stsd_end = movie.rindex(b'avc1') - 4 + 86
+        # Point an stco table at the first frame, inside the stbl box
+        stco = mp4_box('stco', b'\x00' * 4, struct.pack('>II', 1, mdat_payload))
+        moov_start = movie.index(b'moov') - 4
+        movie = movie[:stsd_end] + stco + movie[stsd_end:]
+        for kind in (b'moov', b'trak', b'mdia', b'minf', b'stbl'):
+            position = movie.index(kind, moov_start) - 4
+            size = struct.unpack_from('>I', movie, position)[0]
+            struct.pack_into('>I', movie, position, size + len(stco))
+        
+        out = io.BytesIO()
+        self.assertTrue(faststart(io.BytesIO(bytes(movie)), out))
+        rewritten = out.getvalue()
+        self.assertEqual(len(rewritten), len(movie))
+        self.assertLess(rewritten.index(b'moov'), rewritten.index(b'mdat'))
+        
+        stco_at = rewritten.index(b'stco') + 12
+        chunk_offset = struct.unpack_from('>I', rewritten, stco_at)[0]
+        self.assertEqual(rewritten[chunk_offset:chunk_offset + 8], b'FRAMEONE')
+        self.assertEqual(read_metadata(io.BytesIO(rewritten))['duration'], 90)
+        
+        # Already fast-start files are left alone
+        self.assertFalse(faststart(io.BytesIO(rewritten), io.BytesIO()))
+    
+    def test_uploads_and_command(self):
+        """Uploads are rewritten by their processing job; the command fixes stored files"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            creator = User.objects.create_user(
+                username='faststarter',
+                email='fast@test.com',
+                password='testpass123',
+                user_type='creator'
+            )
+            self.client.login(username='faststarter', password='testpass123')
+            response = self.client.post(reverse('videos:api_upload'), {
+                'title': 'Phone clip',
+                'genre': 'music',
+                'age_rating': 'G',
+                'video_file': SimpleUploadedFile('clip.mov', mp4_movie(), content_type='video/quicktime'),
+            })
+            self.assertEqual(run_pending(), 1)
+            video = Video.objects.get(id=response.json()['video_id'])
+            with video.video_file.open('rb') as f:
+                stored = f.read()
+            self.assertLess(stored.index(b'moov'), stored.index(b'mdat'))
+            self.assertEqual(video.content_hash, hashlib.sha256(stored).hexdigest())
+            
+            legacy = Video(title='Legacy', creator=creator, genre='music', age_rating='G')
+            legacy.video_file.save('old.mp4', ContentFile(mp4_movie()))
+            old_path = legacy.video_file.path
+            out = StringIO()
+            call_command('faststart_media', stdout=out)
+            self.assertIn('Rewrote 1 videos', out.getvalue())
+            legacy.refresh_from_db()
+            self.assertEqual(legacy.content_hash, video.content_hash)
+            self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+            self.assertFalse(os.path.exists(old_path))
+
+
+class HLSPlaylistTests(TestCase):
+    """Tests for fragmented MP4 HLS playlists built from MP4 sample tables"""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, HLS_SEGMENT_DURATION=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        hls_movies.clear()
+        self.creator = User.objects.create_user(
+            username='segmenter',
+            email='hls@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+    
+    def movie(self, moov_first=True):
+        """Ten one-second 100 byte samples of byte ``i``, one per chunk, a keyframe every three"""
+        def tables(first_offset):
+            return (
+                mp4_box('stts', b'\x00' * 4, struct.pack('>III', 1, 10, 90000)),
+                mp4_box('stss', b'\x00' * 4, struct.pack('>5I', 4, 1, 4, 7, 10)),
+                mp4_box('stsc', b'\x00' * 4, struct.pack('>4I', 1, 1, 1, 1)),
+                mp4_box('stsz', b'\x00' * 4, struct.pack('>II', 100, 10)),
+                mp4_box('stco', b'\x00' * 4, struct.pack('>11I', 10, *range(first_offset, first_offset + 1000, 100))),
+            )
+        
+        if moov_first:
+            media_start = len(mp4_movie(seconds=10, mdat_size=1000, moov_first=True, tables=tables(0))) - 1000
+        else:
+            media_start = len(MP4_HEADER) + 8
+        movie = mp4_movie(seconds=10, mdat_size=1000, moov_first=moov_first, tables=tables(media_start))
+        samples = b''.join(bytes([i]) * 100 for i in range(10))
+        return movie[:media_start] + samples + movie[media_start + 1000:]
+    
+    def boxes(self, data, start=0, end=None):
+        """Child box types of ``data[start:end]`` mapped to their payload bounds"""
+        f = io.BytesIO(data)
+        return {kind: (payload, box_end) for kind, payload, box_end in iter_boxes(f, start, end or len(data))}
+    
+    def test_segments_follow_keyframes(self):
+        """Segments start on keyframes, wherever moov is"""
+        for moov_first in (True, False):
+            data = self.movie(moov_first)
+            movie = read_movie(io.BytesIO(data), len(data))
+            self.assertEqual(plan_segments(movie, 2), [
+                (3.0, [(0, 3)]),
+                (3.0, [(3, 6)]),
+                (3.0, [(6, 9)]),
+                (1.0, [(9, 10)]),
+            ])
+            
+            # Keyframes closer than the target are merged into one segment
+            self.assertEqual(plan_segments(movie, 5), [(6.0, [(0, 6)]), (4.0, [(6, 10)])])
+    
+    def test_fragments(self):
+        """The init segment has empty sample tables and mvex; media segments are moof and mdat"""
+        data = self.movie()
+        movie = read_movie(io.BytesIO(data), len(data))
+        
+        init = init_segment(io.BytesIO(data), movie)
+        self.assertEqual(list(self.boxes(init)), ['ftyp', 'moov'])
+        moov = self.boxes(init, *self.boxes(init)['moov'])
+        self.assertEqual(list(moov), ['mvhd', 'trak', 'mvex'])
+        self.assertIn('trex', self.boxes(init, *moov['mvex']))
+        mdia = self.boxes(init, *self.boxes(init, *moov['trak'])['mdia'])
+        stbl = self.boxes(init, *self.boxes(init, *mdia['minf'])['stbl'])
+        self.assertEqual(list(stbl), ['stsd', 'stts', 'stsc', 'stsz', 'stco'])
+        self.assertEqual(init[stbl['stts'][0]:stbl['stts'][1]], b'\x00' * 8)
+        
+        header, runs, length = media_segment(movie, 2, [(3, 6)])
+        segment = header + b''.join(data[offset:offset + size] for offset, size in runs)
+        self.assertEqual(len(segment), length)
+        top = self.boxes(segment)
+        self.assertEqual(list(top), ['moof', 'mdat'])
+        self.assertEqual(segment[top['mdat'][0]:], bytes([3]) * 100 + bytes([4]) * 100 + bytes([5]) * 100)
+        
+        moof = self.boxes(segment, *top['moof'])
+        self.assertEqual(segment[moof['mfhd'][0] + 4:moof['mfhd'][1]], struct.pack('>I', 2))
+        traf = self.boxes(segment, *moof['traf'])
+        self.assertEqual(list(traf), ['tfhd', 'tfdt', 'trun'])
+        self.assertEqual(struct.unpack('>Q', segment[traf['tfdt'][0] + 4:traf['tfdt'][1]])[0], 3 * 90000)
+        trun = segment[traf['trun'][0]:traf['trun'][1]]
+        count, data_offset = struct.unpack('>Ii', trun[4:12])
+        self.assertEqual(count, 3)
+        # Relative to the start of the moof, which is the segment's
+        self.assertEqual(data_offset, top['mdat'][0])
+        flags = [struct.unpack('>III', trun[12 + i * 12:24 + i * 12])[2] for i in range(3)]
+        self.assertEqual(flags, [0x02000000, 0x01010000, 0x01010000])
+    
+    def test_playlist_view(self):
+        """The playlist is cached, revalidates and points at immutable segments"""
+        data = self.movie(moov_first=False)
+        video = Video.objects.create(
+            title='Long one',
+            creator=self.creator,
+            genre='music',
+            age_rating='G',
+            video_file=SimpleUploadedFile('long.mp4', data, content_type='video/mp4')
+        )
+        url = reverse('videos:video_playlist', args=[video.id])
+        
+        with mock.patch('videos.hls.playlist_for', wraps=playlist_for) as build:
+            response = self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apple.mpegurl')
+        playlist = response.content.decode()
+        version = f'?v={video.content_hash[:16]}'
+        init_uri = reverse('videos:video_hls_init', args=[video.id]) + version
+        segment_uri = reverse('videos:video_hls_segment', args=[video.id, 2, 1]) + version
+        self.assertTrue(playlist.startswith('#EXTM3U\n'))
+        self.assertIn(f'#EXT-X-MAP:URI="{init_uri}"\n', playlist)
+        self.assertIn(f'#EXTINF:3.000,\n{segment_uri}\n', playlist)
+        self.assertEqual(playlist.count('#EXTINF'), 4)
+        self.assertIn('#EXT-X-TARGETDURATION:3', playlist)
+        self.assertTrue(playlist.endswith('#EXT-X-ENDLIST\n'))
+        
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        
+        response = self.client.get(init_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(list(self.boxes(response.content)), ['ftyp', 'moov'])
+        
+        response = self.client.get(segment_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        segment = b''.join(response.streaming_content)
+        self.assertEqual(len(segment), int(response['Content-Length']))
+        self.assertTrue(segment.endswith(bytes([3]) * 100 + bytes([4]) * 100 + bytes([5]) * 100))
+        self.assertEqual(self.client.get(segment_uri, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        
+        # Only the full version prefix marks a response immutable
+        response = self.client.get(reverse('videos:stream_video', args=[video.id]) + f'?v={video.content_hash[0]}')
+        self.assertNotIn('immutable', response.get('Cache-Control', ''))
+        
+        # Past the last segment, or from a playlist cut with another duration
+        self.assertEqual(self.client.get(reverse('videos:video_hls_segment', args=[video.id, 2, 4])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('videos:video_hls_segment', args=[video.id, 6, 1])).status_code, 404)
+        
+        legacy = Video(title='Unsegmentable', creator=self.creator, genre='music', age_rating='G')
+        legacy.video_file.save('plain.mp4', ContentFile(b'not a video at all'))
+        response = self.client.get(reverse('videos:video_playlist', args=[legacy.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(reverse('videos:video_hls_init', args=[legacy.id])).status_code, 404)
+    
+    def test_offloaded_segments(self):
+        """With a front-end server, segments are written out once and handed to it"""
+        data = self.movie()
+        video = Video.objects.create(
+            title='Offloaded',
+            creator=self.creator,
+            genre='music',
+            age_rating='G',
+            video_file=SimpleUploadedFile('offloaded.mp4', data, content_type='video/mp4')
+        )
+        url = reverse('videos:video_hls_segment', args=[video.id, 2, 1]) + f'?v={video.content_hash[:16]}'
+        name = segment_name(video.content_hash, 2, 1)
+        
+        with override_settings(MEDIA_DELIVERY='x-accel-redirect'):
+            with mock.patch('videos.hls.segment_for', wraps=segment_for) as cut:
+                response = self.client.get(url)
+                self.client.get(url)
+            missing = self.client.get(reverse('videos:video_hls_segment', args=[video.id, 2, 4]))
+        self.assertEqual(cut.call_count, 1)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + name)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(missing.status_code, 404)
+        
+        streamed = b''.join(self.client.get(url).streaming_content)
+        with video.video_file.storage.open(name, 'rb') as f:
+            self.assertEqual(f.read(), streamed)
+        
+        # The segments go with the last reference to the content
+        with self.captureOnCommitCallbacks(execute=True):
+            video.delete()
+        self.assertFalse(video.video_file.storage.exists(name))
+    
+    def test_movie_cache_is_bounded_by_size(self):
+        """Parsed movies are evicted once their tables outgrow HLS_MOVIE_CACHE_BYTES"""
+        data = self.movie()
+        videos = [
+            Video.objects.create(
+                title=f'Movie {i}',
+                creator=self.creator,
+                genre='music',
+                age_rating='G',
+                video_file=SimpleUploadedFile(f'movie{i}.mp4', data + bytes([i]), content_type='video/mp4')
+            )
+            for i in range(3)
+        ]
+        movie, plan = load_movie(videos[0])
+        self.assertEqual(movie['tracks'][0]['offsets'].itemsize, 8)
+        hls_movies.clear()
+        
+        with mock.patch.object(hls_movies, 'max_weight', movie_weight(movie, plan) * 2):
+            for video in videos:
+                load_movie(video)
+        self.assertEqual(len(hls_movies), 2)
+        self.assertEqual(hls_movies.weight, movie_weight(movie, plan) * 2)
+
+
+# Jobs used by JobQueueTests; ``calls`` records what ran, in order
+calls = []
+
+
+@job('test_record')
+def record_job(label):
+    calls.append(label)
+    return label
+
+
+@job('test_flaky', max_attempts=3)
+def flaky_job(failures):
+    calls.append('flaky')
+    if calls.count('flaky') <= failures:
+        raise RuntimeError('Try again')
+    return 'ok'
+
+
+class JobQueueTests(TestCase):
+    """Tests for the database-backed background job queue"""
+    
+    def setUp(self):
+        calls.clear()
+    
+    def test_priorities(self):
+        """More urgent jobs run first, then oldest first"""
+        enqueue('test_record', {'label': 'old'})
+        enqueue('test_record', {'label': 'urgent'}, priority=5)
+        enqueue('test_record', {'label': 'new'})
+        enqueue('test_record', {'label': 'later'}, delay=60)
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(calls, ['urgent', 'old', 'new'])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 3)
+        self.assertEqual(Job.objects.get(status=Job.QUEUED).payload, {'label': 'later'})
+    
+    @override_settings(JOB_RETRY_BACKOFF=0)
+    def test_retries(self):
+        """Failures are retried until max_attempts, then the job fails"""
+        flaky = enqueue('test_flaky', {'failures': 2})
+        run_pending()
+        flaky.refresh_from_db()
+        self.assertEqual((flaky.status, flaky.attempts, flaky.result), (Job.DONE, 3, 'ok'))
+        
+        calls.clear()
+        broken = enqueue('test_flaky', {'failures': 5})
+        run_pending()
+        broken.refresh_from_db()
+        self.assertEqual((broken.status, broken.attempts), (Job.FAILED, 3))
+        self.assertEqual(broken.last_error, 'Try again')
+    
+    def test_backoff_and_visibility_timeout(self):
+        """Retries wait; jobs whose worker vanished are picked up again"""
+        flaky = enqueue('test_flaky', {'failures': 1})
+        self.assertEqual(run_pending(), 1)
+        flaky.refresh_from_db()
+        self.assertEqual(flaky.status, Job.QUEUED)
+        self.assertGreater(flaky.available_at, timezone.now())
+        
+        Job.objects.all().delete()
+        enqueue('test_record', {'label': 'slow'})
+        first = claim('worker-a')
+        self.assertIsNone(claim('worker-b'))
+        # worker-a overran its visibility timeout
+        Job.objects.filter(id=first.id).update(available_at=timezone.now() - timedelta(seconds=1))
+        second = claim('worker-b')
+        self.assertEqual((second.id, second.attempts), (first.id, 2))
+        
+        # The late result of worker-a is dropped; worker-b's counts
+        run_job(first)
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+        run_job(second)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+    
+    def test_upload_returns_pollable_job(self):
+        """Uploads answer with a job id the uploader can poll"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            User.objects.create_user(
+                username='jobcreator',
+                email='jobs@test.com',
+                password='testpass123',
+                user_type='creator'
+            )
+            self.client.login(username='jobcreator', password='testpass123')
+            response = self.client.post(reverse('videos:api_upload'), {
+                'title': 'Queued',
+                'genre': 'music',
+                'age_rating': 'G',
+                'video_file': SimpleUploadedFile('clip.mp4', mp4_movie(seconds=5), content_type='video/mp4'),
+            })
+            url = reverse('videos:api_job', args=[response.json()['job_id']])
+            self.assertEqual(self.client.get(url).json()['job']['status'], Job.QUEUED)
+            
+            run_pending()
+            job_data = self.client.get(url).json()['job']
+            self.assertEqual(job_data['status'], Job.DONE)
+            self.assertEqual(job_data['result'], {'faststart': True, 'metadata': True, 'playlist': False})
+            
+            User.objects.create_user(username='snoop', password='testpass123')
+            self.client.login(username='snoop', password='testpass123')
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class RecordingHttp(HttpMockSequence):
+    """HttpMockSequence that keeps the method and headers of each request"""
+    
+    def __init__(self, responses):
+        super().__init__(responses)
+        self.requests = []
+    
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.requests.append((method, uri.split('?')[0], dict(headers or {})))
+        return super().request(uri, method, body, headers, **kwargs)
+
+
+class DriveStorageTests(TestCase):
+    """Tests for the Google Drive storage backend"""
+    
+    META = '{"id": "drive-1", "size": "10", "modifiedTime": "2024-05-01T10:00:00.000Z"}'
+    
+    def setUp(self):
+        cache.clear()
+    
+    def storage(self, *responses, chunk_size=256 * 1024):
+        self.http = RecordingHttp(list(responses))
+        service = build('drive', 'v3', http=self.http, static_discovery=True)
+        return DriveStorage(folder_id='folder', chunk_size=chunk_size, service=service)
+    
+    def test_save_and_cached_metadata(self):
+        """Uploads are resumable and their metadata answers later calls"""
+        storage = self.storage(
+            ({'status': '200'}, '{"files": []}'),
+            ({'status': '200', 'location': 'https://upload.example/session'}, ''),
+            ({'status': '200'}, self.META),
+        )
+        name = storage.save('videos/ab/cd/clip.mp4', ContentFile(b'0123456789'))
+        self.assertEqual(name, 'videos/ab/cd/clip.mp4')
+        self.assertEqual([method for method, _, _ in self.http.requests], ['GET', 'POST', 'PUT'])
+        
+        # No more responses are queued: these must come from the cache
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(storage.size(name), 10)
+        self.assertEqual(storage.url(name), 'https://drive.google.com/file/d/drive-1/view')
+        self.assertEqual(storage.get_modified_time(name).year, 2024)
+        self.assertEqual(len(self.http.requests), 3)
+    
+    def test_open_streams_chunks(self):
+        """Reads download only the chunks they touch, seeks start a new download"""
+        storage = self.storage(
+            ({'status': '200'}, '{"files": [%s]}' % self.META),
+            ({'status': '206', 'content-range': 'bytes 0-3/10'}, b'0123'),
+            ({'status': '206', 'content-range': 'bytes 4-7/10'}, b'4567'),
+            ({'status': '206', 'content-range': 'bytes 8-9/10'}, b'89'),
+            chunk_size=4,
+        )
+        with storage.open('clip.mp4') as f:
+            self.assertEqual(f.size, 10)
+            self.assertEqual(f.read(6), b'012345')
+            f.seek(8)
+            self.assertEqual(f.read(), b'89')
+        ranges = [headers.get('range') for _, _, headers in self.http.requests[1:]]
+        self.assertEqual(ranges, ['bytes=0-3', 'bytes=4-7', 'bytes=8-11'])
+    
+    def test_missing_and_delete(self):
+        """Missing files raise FileNotFoundError; deletes forget the file"""
+        storage = self.storage(
+            ({'status': '200'}, '{"files": []}'),
+            ({'status': '200'}, '{"files": [%s]}' % self.META),
+            ({'status': '204'}, ''),
+        )
+        with self.assertRaises(FileNotFoundError):
+            storage.open('gone.mp4')
+        self.assertFalse(storage.exists('gone.mp4'))
+        
+        storage.delete('clip.mp4')
+        self.assertEqual(self.http.requests[-1][0], 'DELETE')
+        self.assertFalse(storage.exists('clip.mp4'))
+
+
+@override_settings(GOOGLE_DRIVE_RETRY_BACKOFF=0)
+class DriveBulkTests(TestCase):
+    """Tests for parallel and batched Drive calls, run against the fake"""
+    
+    def setUp(self):
+        cache.clear()
+        self.drive = FakeDrive()
+        self.service = self.drive.service()
+    
+    def test_bulk_upload_shares_in_one_batch(self):
+        """Uploads run in parallel; permissions go out in a single batch"""
+        files = [(f'clip-{index}.mp4', io.BytesIO(b'x' * index)) for index in range(1, 7)]
+        results = bulk_upload(files, folder_id='folder', public=True, service=self.service, workers=3)
+        self.assertEqual([result['size'] for result in results], ['1', '2', '3', '4', '5', '6'])
+        self.assertTrue(all(result['public'] for result in results))
+        # One initiation and one chunk per file, plus the permissions batch
+        self.assertEqual(self.drive.round_trips, 13)
+        for result in results:
+            self.assertEqual(self.drive.files[result['id']]['permissions'], [{'role': 'reader', 'type': 'anyone'}])
+    
+    def test_retries_and_batched_info_and_delete(self):
+        """429 and 5xx answers are retried; other errors are reported per file"""
+        self.drive.fail_next(503)
+        [uploaded] = bulk_upload([('clip.mp4', io.BytesIO(b'0123'))], service=self.service)
+        self.assertEqual(uploaded['size'], '4')
+        
+        self.drive.fail_next(429)
+        info = bulk_info([uploaded['id'], 'missing'], service=self.service)
+        self.assertEqual(info[uploaded['id']]['size'], '4')
+        self.assertEqual(info['missing'].resp.status, 404)
+        
+        self.drive.fail_next(400)
+        [failed] = bulk_upload([('bad.mp4', io.BytesIO(b'0'))], service=self.service)
+        self.assertEqual(failed.resp.status, 400)
+        
+        self.assertEqual(bulk_delete([uploaded['id'], 'missing'], service=self.service), {
+            uploaded['id']: True,
+            'missing': True,
+        })
+        self.assertEqual(self.drive.files, {})
+    
+    @override_settings(GOOGLE_DRIVE_NUM_RETRIES=1, GOOGLE_DRIVE_RETRY_BACKOFF=0)
+    def test_failed_batch_is_reported_per_file(self):
+        """A batch request that never gets through is every call's error, not an exception"""
+        [uploaded] = bulk_upload([('clip.mp4', io.BytesIO(b'0123'))], service=self.service)
+        unavailable = (httplib2.Response({'status': '503'}), b'{}')
+        with mock.patch.object(self.drive, '_batch', return_value=unavailable):
+            info = bulk_info([uploaded['id'], 'other'], service=self.service)
+        self.assertEqual(
+            {key: error.resp.status for key, error in info.items()},
+            {uploaded['id']: 503, 'other': 503}
+        )
+        
+        with mock.patch.object(self.drive, '_batch', side_effect=ConnectionResetError('reset')):
+            deleted = bulk_delete([uploaded['id']], service=self.service)
+        self.assertIsInstance(deleted[uploaded['id']], ConnectionResetError)
+        self.assertIn(uploaded['id'], self.drive.files)
+    
+    def test_storage_round_trip(self):
+        """DriveStorage saves and streams files through the fake"""
+        storage = DriveStorage(folder_id='folder', chunk_size=256 * 1024, service=self.service)
+        payload = os.urandom(600 * 1024)
+        name = storage.save('videos/ab/cd/clip.mp4', ContentFile(payload))
+        with storage.open(name) as f:
+            f.seek(300 * 1024)
+            self.assertEqual(f.read(1024), payload[300 * 1024:301 * 1024])
+            f.seek(0)
+            self.assertEqual(f.read(), payload)
+        
+        helper = GoogleDriveStorage(service=self.service)
+        file_id = storage.url(name).split('/')[-2]
+        self.assertEqual(helper.get_files_info([file_id])[file_id]['name'], name)
+
+
+class InlineExecutor(Executor):
+    """Runs submitted calls right away; SQLite's in-memory test database locks out other threads"""
+    
+    def __init__(self, max_workers=None):
+        pass
+    
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class MediaMigrationTests(TransactionTestCase):
+    """Tests for moving media between local storage and Drive"""
+    
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, FASTSTART_UPLOADS=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.drive = FakeDrive()
+        service_patch = mock.patch('videos.drive.drive_service', return_value=self.drive.service())
+        service_patch.start()
+        self.addCleanup(service_patch.stop)
+        executor_patch = mock.patch('videos.management.commands.migrate_media.ThreadPoolExecutor', InlineExecutor)
+        executor_patch.start()
+        self.addCleanup(executor_patch.stop)
+        
+        User.objects.create_user(
+            username='migratecreator',
+            email='migrate@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.client.login(username='migratecreator', password='testpass123')
+        self.contents = [MP4_HEADER + os.urandom(2048) for _ in range(2)]
+        self.videos = [self.upload(content) for content in self.contents + self.contents[:1]]
+    
+    def upload(self, content):
+        response = self.client.post(reverse('videos:api_upload'), {
+            'title': 'Moving clip',
+            'genre': 'music',
+            'age_rating': 'G',
+            'video_file': SimpleUploadedFile('clip.mp4', content, content_type='video/mp4'),
+        })
+        return Video.objects.get(id=response.json()['video_id'])
+    
+    def test_round_trip(self):
+        """Files move to Drive and back, once per content, with rows switched over"""
+        out = StringIO()
+        call_command('migrate_media', 'drive', workers=2, chunk_size=1, stdout=out)
+        self.assertIn('files/s', out.getvalue())
+        
+        on_drive = list(Video.objects.order_by('id'))
+        for video in on_drive:
+            self.assertFalse(video.video_file)
+            file_id = video.external_url.split('/')[-2]
+            self.assertEqual(video.video_url, f'https://drive.google.com/uc?export=download&id={file_id}')
+        self.assertEqual(on_drive[0].external_url, on_drive[2].external_url)
+        self.assertEqual(len(self.drive.files), 2)
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual([files for _, _, files in os.walk(settings.MEDIA_ROOT) if files], [])
+        self.assertFalse(MediaMigrationCheckpoint.objects.exists())
+        
+        call_command('migrate_media', 'local', workers=2, stdout=StringIO())
+        for video, content in zip(Video.objects.order_by('id'), self.contents + self.contents[:1]):
+            self.assertIsNone(video.external_url)
+            with video.video_file.open('rb') as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(sorted(MediaBlob.objects.values_list('ref_count', flat=True)), [1, 2])
+        self.assertEqual(self.drive.files, {})
+    
+    def test_deleting_migrated_video_keeps_shared_file(self):
+        """A video moved to Drive no longer holds the blob its twin still uses"""
+        from videos.media_transfer import move_to_drive
+        first, _, twin = self.videos
+        path = twin.video_file.path
+        move_to_drive(first)
+        
+        first.refresh_from_db()
+        self.assertEqual(first.content_hash, '')
+        self.assertEqual(MediaBlob.objects.get(sha256=twin.content_hash).ref_count, 1)
+        first.delete()
+        self.assertEqual(MediaBlob.objects.get(sha256=twin.content_hash).ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+    
+    def test_resumes_after_failure(self):
+        """A failed video holds the checkpoint back; the next run starts from it"""
+        from videos.media_transfer import move_to_drive
+        first, second, third = self.videos
+        
+        def flaky(video, drive):
+            if video.id == second.id:
+                raise OSError('connection reset')
+            return move_to_drive(video, drive)
+        
+        with mock.patch('videos.management.commands.migrate_media.move_to_drive', side_effect=flaky):
+            with self.assertRaises(CommandError):
+                call_command('migrate_media', 'drive', workers=1, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(MediaMigrationCheckpoint.objects.get(direction='drive').last_video_id, first.id)
+        self.assertTrue(Video.objects.get(id=second.id).video_file)
+        self.assertFalse(Video.objects.get(id=third.id).video_file)
+        
+        out = StringIO()
+        call_command('migrate_media', 'drive', workers=1, stdout=out)
+        self.assertIn(f'Resuming after video {first.id}', out.getvalue())
+        self.assertIn('Moved 1 videos', out.getvalue())
+        self.assertFalse(Video.objects.exclude(video_file='').exists())
+
+
+@override_settings(
+    TIER_WINDOW_HOURS=24,
+    TIER_HOT_SCORE=5,
+    TIER_COLD_SCORE=2,
+    TIER_LIFETIME_VIEW_WEIGHT=0.1,
+    TIER_HOT_BYTES=3000,
+)
+class StorageTieringTests(TestCase):
+    """Tests for moving videos between the hot and cold storage tiers"""
+    
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.drive = FakeDrive()
+        service_patch = mock.patch('videos.drive.drive_service', return_value=self.drive.service())
+        service_patch.start()
+        self.addCleanup(service_patch.stop)
+        
+        creator = User.objects.create_user(
+            username='tiercreator',
+            email='tier@test.com',
+            password='testpass123',
+            user_type='creator'
+        )
+        self.videos = [
+            Video.objects.create(
+                title=f'Tiered {index}',
+                creator=creator,
+                genre='music',
+                age_rating='G',
+                video_file=SimpleUploadedFile('clip.mp4', MP4_HEADER + os.urandom(2000)),
+            )
+            for index in range(3)
+        ]
+        Job.objects.all().delete()
+        # Old enough to have had a full window of views
+        Video.objects.update(created_at=timezone.now() - timedelta(days=3))
+    
+    def retier_and_run(self):
+        promote, demote = retier()
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pending()
+        return promote, demote
+    
+    def test_window_slides(self):
+        """Buffered views land in the window and drop out of it with time"""
+        buffer = ViewCountBuffer()
+        with override_settings(VIEW_COUNT_FLUSH_INTERVAL=60):
+            with mock.patch.object(buffer, '_ensure_flusher'):
+                buffer.increment(self.videos[0].id, 3)
+                buffer.increment(self.videos[1].id)
+            buffer.flush()
+        record_access({self.videos[0].id: 2})
+        
+        self.assertEqual(recent_views(), {self.videos[0].id: 5, self.videos[1].id: 1})
+        self.assertEqual(recent_views(timezone.now() + timedelta(hours=25)), {})
+        self.assertEqual(Video.objects.get(id=self.videos[0].id).views, 3)
+    
+    def test_demote_then_promote(self):
+        """Cold videos move to Drive, videos that warm up come back within the budget"""
+        first, second, third = self.videos
+        record_access({first.id: 10, second.id: 3})
+        
+        # second qualifies to stay but does not fit the budget next to first
+        self.assertEqual(self.retier_and_run(), ([], [second.id, third.id]))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(first.video_file)
+        self.assertIn('uc?export=download', second.video_url)
+        self.assertEqual(len(self.drive.files), 2)
+        self.assertEqual(self.retier_and_run(), ([], []))
+        
+        # Lifetime views count too: 3 recent + 0.1 * 40 clears the hot score
+        VideoAccessBucket.objects.all().delete()
+        Video.objects.filter(id=third.id).update(views=40)
+        record_access({third.id: 3})
+        self.assertEqual(self.retier_and_run(), ([third.id], [first.id]))
+        third.refresh_from_db()
+        self.assertEqual(third.video_url, reverse('videos:stream_video', args=[third.id]))
+        with third.video_file.open('rb') as f:
+            self.assertTrue(f.read().startswith(MP4_HEADER))
+        self.assertFalse(Video.objects.get(id=first.id).video_file)
+        self.assertEqual(len(self.drive.files), 2)
+    
+    def test_demoted_twin_leaves_shared_file(self):
+        """Demoting a video whose content a hot video shares keeps the file"""
+        first = self.videos[0]
+        with first.video_file.open('rb') as f:
+            content = f.read()
+        twin = Video.objects.create(
+            title='Twin',
+            creator=first.creator,
+            genre='music',
+            age_rating='G',
+            video_file=SimpleUploadedFile('twin.mp4', content),
+        )
+        Job.objects.all().delete()
+        Video.objects.update(created_at=timezone.now() - timedelta(days=3))
+        record_access({first.id: 10})
+        
+        self.assertEqual(self.retier_and_run(), ([], [self.videos[1].id, self.videos[2].id, twin.id]))
+        first.refresh_from_db()
+        self.assertEqual(MediaBlob.objects.get(sha256=first.content_hash).ref_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.get(id=twin.id).delete()
+        self.assertEqual(MediaBlob.objects.get(sha256=first.content_hash).ref_count, 1)
+        with first.video_file.open('rb') as f:
+            self.assertEqual(f.read(), content)
+    
+    def test_new_uploads_and_queued_moves_not_repeated(self):
+        """Uploads younger than the window stay; a queued move is not queued twice"""
+        Video.objects.filter(id=self.videos[0].id).update(created_at=timezone.now())
+        self.assertEqual(retier(), ([], [self.videos[1].id, self.videos[2].id]))
+        retier()
+        self.assertEqual(Job.objects.filter(name='demote_video').count(), 2)
+
+
+class LowWriteSessionTests(TestCase):
+    """Tests for the cache-first session engine"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def session_writes(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith(('UPDATE "django_session"', 'INSERT INTO "django_session"'))]
+    
+    def test_requests_leave_unchanged_sessions_alone(self):
+        """Logged-in requests read the session from the cache and write nothing"""
+        user = User.objects.create_user(username='sessionuser', password='testpass123')
+        self.client.force_login(user)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('videos:api_user_status'))
+        self.assertTrue(response.json()['authenticated'])
+        self.assertEqual(self.session_writes(queries), [])
+        self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+    
+    def test_changed_data_is_written(self):
+        """Changes are saved to the database and the cache"""
+        session = SessionStore()
+        session['cart'] = 1
+        session.save()
+        
+        loaded = SessionStore(session.session_key)
+        with self.assertNumQueries(0):
+            self.assertEqual(loaded['cart'], 1)
+            loaded.save()
+        loaded['cart'] = 2
+        loaded.save()
+        
+        cache.clear()
+        self.assertEqual(SessionStore(session.session_key)['cart'], 2)
+    
+    def test_expiry_refresh_is_coalesced(self):
+        """A session close to expiring is refreshed by one of the requests that notice"""
+        session = SessionStore()
+        session['cart'] = 1
+        session.save()
+        Session.objects.filter(session_key=session.session_key).update(expire_date=timezone.now() + timedelta(minutes=5))
+        cache.clear()
+        
+        first, second = SessionStore(session.session_key), SessionStore(session.session_key)
+        first.load()
+        second.load()
+        first.save()
+        with self.assertNumQueries(0):
+            second.save()
+        
+        expire_date = Session.objects.get(session_key=session.session_key).expire_date
+        self.assertGreater(expire_date, timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE - 60))
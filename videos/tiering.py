@@ -0,0 +1,143 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from .drive import drive_file_id
+from .jobs import enqueue
+from .models import Job, Video, VideoAccessBucket
+
+# Videos read per query while planning
+PLAN_BATCH_SIZE = 500
+
+# Keep each statement under SQLite's bound-parameter limit
+RECORD_BATCH_SIZE = 500
+
+PROMOTE_JOB = 'promote_video'
+DEMOTE_JOB = 'demote_video'
+
+
+def bucket_at(when=None):
+    """Number of the window slot ``when`` (default now) falls in"""
+    when = when or timezone.now()
+    return int(when.timestamp() // (settings.TIER_BUCKET_MINUTES * 60))
+
+
+def window_start(now=None):
+    """First slot of the sliding window ending at ``now``"""
+    return bucket_at(now) - settings.TIER_WINDOW_HOURS * 60 // settings.TIER_BUCKET_MINUTES + 1
+
+
+def record_access(counts):
+    """
+    Add ``{video_id: views}`` to the current slot of each video's window.
+
+    Called by the view count buffer as it writes, so this costs one insert
+    and one update per distinct count per flush rather than a write per hit.
+    """
+    bucket = bucket_at()
+    ids = list(counts)
+    for start in range(0, len(ids), RECORD_BATCH_SIZE):
+        VideoAccessBucket.objects.bulk_create(
+            [VideoAccessBucket(video_id=video_id, bucket=bucket) for video_id in ids[start:start + RECORD_BATCH_SIZE]],
+            ignore_conflicts=True,
+        )
+
+    ids_by_count = defaultdict(list)
+    for video_id, count in counts.items():
+        ids_by_count[count].append(video_id)
+    for count, ids in ids_by_count.items():
+        for start in range(0, len(ids), RECORD_BATCH_SIZE):
+            VideoAccessBucket.objects.filter(
+                bucket=bucket, video_id__in=ids[start:start + RECORD_BATCH_SIZE]
+            ).update(count=F('count') + count)
+
+
+def recent_views(now=None):
+    """Views per video within the sliding window, for videos that had any"""
+    return dict(
+        VideoAccessBucket.objects.filter(bucket__gte=window_start(now))
+        .values('video_id')
+        .annotate(total=Sum('count'))
+        .values_list('video_id', 'total')
+    )
+
+
+def tier_score(views, recent):
+    return recent + settings.TIER_LIFETIME_VIEW_WEIGHT * views
+
+
+def plan_tiers(now=None):
+    """
+    Decide which videos change tier; returns ``(promote, demote)`` id lists.
+
+    Local (hot) videos stay while they score TIER_COLD_SCORE, Drive (cold)
+    videos need TIER_HOT_SCORE to come back; the gap keeps videos near
+    the line from moving back and forth. Uploads younger than the window
+    have not had the chance to collect views and are kept. Everything that
+    qualifies is then ranked by score and kept local until TIER_HOT_BYTES
+    is used up. Videos with no file in either place are left alone.
+    """
+    now = now or timezone.now()
+    recent = recent_views(now)
+    new_since = now - timedelta(hours=settings.TIER_WINDOW_HOURS)
+    rows = Video.objects.exclude(
+        (Q(video_file='') | Q(video_file__isnull=True)) & Q(external_url__isnull=True)
+    ).order_by('id').values_list('id', 'views', 'file_size', 'video_file', 'external_url', 'created_at')
+
+    candidates = []
+    demote = []
+    last_id = 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:PLAN_BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        for video_id, views, file_size, video_file, external_url, created_at in batch:
+            local = bool(video_file)
+            if not local and drive_file_id(external_url) is None:
+                continue
+            score = tier_score(views, recent.get(video_id, 0))
+            if score >= (settings.TIER_COLD_SCORE if local else settings.TIER_HOT_SCORE):
+                candidates.append((score, video_id, file_size or 0, local))
+            elif local and created_at >= new_since:
+                # New uploads go last in line for the budget
+                candidates.append((float('-inf'), video_id, file_size or 0, local))
+            elif local:
+                demote.append(video_id)
+
+    promote = []
+    used = 0
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+    for score, video_id, size, local in candidates:
+        if used + size <= settings.TIER_HOT_BYTES:
+            used += size
+            if not local:
+                promote.append(video_id)
+        elif local:
+            demote.append(video_id)
+    return promote, sorted(demote)
+
+
+def retier(now=None, dry_run=False):
+    """
+    Plan tier changes and queue a job for each move that is not already queued.
+
+    Returns ``(promote, demote)`` as planned. The moves themselves run in
+    the promote_video and demote_video jobs (videos.tasks). Window slots
+    that have fallen out of the window are deleted.
+    """
+    promote, demote = plan_tiers(now)
+    if dry_run:
+        return promote, demote
+
+    queued = set(
+        Job.objects.filter(name__in=[PROMOTE_JOB, DEMOTE_JOB], status__in=[Job.QUEUED, Job.RUNNING])
+        .values_list('name', 'payload__video_id')
+    )
+    for name, ids in ((PROMOTE_JOB, promote), (DEMOTE_JOB, demote)):
+        for video_id in ids:
+            if (name, video_id) not in queued:
+                enqueue(name, {'video_id': video_id})
+    VideoAccessBucket.objects.filter(bucket__lt=window_start(now)).delete()
+    return promote, demote
@@ -0,0 +1,70 @@
+import math
+from django.conf import settings
+from django.utils import timezone
+from .cards import invalidate_video_lists
+from .models import Video
+
+# Engagement weights for the hotness score. rating_sum rewards both the
+# number of ratings and how many stars they gave.
+HOTNESS_WEIGHTS = {
+    'views': 1,
+    'likes': 4,
+    'comments_count': 6,
+    'rating_sum': 2,
+}
+
+# Stored scores closer than this are left alone by refresh_hotness
+HOTNESS_TOLERANCE = 1e-6
+
+
+def decay_seconds():
+    """Time constant of the exponential decay, from the configured half-life"""
+    half_life = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24)
+    return half_life * 3600 / math.log(2)
+
+
+def hotness_score(created_at, **engagement):
+    """
+    Hotness of a video with the given engagement counts.
+
+    This is ``log(engagement * exp(-(now - created_at) / tau))`` without the
+    ``-now / tau`` term, which is the same for every video. Scores therefore
+    keep their order as time passes and only need recomputing when a
+    video's engagement changes.
+    """
+    weighted = sum(weight * (engagement.get(field) or 0) for field, weight in HOTNESS_WEIGHTS.items())
+    return math.log1p(max(weighted, 0)) + created_at.timestamp() / decay_seconds()
+
+
+def video_hotness(video):
+    created_at = video.created_at or timezone.now()
+    return hotness_score(created_at, **{field: getattr(video, field) for field in HOTNESS_WEIGHTS})
+
+
+def refresh_hotness(queryset=None, batch_size=500):
+    """
+    Recompute hotness for ``queryset`` (all videos by default) and write
+    only the scores that changed. Rows are walked in id order one batch at a
+    time so memory stays bounded. Returns the number of videos updated.
+    """
+    if queryset is None:
+        queryset = Video.objects.all()
+    rows = queryset.order_by('id').values_list('id', 'hotness', 'created_at', *HOTNESS_WEIGHTS)
+
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            if updated:
+                invalidate_video_lists()
+            return updated
+        last_id = batch[-1][0]
+        changed = []
+        for video_id, hotness, created_at, *counts in batch:
+            score = hotness_score(created_at, **dict(zip(HOTNESS_WEIGHTS, counts)))
+            if abs(score - hotness) > HOTNESS_TOLERANCE:
+                changed.append(Video(id=video_id, hotness=score))
+        if changed:
+            Video.objects.bulk_update(changed, ['hotness'])
+            updated += len(changed)
@@ -0,0 +1,107 @@
+import hashlib
+import os
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+# Containers each accepted extension may hold
+EXTENSION_CONTAINERS = {
+    '.mp4': 'isobmff',
+    '.mov': 'isobmff',
+    '.avi': 'avi',
+    '.wmv': 'asf',
+}
+
+# Top-level boxes an MP4/MOV file can open with. ``ftyp`` is standard;
+# older QuickTime files start straight with one of the others.
+ISOBMFF_BOXES = {b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot'}
+
+ASF_HEADER_GUID = bytes.fromhex('3026b2758e66cf11a6d900aa0062ce6c')
+
+# Bytes needed to recognise any of the containers above
+SNIFF_LENGTH = 16
+
+
+def sniff_container(head):
+    """Identify the container from the first ``SNIFF_LENGTH`` bytes of a file"""
+    if head[4:8] in ISOBMFF_BOXES:
+        return 'isobmff'
+    if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return 'avi'
+    if head[:16] == ASF_HEADER_GUID:
+        return 'asf'
+    return None
+
+
+def container_error(filename, head):
+    """Return why ``head`` is not a valid start of ``filename``, or None"""
+    expected = EXTENSION_CONTAINERS.get(os.path.splitext(filename)[1].lower())
+    if expected is None:
+        return 'Please upload a valid video file (MP4, AVI, MOV, WMV).'
+    if sniff_container(head) != expected:
+        return 'The file content does not match its extension. Please upload a real MP4, AVI, MOV or WMV video.'
+    return None
+
+
+def max_upload_size():
+    return getattr(settings, 'VIDEO_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+
+
+class VideoUploadHandler(TemporaryFileUploadHandler):
+    """
+    Validate ``video_file`` uploads while they are still arriving.
+
+    The container signature is checked on the first bytes and the size on
+    every chunk, so a wrong or oversized file stops the request after a few
+    kilobytes instead of after the whole body has been spooled. Accepted
+    files go straight to a temp file (never to memory) with their SHA-256
+    computed on the way, available as ``uploaded_file.sha256``.
+
+    Uploads to other fields are passed on to the next handler. Rejections
+    are recorded in ``request.upload_error`` for the form to report.
+    """
+
+    field_name = 'video_file'
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        self.active = field_name == self.field_name
+        if not self.active:
+            return
+        self.head = b''
+        self.received = 0
+        self.digest = hashlib.sha256()
+        if os.path.splitext(file_name)[1].lower() not in EXTENSION_CONTAINERS:
+            self.reject(container_error(file_name, b''))
+        super().new_file(field_name, file_name, *args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        self.received += len(raw_data)
+        if self.received > max_upload_size():
+            self.reject(f'File size must be less than {max_upload_size() // (1024 * 1024)}MB.')
+
+        if len(self.head) < SNIFF_LENGTH:
+            self.head += raw_data[:SNIFF_LENGTH - len(self.head)]
+            if len(self.head) == SNIFF_LENGTH:
+                error = container_error(self.file_name, self.head)
+                if error:
+                    self.reject(error)
+
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if len(self.head) < SNIFF_LENGTH:
+            # Too short to be any video
+            self.reject(container_error(self.file_name, self.head))
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+    def reject(self, error):
+        """Abort the request without reading the rest of the body"""
+        self.request.upload_error = error
+        raise StopUpload(connection_reset=True)
@@ -0,0 +1,163 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .jobs import enqueue
+from .media_store import media_storage, store_local_file
+from .models import MediaBlob, UploadSession, Video
+from .upload_handlers import EXTENSION_CONTAINERS, SNIFF_LENGTH, container_error
+
+# Bytes read from the request and written to disk at a time
+WRITE_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """An upload request that cannot be applied; ``status`` is the HTTP code"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def open_session(user, filename, size, metadata):
+    """Start a resumable upload of ``size`` bytes and create its empty temp file"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in EXTENSION_CONTAINERS:
+        raise UploadError('Please upload a valid video file (MP4, AVI, MOV, WMV)')
+    if size <= 0 or size > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+        raise UploadError(
+            f'File size must be between 1 byte and {settings.RESUMABLE_UPLOAD_MAX_SIZE // (1024 * 1024)}MB'
+        )
+
+    session = UploadSession.objects.create(
+        user=user,
+        filename=os.path.basename(filename),
+        size=size,
+        metadata=metadata,
+    )
+    os.makedirs(settings.RESUMABLE_UPLOAD_DIR, exist_ok=True)
+    open(session.temp_path, 'wb').close()
+    return session
+
+
+def write_chunk(session_id, user, offset, stream, length):
+    """
+    Write ``length`` bytes from ``stream`` at ``offset`` of an upload.
+
+    The chunk is copied in ``WRITE_BLOCK_SIZE`` blocks, so memory use does
+    not depend on the chunk or file size. ``offset`` must equal the bytes
+    already received. The chunk is first streamed from the client into a
+    temp file of its own, outside any transaction. The offset is then
+    advanced with an UPDATE conditional on it still being ``offset``, and
+    only the request that wins it copies its bytes into the upload, before
+    committing; of two requests sending the same chunk at once the other
+    gets a 409 and never touches the upload's file. An interrupted chunk
+    leaves the offset where it was and is simply sent again.
+    """
+    if length > settings.RESUMABLE_UPLOAD_CHUNK_SIZE:
+        raise UploadError('Chunk too large', status=413)
+
+    session = UploadSession.objects.get(id=session_id, user=user)
+    if offset != session.offset:
+        raise UploadError(f'Expected offset {session.offset}', status=409)
+    if offset + length > session.size:
+        raise UploadError('Chunk runs past the declared file size')
+
+    with tempfile.TemporaryFile(dir=settings.RESUMABLE_UPLOAD_DIR) as chunk:
+        written = 0
+        while written < length:
+            block = stream.read(min(WRITE_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            chunk.write(block)
+            written += len(block)
+        if written != length:
+            raise UploadError('Chunk was shorter than its Content-Length')
+
+        # The copy is local and at most a chunk long; holding the row
+        # until it is on disk keeps finalize from seeing the new offset
+        # before the bytes
+        with transaction.atomic():
+            advanced = UploadSession.objects.filter(id=session.id, offset=offset).update(
+                offset=F('offset') + written, updated_at=timezone.now()
+            )
+            if not advanced:
+                raise UploadError('Another request wrote this chunk first', status=409)
+            chunk.seek(0)
+            with open(session.temp_path, 'r+b') as temp:
+                temp.seek(offset)
+                shutil.copyfileobj(chunk, temp, WRITE_BLOCK_SIZE)
+    session.offset += written
+    return session
+
+
+def _restore_temp(blob, path):
+    """
+    Put a stored upload back at ``path`` after finalizing it rolled back.
+
+    A blob created by the rolled back transaction left its file behind
+    unreferenced and it is moved back; content other videos still use is
+    copied.
+    """
+    storage = media_storage()
+    orphaned = not MediaBlob.objects.filter(sha256=blob.sha256).exists()
+    with storage.open(blob.name, 'rb') as source, open(path, 'wb') as target:
+        shutil.copyfileobj(source, target, WRITE_BLOCK_SIZE)
+    if orphaned:
+        storage.delete(blob.name)
+
+
+def finalize(session_id, user):
+    """
+    Turn a fully received upload into a Video.
+
+    The file goes into content-addressed storage: on local storage the
+    temp file is renamed into place, which is atomic and copies nothing,
+    and content that is already stored is not stored again. Should a later
+    step fail, the file is put back so the upload can be finalized again.
+    Processing the file is left to the job queued by saving the video,
+    available as ``video.processing_job``.
+    """
+    blob = None
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(id=session_id, user=user)
+            if session.offset != session.size:
+                raise UploadError(f'Upload incomplete: {session.offset} of {session.size} bytes', status=409)
+            with open(session.temp_path, 'rb') as temp:
+                error = container_error(session.filename, temp.read(SNIFF_LENGTH))
+            if error:
+                raise UploadError(error)
+
+            video = Video(creator=user, **session.metadata)
+            blob = store_local_file(session.temp_path, session.filename)
+            video.video_file = blob.name
+            video.file_size = blob.size
+            video.content_hash = blob.sha256
+            video.save()
+            video.processing_job = enqueue('process_video', {'video_id': video.id}, user=user)
+            session.delete()
+    except BaseException:
+        if blob is not None and not os.path.exists(session.temp_path):
+            _restore_temp(blob, session.temp_path)
+        raise
+    return video
+
+
+def discard(session):
+    """Delete an upload session and whatever it received"""
+    try:
+        os.remove(session.temp_path)
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def expired_sessions():
+    """Sessions that have not received a chunk within RESUMABLE_UPLOAD_EXPIRY_HOURS"""
+    cutoff = timezone.now() - timedelta(hours=settings.RESUMABLE_UPLOAD_EXPIRY_HOURS)
+    return UploadSession.objects.filter(updated_at__lt=cutoff)
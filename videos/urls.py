@@ -3,10 +3,15 @@ from . import views
 from .api_views import (
     VideosAPIView, 
     VideoDetailAPIView, 
+    SearchSuggestAPIView,
     AuthAPIView, 
     UserStatusAPIView, 
     CSRFTokenAPIView,
     UploadAPIView,
+    UploadSessionsAPIView,
+    UploadSessionAPIView,
+    UploadCompleteAPIView,
+    JobAPIView,
     RatingAPIView
 )
 
@@ -19,14 +24,23 @@ urlpatterns = [
     path('upload/', views.creator_upload, name='creator_upload'),
     path('my-videos/', views.my_videos, name='my_videos'),
     path('rate/<int:video_id>/', views.rate_video, name='rate_video'),
+    path('video/<int:video_id>/stream/', views.stream_video, name='stream_video'),
+    path('video/<int:video_id>/playlist.m3u8', views.video_playlist, name='video_playlist'),
+    path('video/<int:video_id>/hls/init.mp4', views.video_hls_init, name='video_hls_init'),
+    path('video/<int:video_id>/hls/<int:duration>/<int:index>.m4s', views.video_hls_segment, name='video_hls_segment'),
     
     # API endpoints for React frontend
     path('api/videos/', VideosAPIView.as_view(), name='api_videos_list'),
     path('api/videos/<int:video_id>/', VideoDetailAPIView.as_view(), name='api_video_detail'),
+    path('api/search/suggest/', SearchSuggestAPIView.as_view(), name='api_search_suggest'),
     path('api/auth/', AuthAPIView.as_view(), name='api_auth'),
     path('api/user-status/', UserStatusAPIView.as_view(), name='api_user_status'),
     path('api/csrf-token/', CSRFTokenAPIView.as_view(), name='api_csrf_token'),
     path('api/upload/', UploadAPIView.as_view(), name='api_upload'),
+    path('api/uploads/', UploadSessionsAPIView.as_view(), name='api_upload_sessions'),
+    path('api/uploads/<uuid:upload_id>/', UploadSessionAPIView.as_view(), name='api_upload_session'),
+    path('api/uploads/<uuid:upload_id>/complete/', UploadCompleteAPIView.as_view(), name='api_upload_complete'),
+    path('api/jobs/<int:job_id>/', JobAPIView.as_view(), name='api_job'),
     path('api/rate/<int:video_id>/', RatingAPIView.as_view(), name='api_rate_video'),
     
     # Legacy API endpoint (keep for backward compatibility)
@@ -1,18 +1,22 @@
-import os
-import io
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
+import logging
+from googleapiclient.http import MediaFileUpload
 from django.conf import settings
+from .drive import drive_service
+from . import drive_bulk
+
+logger = logging.getLogger(__name__)
 
 class GoogleDriveStorage:
-    def __init__(self):
-        if settings.GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE:
-            credentials = service_account.Credentials.from_service_account_file(
-                settings.GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE,
-                scopes=['https://www.googleapis.com/auth/drive']
-            )
-            self.service = build('drive', 'v3', credentials=credentials)
+    """
+    Helpers for single Drive files. Files stored through Django go through
+    videos.drive.DriveStorage instead.
+    """
+    def __init__(self, service=None):
+        # The client is shared by the whole process, see drive_service
+        if service is not None:
+            self.service = service
+        elif settings.GOOGLE_DRIVE_STORAGE_JSON_KEY_FILE:
+            self.service = drive_service()
         else:
             self.service = None
 
@@ -42,9 +46,58 @@ class GoogleDriveStorage:
             
             return f"https://drive.google.com/file/d/{file.get('id')}/view"
         except Exception as e:
-            print(f"Error uploading to Google Drive: {e}")
+            logger.error(f"Error uploading to Google Drive: {str(e)}")
             return None
 
+    def upload_files(self, files, folder_id=None):
+        """
+        Upload many ``(file_path, file_name)`` pairs to Google Drive at once.
+
+        Uploads run in parallel and the public permissions are set in
+        batches, see videos.drive_bulk. Returns the URL of each file in
+        order, None where it failed.
+        """
+        if not self.service:
+            return [None] * len(files)
+
+        results = drive_bulk.bulk_upload(
+            [(file_name, file_path) for file_path, file_name in files],
+            folder_id=folder_id, public=True, service=self.service,
+        )
+        urls = []
+        for (file_path, _), result in zip(files, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error uploading {file_path} to Google Drive: {str(result)}")
+                urls.append(None)
+            elif not result['public']:
+                logger.error(f"Error sharing {file_path} on Google Drive")
+                urls.append(None)
+            else:
+                urls.append(self.get_file_url(result['id']))
+        return urls
+
+    def delete_files(self, file_ids):
+        """Delete many files from Google Drive; maps each id to whether it is gone"""
+        if not self.service:
+            return {file_id: False for file_id in file_ids}
+
+        results = drive_bulk.bulk_delete(file_ids, service=self.service)
+        for file_id, result in results.items():
+            if result is not True:
+                logger.error(f"Error deleting {file_id} from Google Drive: {str(result)}")
+        return {file_id: result is True for file_id, result in results.items()}
+
+    def get_files_info(self, file_ids):
+        """Information on many files; maps each id to its info, or None"""
+        if not self.service:
+            return {file_id: None for file_id in file_ids}
+
+        results = drive_bulk.bulk_info(file_ids, fields='*', service=self.service)
+        return {
+            file_id: None if isinstance(result, Exception) else result
+            for file_id, result in results.items()
+        }
+
     def delete_file(self, file_id):
         """Delete file from Google Drive"""
         if not self.service:
@@ -54,7 +107,7 @@ class GoogleDriveStorage:
             self.service.files().delete(fileId=file_id).execute()
             return True
         except Exception as e:
-            print(f"Error deleting from Google Drive: {e}")
+            logger.error(f"Error deleting from Google Drive: {str(e)}")
             return False
 
     def get_file_url(self, file_id):
@@ -70,5 +123,5 @@ class GoogleDriveStorage:
             file_info = self.service.files().get(fileId=file_id).execute()
             return file_info
         except Exception as e:
-            print(f"Error getting file info: {e}")
+            logger.error(f"Error getting file info: {str(e)}")
             return None
@@ -0,0 +1,116 @@
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from .models import Video
+from .tiering import record_access
+
+logger = logging.getLogger(__name__)
+
+# Keep each UPDATE under SQLite's bound-parameter limit
+FLUSH_BATCH_SIZE = 500
+
+
+class ViewCountBuffer:
+    """
+    Write-behind buffer for video view counts.
+
+    Hits are accumulated in process memory and a background thread applies
+    them every ``VIEW_COUNT_FLUSH_INTERVAL`` seconds as batched
+    ``UPDATE ... SET views = views + n`` statements, one per distinct ``n``,
+    along with the storage tiering window (videos.tiering).
+    Whatever is still pending is flushed when the process exits. An interval
+    of 0 or less disables buffering and writes every hit through.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._exit_hook = False
+
+    @property
+    def interval(self):
+        return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 5)
+
+    def increment(self, video_id, count=1):
+        """Record ``count`` views of a video"""
+        if self.interval <= 0:
+            with transaction.atomic():
+                Video.objects.filter(id=video_id).update(
+                    views=F('views') + count, card_version=F('card_version') + 1
+                )
+                record_access({video_id: count})
+            return
+        with self._lock:
+            self._pending[video_id] += count
+        self._ensure_flusher()
+
+    def pending(self, video_id):
+        """Views recorded for a video but not yet written"""
+        with self._lock:
+            return self._pending[video_id]
+
+    def flush(self):
+        """Write all pending views and return the number of videos updated"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+
+        ids_by_count = defaultdict(list)
+        for video_id, count in pending.items():
+            ids_by_count[count].append(video_id)
+
+        try:
+            with transaction.atomic():
+                for count, ids in ids_by_count.items():
+                    for start in range(0, len(ids), FLUSH_BATCH_SIZE):
+                        Video.objects.filter(
+                            id__in=ids[start:start + FLUSH_BATCH_SIZE]
+                        ).update(views=F('views') + count, card_version=F('card_version') + 1)
+                record_access(pending)
+        except DatabaseError as e:
+            logger.error(f"Error flushing view counts: {str(e)}")
+            with self._lock:
+                self._pending.update(pending)
+            return 0
+        return len(pending)
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is left"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _ensure_flusher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='view-count-flusher', daemon=True
+            )
+            self._thread.start()
+            if not self._exit_hook:
+                # Once: a restarted flusher must not flush again at exit
+                atexit.register(self.stop)
+                self._exit_hook = True
+
+    def _run(self):
+        while not self._stopped.wait(max(self.interval, 1)):
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+view_buffer = ViewCountBuffer()
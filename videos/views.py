@@ -1,43 +1,63 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q, Avg
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.core.paginator import Paginator
-from django.views.decorators.http import require_POST
-from .models import Video, Comment, VideoRating
+from django.db.models.fields.files import FieldFile
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_http_methods, require_POST
+from .models import Video, RelatedVideo
 from .forms import VideoUploadForm, CommentForm, VideoSearchForm
-import os
+from .cards import CARD_KEY_FIELDS, card_key, get_cards
+from .conditional import make_etag, not_modified, with_etag
+from .hls import cached_playlist, init_for, segment_file, segment_for
+from .ratings import apply_rating
+from .search import search_videos
+from .streaming import RangeFile, serve_file
+from .view_counter import view_buffer
+from .pagination import CURSOR_ORDERING, InvalidCursor, cursor_paginate, encode_cursor
 
 def dashboard(request):
     """Main dashboard showing latest videos"""
     search_form = VideoSearchForm(request.GET)
-    videos = Video.objects.filter(is_active=True)
+    videos = Video.objects.filter(is_active=True).order_by(*CURSOR_ORDERING)
     
-    # Search functionality
+    # Search functionality; matches come back ranked by relevance
     if search_form.is_valid():
         query = search_form.cleaned_data.get('query')
         genre = search_form.cleaned_data.get('genre')
         
         if query:
-            videos = videos.filter(
-                Q(title__icontains=query) | 
-                Q(description__icontains=query) |
-                Q(creator__username__icontains=query)
-            )
+            videos = search_videos(videos, query)
         
         if genre:
             videos = videos.filter(genre=genre)
     
-    # Pagination
-    paginator = Paginator(videos, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination: keyset seek when a cursor is given, numbered pages otherwise
+    cursor = request.GET.get('cursor')
+    if cursor is not None:
+        try:
+            page_obj = cursor_paginate(videos, cursor, 12)
+        except InvalidCursor:
+            return HttpResponseBadRequest('Invalid cursor')
+        total_videos = None
+        next_cursor = page_obj.next_cursor
+    else:
+        paginator = Paginator(videos, 12)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+        total_videos = paginator.count
+        # Next leads into cursor mode, except on relevance-ranked results
+        # whose order a cursor cannot follow
+        last = page_obj[-1] if page_obj.has_next() and not search_form.cleaned_data.get('query') else None
+        next_cursor = encode_cursor(last.created_at, last.id) if last else None
     
     context = {
         'videos': page_obj,
         'search_form': search_form,
-        'total_videos': videos.count()
+        'total_videos': total_videos,
+        'next_cursor': next_cursor
     }
     return render(request, 'dashboard.html', context)
 
@@ -45,9 +65,9 @@ def video_detail(request, video_id):
     """Detailed view of a single video"""
     video = get_object_or_404(Video, id=video_id, is_active=True)
     
-    # Increment view count
+    # Count the view; the buffer writes it back in batches
+    view_buffer.increment(video.id)
     video.views += 1
-    video.save(update_fields=['views'])
     
     # Get comments
     comments = video.comments.filter(is_active=True)[:10]
@@ -64,15 +84,21 @@ def video_detail(request, video_id):
             messages.success(request, 'Comment added successfully!')
             return redirect('videos:video_detail', video_id=video.id)
     
-    # Get average rating
-    avg_rating = video.ratings.aggregate(Avg('rating'))['rating__avg'] or 0
+    avg_rating = video.average_rating
     user_rating = None
     if request.user.is_authenticated:
         user_rating = video.ratings.filter(user=request.user).first()
     
+    related_videos = [
+        link.related for link in RelatedVideo.objects.filter(
+            video=video, related__is_active=True
+        ).select_related('related__creator')
+    ]
+    
     context = {
         'video': video,
         'comments': comments,
+        'related_videos': related_videos,
         'comment_form': comment_form,
         'avg_rating': round(avg_rating, 1),
         'user_rating': user_rating,
@@ -87,33 +113,17 @@ def creator_upload(request):
         return redirect('videos:dashboard')
     
     if request.method == 'POST':
-        form = VideoUploadForm(request.POST, request.FILES)
+        # Size, extension and container are validated by the form, and
+        # while the body arrives by videos.upload_handlers.VideoUploadHandler
+        form = VideoUploadForm(
+            request.POST, request.FILES, upload_error=getattr(request, 'upload_error', None)
+        )
         if form.is_valid():
             video = form.save(commit=False)
             video.creator = request.user
             
-            # Enhanced file validation
             uploaded_file = request.FILES.get('video_file')
             if uploaded_file:
-                # Check file size (max 100MB)
-                if uploaded_file.size > 100 * 1024 * 1024:
-                    messages.error(request, 'File size must be less than 100MB.')
-                    return render(request, 'creator_upload.html', {'form': form})
-                
-                # Check file type
-                allowed_types = ['video/mp4', 'video/avi', 'video/quicktime', 'video/x-msvideo']
-                if uploaded_file.content_type not in allowed_types:
-                    messages.error(request, 'Please upload a valid video file (MP4, AVI, MOV, WMV).')
-                    return render(request, 'creator_upload.html', {'form': form})
-                
-                # Check file extension as backup
-                import os
-                file_ext = os.path.splitext(uploaded_file.name)[1].lower()
-                allowed_extensions = ['.mp4', '.avi', '.mov', '.wmv']
-                if file_ext not in allowed_extensions:
-                    messages.error(request, 'Please upload a valid video file with extension: MP4, AVI, MOV, WMV.')
-                    return render(request, 'creator_upload.html', {'form': form})
-                
                 video.file_size = uploaded_file.size
             
             # Auto-generate some metadata
@@ -150,18 +160,13 @@ def rate_video(request, video_id):
     rating_value = int(request.POST.get('rating', 0))
     
     if 1 <= rating_value <= 5:
-        rating, created = VideoRating.objects.update_or_create(
-            video=video,
-            user=request.user,
-            defaults={'rating': rating_value}
-        )
-        
-        # Calculate new average
-        avg_rating = video.ratings.aggregate(Avg('rating'))['rating__avg'] or 0
+        apply_rating(video, request.user, rating_value)
         
         return JsonResponse({
             'success': True,
-            'average_rating': round(avg_rating, 1),
+            'average_rating': round(video.average_rating, 1),
+            'total_ratings': video.ratings_count,
+            'rating_distribution': video.rating_distribution,
             'user_rating': rating_value
         })
     
@@ -181,23 +186,128 @@ def my_videos(request):
     
     return render(request, 'my_videos.html', {'videos': page_obj})
 
+@require_http_methods(['GET', 'HEAD'])
+def stream_video(request, video_id):
+    """Serve an uploaded video file with Range support so players can seek"""
+    video = get_object_or_404(Video, id=video_id, is_active=True)
+    if not video.video_file:
+        raise Http404('Video has no uploaded file')
+    try:
+        response = serve_file(request, video.video_file)
+    except FileNotFoundError:
+        raise Http404('Video file is missing')
+    return _versioned(request, video, response)
+
+def _versioned(request, video, response):
+    """Mark a response immutable when its URL names the file's content, as playlist URLs do"""
+    version = request.GET.get('v')
+    if video.content_hash and version == video.content_hash[:16]:
+        # Content-versioned URL from a playlist: the bytes can never change
+        patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+    return response
+
+@require_http_methods(['GET', 'HEAD'])
+def video_playlist(request, video_id):
+    """
+    HLS playlist of fragmented MP4 segments cut from the video file, see
+    videos.hls.cached_playlist
+    """
+    video = get_object_or_404(Video, id=video_id, is_active=True)
+    if not video.video_file:
+        raise Http404('Video has no uploaded file')
+    version = video.content_hash or video.video_file.name
+    etag = make_etag('hls', version)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    
+    try:
+        playlist = cached_playlist(video)
+    except FileNotFoundError:
+        raise Http404('Video file is missing')
+    if playlist is None:
+        raise Http404('Video cannot be segmented')
+    return with_etag(HttpResponse(playlist, content_type='application/vnd.apple.mpegurl'), etag)
+
+def _hls_video(video_id):
+    video = get_object_or_404(Video, id=video_id, is_active=True)
+    if not video.video_file:
+        raise Http404('Video has no uploaded file')
+    return video
+
+@require_http_methods(['GET', 'HEAD'])
+def video_hls_init(request, video_id):
+    """Initialization segment (ftyp and moov) of a video's HLS playlist"""
+    video = _hls_video(video_id)
+    etag = make_etag('hls-init', video.content_hash or video.video_file.name)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    
+    try:
+        init = init_for(video)
+    except FileNotFoundError:
+        raise Http404('Video file is missing')
+    if init is None:
+        raise Http404('Video cannot be segmented')
+    response = HttpResponse(init, content_type='video/mp4')
+    response['ETag'] = etag
+    return _versioned(request, video, response)
+
+@require_http_methods(['GET', 'HEAD'])
+def video_hls_segment(request, video_id, duration, index):
+    """
+    One media segment (moof and mdat) of a video's HLS playlist; the
+    samples are streamed from the stored file, or the segment is written
+    out once and handed to the front-end server when MEDIA_DELIVERY says so
+    """
+    if duration != settings.HLS_SEGMENT_DURATION:
+        # Playlist from before HLS_SEGMENT_DURATION changed
+        raise Http404('No such segment')
+    video = _hls_video(video_id)
+    etag = make_etag('hls-segment', video.content_hash or video.video_file.name, duration, index)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    
+    if getattr(settings, 'MEDIA_DELIVERY', 'django') != 'django' and video.content_hash:
+        try:
+            name = segment_file(video, index)
+        except FileNotFoundError:
+            raise Http404('Video file is missing')
+        except NotImplementedError:
+            # Remote storage: nothing the front-end server could send
+            pass
+        else:
+            if name is None:
+                raise Http404('No such segment')
+            stored = FieldFile(video, Video._meta.get_field('video_file'), name)
+            return _versioned(request, video, serve_file(request, stored))
+    
+    try:
+        segment = segment_for(video, index)
+    except FileNotFoundError:
+        raise Http404('Video file is missing')
+    if segment is None:
+        raise Http404('No such segment')
+    header, runs, length = segment
+    block_size = getattr(settings, 'MEDIA_STREAM_BLOCK_SIZE', 64 * 1024)
+    
+    def content():
+        yield header
+        with video.video_file.storage.open(video.video_file.name, 'rb') as f:
+            for offset, size in runs:
+                run = RangeFile(f, offset, size)
+                for block in iter(lambda: run.read(block_size), b''):
+                    yield block
+    
+    response = StreamingHttpResponse(content(), content_type='video/mp4')
+    response['Content-Length'] = length
+    response['ETag'] = etag
+    return _versioned(request, video, response)
+
 def api_videos(request):
     """REST API endpoint for videos"""
-    videos = Video.objects.filter(is_active=True)[:20]
-    data = []
-    
-    for video in videos:
-        data.append({
-            'id': video.id,
-            'title': video.title,
-            'description': video.description,
-            'creator': video.creator.username,
-            'genre': video.genre,
-            'age_rating': video.age_rating,
-            'views': video.views,
-            'likes': video.likes,
-            'created_at': video.created_at.isoformat(),
-            'video_url': video.video_url
-        })
-    
-    return JsonResponse({'videos': data})
+    videos = list(Video.objects.filter(is_active=True).only(*CARD_KEY_FIELDS)[:20])
+    etag = make_etag([card_key(video) for video in videos])
+    return not_modified(request, etag) or with_etag(JsonResponse({'videos': get_cards(videos)}), etag)